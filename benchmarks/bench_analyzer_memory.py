@@ -0,0 +1,119 @@
+import io
+import os
+import sys
+import time
+import sqlite3
+import resource
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+
+# ===================================================================
+# BENCHMARK: bộ nhớ của Luật 1 trên khoảng dài - đọc 1 lần vs đọc theo khối
+# ===================================================================
+# Chạy: python benchmarks/bench_analyzer_memory.py [số bản ghi, mặc định 10_000_000] [ANALYSIS_CHUNK_ROWS]
+# Dữ liệu: 1 channel, 1 mẫu / 15s (10M bản ghi ~ 4,7 năm), tạo 1 lần trong thư mục tạm rồi dùng lại.
+# Mỗi cách chạy trong 1 process riêng để đo đỉnh RSS (ru_maxrss) độc lập.
+# Cũ: đọc cả khoảng vào 1 DataFrame. Mới: analyze_waste (khối ANALYSIS_CHUNK_ROWS dòng / phân vùng ngày).
+
+CHANNEL_ID = "BENCH"
+START = datetime(2020, 1, 1)
+STEP_S = 15
+
+def _db_path(n):
+    return os.path.join(tempfile.gettempdir(), f"bench_analyzer_{n}.db")
+
+def build_db(n, db_path, batch=500_000, seed=0):
+    """Tạo fact_measurement n bản ghi (chuỗi state=1 / presence=0 dài ngắn ngẫu nhiên)."""
+    from database.create import create_database_schema
+
+    config.DB_FILE = db_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_database_schema()
+    rng = np.random.default_rng(seed)
+    t0 = int(START.timestamp())
+    local_tz = datetime.now().astimezone().tzinfo
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous = OFF")
+    for lo in range(0, n, batch):
+        m = min(batch, n - lo)
+        ts = t0 + STEP_S * np.arange(lo, lo + m, dtype=np.int64)
+        bad = np.repeat(rng.random(m // 100 + 1) < 0.5, 100)[:m]
+        state = np.where(bad, 1, rng.integers(0, 2, m))
+        presence = np.where(bad, 0, rng.integers(0, 2, m))
+        created = pd.to_datetime(ts, unit="s")
+        created_at = created.strftime("%Y-%m-%d %H:%M:%S")
+        local_day = created.tz_localize("UTC").tz_convert(local_tz).strftime("%Y-%m-%d")
+        conn.executemany(
+            "INSERT INTO fact_measurement (channel_id, created_at, entry_id, state, presence, created_ts, local_day) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip([CHANNEL_ID] * m, created_at, range(lo + 1, lo + m + 1), state.tolist(), presence.tolist(),
+                ts.tolist(), local_day),
+        )
+        conn.commit()
+        print(f"   ⏳ Đã tạo {lo + m:,}/{n:,} bản ghi")
+    conn.close()
+
+def run_mode(mode, n, chunk_rows):
+    """Chạy 1 cách đọc trong process hiện tại, in thời gian + đỉnh RSS."""
+    config.DB_FILE = _db_path(n)
+    config.ANALYSIS_CHUNK_ROWS = chunk_rows
+    config.ANALYSIS_WORKERS = 1
+    from src.analyzer import STREAK_TARGET, analyze_waste
+    from src.segmentation import find_streak_windows
+
+    end = START + timedelta(seconds=STEP_S * n + 1)
+    t0 = time.perf_counter()
+    if mode == "whole":
+        conn = sqlite3.connect(config.DB_FILE)
+        df = pd.read_sql_query(
+            "SELECT created_at, state, presence FROM fact_measurement "
+            "WHERE channel_id = ? AND created_ts >= ? AND created_ts < ? ORDER BY created_ts",
+            conn, params=(CHANNEL_ID, int(START.timestamp()), int(end.timestamp())),
+        )
+        conn.close()
+        mask = ((df["state"] == 1) & (df["presence"] == 0)).to_numpy()
+        windows = len(find_streak_windows(mask, STREAK_TARGET)[0])
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            windows = len(analyze_waste(START, end, [CHANNEL_ID]))
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode} {windows} {elapsed:.2f} {peak_mb:.0f}")
+
+def main(n, chunk_rows):
+    db_path = _db_path(n)
+    if not os.path.exists(db_path):
+        print(f"[Bench] Tạo DB {n:,} bản ghi: {db_path}")
+        build_db(n, db_path)
+    print(f"[Bench] Luật 1 trên {n:,} bản ghi, ANALYSIS_CHUNK_ROWS={chunk_rows:,}")
+
+    results = {}
+    for mode in ("whole", "chunked"):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, str(n), str(chunk_rows)],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        results[mode] = (int(out[1]), float(out[2]), float(out[3]))
+
+    assert results["whole"][0] == results["chunked"][0], "Số cửa sổ khác nhau!"
+    for mode, label in (("whole", "Đọc 1 lần (cũ):  "), ("chunked", "Đọc theo khối:   ")):
+        windows, elapsed, peak_mb = results[mode]
+        print(f"   {label} {elapsed:7.1f} s  đỉnh RSS {peak_mb:7.0f} MB  ({windows} cửa sổ)")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--mode":
+        run_mode(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000,
+             int(sys.argv[2]) if len(sys.argv) > 2 else config.ANALYSIS_CHUNK_ROWS)
@@ -0,0 +1,116 @@
+import io
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from database.create import create_database_schema
+from database.connection import close_all
+from src.utils import load_dataframe_to_dwh
+
+# ===================================================================
+# BENCHMARK: nạp lịch sử lớn - đường nạp thường vs bulk=True (bản ghi / giây)
+# ===================================================================
+# Chạy: python benchmarks/bench_bulk_load.py [số bản ghi ...] (mặc định 200000 1000000)
+# Mỗi lần nạp vào 1 DB mới trong thư mục tạm, đo từ đầu tới cuối (transform + INSERT + tạo lại index +
+# rollup / phiên + commit + fsync). Đường thường chỉ chạy tới NORMAL_MAX_ROWS bản ghi
+# (chậm); khi chạy cả 2 thì so sánh mọi bảng để chắc bulk cho cùng kết quả.
+# In khoảng cách tới mục tiêu TARGET_ROWS_PER_S của chế độ bulk.
+
+TARGET_ROWS_PER_S = 500_000
+NORMAL_MAX_ROWS = 200_000
+
+_COMPARE = {
+    "fact_measurement": "channel_id, created_at, entry_id, power_w, energy_wh, presence, state, time_s, "
+                        "created_ts, local_day, typeof(presence), typeof(state)",
+    "rollup_hourly": "*",
+    "rollup_daily": "*",
+    "fact_session": "*",
+}
+
+def make_history(n, seed=0):
+    """n mẫu 15s như json_to_df trả về (đèn bật / tắt theo khối 10 phút, vài giá trị thiếu)."""
+    rng = np.random.default_rng(seed)
+    power = np.round(rng.random(n) * 100, 2)
+    power[::997] = np.nan
+    presence = rng.integers(0, 2, n).astype(float)
+    presence[::1511] = np.nan
+    return pd.DataFrame({
+        "created_at": pd.date_range("2024-01-01", periods=n, freq="15s", tz="UTC"),
+        "entry_id": np.arange(1, n + 1),
+        "Power (W)": power,
+        "Energy(Wh)": np.round(np.cumsum(rng.random(n)), 3),
+        "Presence (0/1)": presence,
+        "State (0/1)": np.repeat(rng.integers(0, 2, n // 40 + 1), 40)[:n].astype(float),
+        "Time_s (s)": 15.0 * np.arange(n),
+    })
+
+def _load_into_new_db(df, db_path, bulk):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    close_all()
+    config.DB_FILE = db_path
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        create_database_schema()
+        t0 = time.perf_counter()
+        ok = load_dataframe_to_dwh(df, "101", bulk=bulk)
+        elapsed = time.perf_counter() - t0
+    close_all()
+    assert ok, "Nạp thất bại!"
+    phases = [line.strip() for line in log.getvalue().splitlines() if "Bulk:" in line]
+    return elapsed, phases
+
+def _assert_same_tables(db_a, db_b):
+    conn = sqlite3.connect(db_a)
+    try:
+        conn.execute("ATTACH ? AS b", (db_b,))
+        for table, cols in _COMPARE.items():
+            for x, y in (("main", "b"), ("b", "main")):
+                diff = conn.execute(f"SELECT {cols} FROM {x}.{table} EXCEPT SELECT {cols} FROM {y}.{table}").fetchall()
+                assert not diff, f"Bảng {table} khác đường nạp thường ({len(diff)} dòng)!"
+    finally:
+        conn.close()
+
+def main(sizes):
+    tmp = tempfile.mkdtemp(prefix="bench_bulk_")
+    try:
+        _run_sizes(sizes, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def _run_sizes(sizes, tmp):
+    for n in sizes:
+        df = make_history(n)
+        print(f"[Bench] {n:,} bản ghi")
+
+        bulk_db = os.path.join(tmp, f"bulk_{n}.db")
+        t_bulk, phases = _load_into_new_db(df, bulk_db, bulk=True)
+        if n <= NORMAL_MAX_ROWS:
+            normal_db = os.path.join(tmp, f"normal_{n}.db")
+            t_normal, _ = _load_into_new_db(df, normal_db, bulk=False)
+            _assert_same_tables(normal_db, bulk_db)
+            print(f"   Đường thường: {t_normal:7.2f} s  {n / t_normal:10,.0f} bản ghi/s")
+
+        rate = n / t_bulk
+        print(f"   bulk=True:    {t_bulk:7.2f} s  {rate:10,.0f} bản ghi/s"
+              + (f"  (x{t_normal / t_bulk:.1f}, cùng kết quả)" if n <= NORMAL_MAX_ROWS else ""))
+        for line in phases:
+            print(f"      {line}")
+        print(f"   Mục tiêu {TARGET_ROWS_PER_S:,} bản ghi/s: đạt {rate / TARGET_ROWS_PER_S * 100:.0f}%"
+              f" (còn thiếu {max(0.0, TARGET_ROWS_PER_S - rate):,.0f} bản ghi/s)")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [200_000, 1_000_000])
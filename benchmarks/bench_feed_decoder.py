@@ -0,0 +1,76 @@
+import gc
+import os
+import sys
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from src.feed_decoder import decode_feeds
+from src.utils import columns_to_df, json_to_df
+from tests.stub_server import CHANNEL_FIELDS, make_feeds
+
+# ===================================================================
+# BENCHMARK: giải mã feeds.json - json.loads + json_to_df vs decode_feeds
+# ===================================================================
+# Chạy: python benchmarks/bench_feed_decoder.py [số feed, mặc định 100_000]
+# Phản hồi được dựng sẵn trong bộ nhớ và cắt thành khối 64 KB như iter_content,
+# nên chỉ đo phần giải mã (không tính mạng). Đo thời gian tốt nhất / 3 lần và
+# bộ nhớ đỉnh (tracemalloc, tính cả phản hồi cũ được giữ trọn trong bộ nhớ).
+
+CHUNK_SIZE = 1 << 16
+
+def make_body(n):
+    feeds = make_feeds(n)
+    for i in range(0, n, 97):
+        feeds[i]["field1"] = None
+    channel = {"id": 1, "created_at": "2025-01-01T00:00:00Z", **CHANNEL_FIELDS}
+    return json.dumps({"channel": channel, "feeds": feeds}).encode()
+
+def _chunks(body):
+    return (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+
+def _old(body):
+    return json_to_df(json.loads(b"".join(_chunks(body))), config.FIELDS)
+
+def _new(body):
+    return columns_to_df(*decode_feeds(_chunks(body), config.FIELDS))
+
+def _measure(fn, body, reps=3):
+    best = float("inf")
+    for _ in range(reps):
+        gc.collect()
+        t0 = time.perf_counter()
+        df = fn(body)
+        best = min(best, time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    fn(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return df, best, peak
+
+def main(n):
+    body = make_body(n)
+    print(f"[Bench] {n:,} feed, phản hồi {len(body) / 1e6:.1f} MB, khối {CHUNK_SIZE // 1024} KB")
+
+    old, t_old, peak_old = _measure(_old, body)
+    new, t_new, peak_new = _measure(_new, body)
+
+    pd.testing.assert_frame_equal(
+        new.assign(created_at=new["created_at"].astype("datetime64[s, UTC]")),
+        old.assign(created_at=old["created_at"].astype("datetime64[s, UTC]")),
+        check_dtype=False,
+    )
+    print(f"   json.loads + json_to_df (cũ): {t_old * 1000:8.1f} ms  {n / t_old:12,.0f} feed/s  đỉnh {peak_old / 1e6:6.1f} MB")
+    print(f"   decode_feeds (mới):           {t_new * 1000:8.1f} ms  {n / t_new:12,.0f} feed/s  đỉnh {peak_new / 1e6:6.1f} MB"
+          f"  (x{t_old / t_new:.1f})")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,74 @@
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from database.create import create_database_schema
+from database.connection import close_all
+from src.utils import load_dataframe_to_dwh
+from src.rule_engine import run_incremental_analyses
+
+# ===================================================================
+# BENCHMARK: 1 chu kỳ rule engine tăng dần khi lịch sử của channel lớn dần
+# ===================================================================
+# Chạy: python benchmarks/bench_rule_engine.py [số bản ghi lịch sử ...] (mặc định 10000 100000 1000000)
+# Mỗi kích thước: nạp lịch sử (bulk) + chạy rule engine 1 lần, rồi đo CYCLES chu kỳ
+# "nạp NEW_ROWS bản ghi mới -> run_incremental_analyses". Thời gian 1 chu kỳ phải
+# gần như không đổi theo độ dài lịch sử (chỉ phụ thuộc lượng bản ghi mới).
+
+NEW_ROWS = 20
+CYCLES = 20
+
+def make_feed(n, first_entry=1, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "created_at": pd.Timestamp("2020-01-01", tz="UTC")
+                      + pd.to_timedelta(15 * np.arange(first_entry - 1, first_entry - 1 + n), unit="s"),
+        "entry_id": np.arange(first_entry, first_entry + n),
+        "Energy(Wh)": np.round(np.cumsum(rng.random(n)) % 250, 3),
+        "Presence (0/1)": rng.integers(0, 2, n).astype(float),
+        "State (0/1)": np.repeat(rng.integers(0, 2, n // 300 + 1), 300)[:n].astype(float),
+    })
+
+def _quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+def measure(n, tmp):
+    close_all()
+    config.DB_FILE = os.path.join(tmp, f"rules_{n}.db")
+    _quiet(create_database_schema)
+    _quiet(load_dataframe_to_dwh, make_feed(n), "101", bulk=True)
+    _quiet(run_incremental_analyses)
+
+    times = []
+    for i in range(CYCLES):
+        _quiet(load_dataframe_to_dwh, make_feed(NEW_ROWS, first_entry=n + 1 + i * NEW_ROWS, seed=i + 1), "101")
+        t0 = time.perf_counter()
+        _quiet(run_incremental_analyses)
+        times.append(time.perf_counter() - t0)
+    close_all()
+    return float(np.median(times))
+
+def main(sizes):
+    tmp = tempfile.mkdtemp(prefix="bench_rules_")
+    try:
+        print(f"[Bench] Rule engine: {NEW_ROWS} bản ghi mới / chu kỳ, trung vị {CYCLES} chu kỳ")
+        for n in sizes:
+            print(f"   Lịch sử {n:>10,} bản ghi: {measure(n, tmp) * 1000:7.1f} ms / chu kỳ")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from src.segmentation import segment_sessions
+from tests.legacy import session_max_loop
+
+# ===================================================================
+# BENCHMARK: tách phiên state=1 (Luật 3) - vòng lặp cũ vs segment_sessions
+# ===================================================================
+# Chạy: python benchmarks/bench_sessions.py [số ngày, mặc định 7]
+# Dữ liệu: 1 mẫu / 15s, đèn bật/tắt theo khối ~10 phút, 5% energy_wh bị thiếu.
+
+def make_week(days, seed=0):
+    rng = np.random.default_rng(seed)
+    n = days * 24 * 3600 // 15
+    state = np.repeat(rng.choice([0, 1], n // 40 + 1), 40)[:n]
+    energy = np.where(rng.random(n) < 0.05, np.nan, np.cumsum(rng.random(n)) % 250)
+    return pd.DataFrame({
+        "created_at": pd.date_range("2025-01-01", periods=n, freq="15s"),
+        "state": state,
+        "energy_wh": energy,
+    })
+
+def _vectorized(df):
+    start_idx, end_idx, max_values, last_is_open = segment_sessions(
+        (df["state"] == 1).to_numpy(), df["energy_wh"].to_numpy()
+    )
+    created_at = df["created_at"]
+    is_open = [last_is_open and i == len(start_idx) - 1 for i in range(len(start_idx))]
+    return list(zip(created_at.iloc[start_idx], created_at.iloc[end_idx], max_values.tolist(), is_open))
+
+def main(days):
+    df = make_week(days)
+    print(f"[Bench] {days} ngày x 15s = {len(df):,} bản ghi")
+
+    t0 = time.perf_counter()
+    old = session_max_loop(df)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    new = _vectorized(df)
+    t_new = time.perf_counter() - t0
+
+    assert new == old, "Kết quả khác vòng lặp cũ!"
+    print(f"   Vòng lặp cũ (itertuples): {t_old * 1000:8.1f} ms")
+    print(f"   segment_sessions:         {t_new * 1000:8.1f} ms  (x{t_old / t_new:.0f}, {len(new)} phiên giống hệt)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 7)
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from src.analyzer import STREAK_TARGET
+from src.segmentation import find_streak_windows
+from tests.legacy import streak_windows_loop
+
+# ===================================================================
+# BENCHMARK: tìm chuỗi lãng phí (Luật 1) - vòng lặp cũ vs find_streak_windows
+# ===================================================================
+# Chạy: python benchmarks/bench_streaks.py [số bản ghi, mặc định 1_000_000]
+
+def make_data(n, seed=0):
+    """n mẫu 15s: đèn gần như luôn bật, hiếm khi có người -> nhiều cửa sổ STREAK_TARGET."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "created_at": pd.date_range("2025-01-01", periods=n, freq="15s"),
+        "state": rng.choice([0, 1], n, p=[0.01, 0.99]),
+        "presence": rng.choice([0, 1], n, p=[0.99, 0.01]),
+    })
+
+def main(n):
+    df = make_data(n)
+    print(f"[Bench] {n:,} bản ghi, STREAK_TARGET={STREAK_TARGET}")
+
+    t0 = time.perf_counter()
+    old = streak_windows_loop(df, STREAK_TARGET)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    mask = ((df["state"] == 1) & (df["presence"] == 0)).to_numpy()
+    start_idx, end_idx = find_streak_windows(mask, STREAK_TARGET)
+    new = list(zip(df["created_at"].iloc[start_idx], df["created_at"].iloc[end_idx]))
+    t_new = time.perf_counter() - t0
+
+    assert new == old, "Kết quả khác vòng lặp cũ!"
+    print(f"   Vòng lặp cũ (itertuples): {t_old * 1000:9.1f} ms")
+    print(f"   find_streak_windows:      {t_new * 1000:9.1f} ms  (x{t_old / t_new:.0f}, {len(new)} cửa sổ giống hệt)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
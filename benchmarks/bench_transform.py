@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from src.utils import CSV_TO_DB_MAP, prepare_records
+from tests.legacy import records_iterrows
+
+# ===================================================================
+# BENCHMARK: bước Transform của load_dataframe_to_dwh (bản ghi / giây)
+# ===================================================================
+# Chạy: python benchmarks/bench_transform.py [số bản ghi ...] (mặc định 8000 100000)
+# Cũ: iterrows() + strftime + to_int_or_none / to_float_or_none từng dòng.
+# Mới: prepare_records (ép kiểu / định dạng theo cột).
+
+def make_feed(n, seed=0):
+    """DataFrame như json_to_df trả về (1 lần tải = config.RESULTS = 8000 bản ghi)."""
+    rng = np.random.default_rng(seed)
+    power = np.round(rng.random(n) * 100, 2)
+    power[::97] = np.nan
+    return pd.DataFrame({
+        "created_at": pd.date_range("2025-01-01", periods=n, freq="15s", tz="UTC"),
+        "entry_id": np.arange(1, n + 1),
+        "Power (W)": power,
+        "Energy(Wh)": np.round(np.cumsum(rng.random(n)), 3),
+        "Presence (0/1)": rng.integers(0, 2, n).astype(float),
+        "State (0/1)": rng.integers(0, 2, n).astype(float),
+        "Time_s (s)": 15.0 * np.arange(n),
+    })
+
+def _old_path(df):
+    df_renamed = df.rename(columns=CSV_TO_DB_MAP)
+    return records_iterrows(df_renamed[[c for c in df_renamed.columns if c in CSV_TO_DB_MAP.values()]])
+
+def main(sizes):
+    for n in sizes:
+        df = make_feed(n)
+
+        t0 = time.perf_counter()
+        old = _old_path(df)
+        t_old = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        new = prepare_records(df, "101")
+        t_new = time.perf_counter() - t0
+
+        assert [row[1:8] for row in new] == old, "Kết quả khác transform cũ!"
+        print(f"[Bench] {n:,} bản ghi")
+        print(f"   iterrows (cũ):          {t_old * 1000:9.1f} ms  {n / t_old:12,.0f} bản ghi/s")
+        print(f"   prepare_records (mới):  {t_new * 1000:9.1f} ms  {n / t_new:12,.0f} bản ghi/s  (x{t_old / t_new:.0f})")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [8000, 100_000])
@@ -17,18 +17,64 @@ ARFF_FILE = os.path.join(DATA_DIR, "thingspeak_data.arff")
 
 # File SQLite database
 DB_FILE = os.path.join(DB_DIR, "smarthome_dw.db")
+DB_BUSY_TIMEOUT_S = 30    # giây chờ khi DB đang bị khóa (thay vì lỗi "database is locked")
+DB_CACHE_KB = 20000       # page cache mỗi kết nối (KB)
+BULK_CACHE_KB = 262144    # page cache của luồng ghi khi nạp hàng loạt (load_dataframe_to_dwh(bulk=True))
+DB_READ_POOL_SIZE = 4     # số kết nối đọc dùng chung (GUI, analyzer, ETL)
+QUERY_CACHE_SIZE = 128    # số kết quả truy vấn (dashboard / phân tích) giữ trong cache LRU
 
 # Các cấu hình khác
 THRESHOLD_HIGH = 30   # Ngưỡng xác định "high" consumption
 
 # Cấu hình cho ThingSpeak
 CHANNEL_IDS = ["3152988"]
-READ_API_KEYS = ["W0CSOTQCFZYNN83D"]
+READ_API_KEYS = ["W0CSOTQCFZYNN83D"]   # cùng thứ tự với CHANNEL_IDS
+ETL_WORKERS = 8     # số luồng tải (trang / cửa sổ) song song trong 1 chu trình ETL
+PIPELINE_QUEUE_SIZE = 8   # số trang tối đa chờ giữa 2 tầng của pipeline ETL (backpressure)
+
+# Chạy tự động (src/scheduler.py): mỗi channel có chu kỳ riêng, thích ứng theo dữ liệu
+SCHEDULER_MIN_INTERVAL_S = 15     # có dữ liệu mới -> hỏi lại sau 15s (bằng chu kỳ gửi của thiết bị)
+SCHEDULER_MAX_INTERVAL_S = 900    # chu kỳ dài nhất khi channel không hoạt động / lỗi liên tục
+SCHEDULER_IDLE_BACKOFF = 2        # không có dữ liệu mới -> nhân chu kỳ
+SCHEDULER_ERROR_BACKOFF = 4       # lỗi / bị giới hạn tần suất (429) -> nhân chu kỳ
+
+THINGSPEAK_URL = "https://api.thingspeak.com"
+
+# HTTP client dùng chung (keep-alive + retry/backoff)
+HTTP_POOL_SIZE = 16       # số kết nối tối đa được giữ trong pool
+HTTP_MAX_RETRIES = 5      # số lần thử lại khi lỗi mạng / 429 / 5xx
+HTTP_BACKOFF_BASE = 0.5   # giây, nhân đôi sau mỗi lần thử lại (có jitter)
+HTTP_BACKOFF_MAX = 30     # giây, thời gian chờ tối đa giữa 2 lần thử
+HTTP_TIMEOUT = 30         # giây
 
 FIELDS = []         # nếu để [] thì sẽ tự detect
 RESULTS = 8000      # số bản ghi tối đa lấy về
+
+# Backfill lịch sử: độ dài mỗi cửa sổ (giờ) và số luồng tải song song
+BACKFILL_WINDOW_HOURS = 24
+BACKFILL_WORKERS = 4
+
+# Server nhận dữ liệu đẩy (tương thích ThingSpeak /update) - src/ingest_server.py
+INGEST_HOST = "127.0.0.1"
+INGEST_PORT = 8088
+# WRITE API KEY của thiết bị -> channel_id trong DWH.
+# Mỗi channel nên chỉ nhận dữ liệu từ 1 nguồn (đẩy vào đây HOẶC kéo từ ThingSpeak)
+# vì entry_id của 2 nguồn được đánh số độc lập.
+# vd: INGEST_WRITE_KEYS = {"<WRITE_API_KEY>": "<channel_id>"} (channel KHÔNG nằm trong CHANNEL_IDS)
+INGEST_WRITE_KEYS = {}
+INGEST_BATCH_SIZE = 1000         # nạp khi gom đủ số bản ghi này...
+INGEST_FLUSH_INTERVAL_S = 1.0    # ...hoặc sau chừng này giây
+INGEST_QUEUE_MAX = 20000         # hàng đợi đầy -> trả 503 + Retry-After (backpressure)
 CLASS_FIELD = None  # e.g. "field3" nếu muốn làm class label
 
+# Khoảng cách tối đa (giây) giữa 2 mẫu liên tiếp được tính là "liên tục"
+# khi cộng thời gian bật / lãng phí (thiết bị gửi mỗi 15s)
+MAX_SAMPLE_GAP_S = 60
+
+# Phân tích theo khoảng ngày: số process xử lý song song các phân vùng (channel, ngày)
+ANALYSIS_WORKERS = 4
+ANALYSIS_CHUNK_ROWS = 100_000   # số dòng đọc mỗi khối (giới hạn bộ nhớ khi phân tích khoảng dài)
+
 if __name__ == "__main__":
     # In ra để kiểm tra
     print("📂 BASE_DIR =", BASE_DIR)
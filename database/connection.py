@@ -0,0 +1,187 @@
+import os
+import sys
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+
+# ===================================================================
+# QUẢN LÝ KẾT NỐI SQLITE
+# ===================================================================
+# - WAL: người đọc không bị chặn khi đang nạp dữ liệu (và ngược lại).
+# - 1 luồng ghi duy nhất (DatabaseWriter) nhận mọi thao tác ghi qua hàng đợi.
+# - Người đọc (GUI, analyzer, ETL) mượn kết nối từ ReadPool.
+
+def connect(db_path=None, readonly=False, **kwargs):
+    """Mở kết nối với các PRAGMA chuẩn của dự án."""
+    conn = sqlite3.connect(db_path or config.DB_FILE, timeout=config.DB_BUSY_TIMEOUT_S, **kwargs)
+    conn.execute(f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT_S * 1000)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA cache_size = -{config.DB_CACHE_KB}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+class ReadPool:
+    """Pool kết nối CHỈ ĐỌC, dùng chung giữa các luồng (mỗi lúc 1 luồng / kết nối)."""
+
+    def __init__(self, db_path, size):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            # Kết thúc transaction đọc (nếu có) để không giữ snapshot WAL cũ
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return connect(self.db_path, readonly=True, check_same_thread=False)
+        return self._idle.get()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class DatabaseWriter:
+    """
+    Luồng ghi duy nhất: mọi thao tác ghi được gửi vào hàng đợi và chạy tuần tự
+    trên CÙNG một kết nối, nên không còn tranh chấp khóa giữa các luồng ghi.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._tasks = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Gửi fn(conn, *args, **kwargs) cho luồng ghi; trả về Future."""
+        future = Future()
+        self._tasks.put((fn, args, kwargs, future))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Như submit() nhưng chờ kết quả. Gọi từ chính luồng ghi thì chạy luôn."""
+        if threading.current_thread() is self._thread:
+            return fn(self._conn, *args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def close(self):
+        self._tasks.put(self._STOP)
+        self._thread.join()
+
+    def _loop(self):
+        self._conn = connect(self.db_path)
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is self._STOP:
+                    break
+                fn, args, kwargs, future = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                changes_before = self._conn.total_changes
+                try:
+                    result = fn(self._conn, *args, **kwargs)
+                    if self._conn.total_changes != changes_before:
+                        bump_data_version()
+                    future.set_result(result)
+                except BaseException as e:
+                    if self._conn.in_transaction:
+                        self._conn.rollback()
+                    future.set_exception(e)
+        finally:
+            self._conn.close()
+
+
+_writer = None
+_read_pool = None
+_lock = threading.Lock()
+
+# Thế hệ dữ liệu trong tiến trình: tăng sau mỗi thao tác ghi của luồng ghi
+# (và khi reset DB) -> dùng làm khóa vô hiệu hóa cache kết quả truy vấn.
+_generation = 0
+_generation_lock = threading.Lock()
+
+def bump_data_version():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+def data_version():
+    """
+    Phiên bản dữ liệu hiện tại: (thế hệ trong tiến trình, MAX(id) của fact_measurement).
+    MAX(id) bắt được cả dữ liệu do tiến trình khác ghi vào; truy vấn này chỉ đọc 1 trang index.
+    """
+    with read_connection() as conn:
+        max_id = conn.execute("SELECT MAX(id) FROM fact_measurement").fetchone()[0]
+    return _generation, max_id
+
+def get_writer():
+    """Luồng ghi dùng chung cho config.DB_FILE hiện tại."""
+    global _writer
+    with _lock:
+        if _writer is None or _writer.db_path != config.DB_FILE:
+            if _writer is not None:
+                _writer.close()
+            _writer = DatabaseWriter(config.DB_FILE)
+        return _writer
+
+def get_read_pool():
+    """Pool kết nối đọc dùng chung cho config.DB_FILE hiện tại."""
+    global _read_pool
+    with _lock:
+        if _read_pool is None or _read_pool.db_path != config.DB_FILE:
+            if _read_pool is not None:
+                _read_pool.close()
+            _read_pool = ReadPool(config.DB_FILE, config.DB_READ_POOL_SIZE)
+        return _read_pool
+
+def read_connection():
+    """Context manager: mượn 1 kết nối đọc từ pool, vd: `with read_connection() as conn:`."""
+    return get_read_pool().connection()
+
+def close_all():
+    """Đóng luồng ghi và các kết nối đọc (vd: trước khi xóa file DB)."""
+    global _writer, _read_pool
+    bump_data_version()
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+        if _read_pool is not None:
+            _read_pool.close()
+            _read_pool = None
@@ -8,40 +8,286 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 import config # Import config để lấy DB_FILE
+from database.connection import connect, close_all
 
-def create_database_schema():
+# Phiên bản schema hiện tại (lưu trong PRAGMA user_version của file DB)
+SCHEMA_VERSION = 4
+
+# Index (không duy nhất) cho các truy vấn theo thời gian trên fact_measurement.
+# Nạp hàng loạt (src/utils.py, bulk) xóa và tạo lại đúng các index này.
+FACT_INDEXES = [
+    ("idx_fact_created_ts", "CREATE INDEX IF NOT EXISTS idx_fact_created_ts ON fact_measurement(created_ts);"),
+    ("idx_fact_local_day", "CREATE INDEX IF NOT EXISTS idx_fact_local_day ON fact_measurement(local_day);"),
+    ("idx_fact_channel_ts", "CREATE INDEX IF NOT EXISTS idx_fact_channel_ts ON fact_measurement(channel_id, created_ts);"),
+]
+
+# ===================================================================
+# MIGRATION v1: toàn bộ schema kho dữ liệu
+# ===================================================================
+def _migrate_v1(cur):
     """
-    Hàm chính để tạo cấu trúc kho dữ liệu (đã đơn giản hóa).
+    Tạo schema v1. Nếu DB cũ (chưa có user_version) đã có bảng fact_measurement
+    thì nâng cấp tại chỗ: thêm cột mới, điền giá trị, xóa bản ghi trùng, tạo rollup.
     """
-    db_path = config.DB_FILE
-    
-    # Tạo database SQLite
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
+    legacy = _table_exists(cur, "fact_measurement")
+    if legacy:
+        _upgrade_legacy_fact_measurement(cur)
 
-    cur.execute("DROP TABLE IF EXISTS fact_measurement;")
-    
     cur.execute("""
     CREATE TABLE IF NOT EXISTS fact_measurement (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id TEXT NOT NULL DEFAULT '', -- Channel ThingSpeak nguồn
         created_at TEXT,
         entry_id INT,
         power_w REAL,     -- Tên cũ: Power(W)
         energy_wh REAL,   -- Tên cũ: Energy(Wh) (Lưu ý: Wh không phải kWh)
         presence INT,     -- Tên cũ: Presence (0/1)
         state INT,        -- Tên cũ: State (0/1) (thay cho onoff)
-        time_s REAL       -- Tên cũ: Time_s (s)
+        time_s REAL,      -- Tên cũ: Time_s (s)
+        created_ts INTEGER, -- created_at dạng epoch (giây, UTC) để lọc theo khoảng
+        local_day TEXT      -- Ngày theo giờ địa phương (YYYY-MM-DD), tính lúc nạp
+    )
+    """)
+
+    # Index cho các truy vấn theo thời gian (tránh quét toàn bảng)
+    for _, sql in FACT_INDEXES:
+        cur.execute(sql)
+
+    # Khóa duy nhất (channel, entry_id): nạp lại cùng dữ liệu sẽ không tạo bản ghi trùng
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_channel_entry ON fact_measurement(channel_id, entry_id);")
+
+    # Watermark ETL cho từng channel (cập nhật cùng transaction với lần nạp)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS etl_state (
+        channel_id TEXT PRIMARY KEY,
+        last_entry_id INTEGER,    -- entry_id lớn nhất đã nạp
+        last_created_ts INTEGER,  -- created_ts (epoch UTC) mới nhất đã nạp
+        last_created_at TEXT,     -- created_at tương ứng (để hiển thị)
+        last_run_at TEXT,         -- thời điểm lần nạp gần nhất (giờ địa phương)
+        last_run_rows INTEGER,    -- số bản ghi mới của lần nạp gần nhất
+        total_rows INTEGER        -- tổng số bản ghi đã nạp cho channel
+    )
+    """)
+
+    # Bảng tổng hợp theo giờ / ngày (cập nhật cùng transaction với lần nạp)
+    # Power trung bình = power_sum / power_samples
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        channel_id TEXT NOT NULL,
+        hour_ts INTEGER NOT NULL,   -- created_ts làm tròn xuống theo giờ
+        local_day TEXT,
+        sample_count INTEGER NOT NULL DEFAULT 0,
+        power_samples INTEGER NOT NULL DEFAULT 0,
+        power_sum REAL NOT NULL DEFAULT 0,
+        power_min REAL,
+        power_max REAL,
+        on_seconds REAL NOT NULL DEFAULT 0,     -- thời gian đèn bật
+        waste_seconds REAL NOT NULL DEFAULT 0,  -- bật nhưng không có người
+        energy_wh REAL NOT NULL DEFAULT 0,      -- điện năng tiêu thụ trong giờ
+        PRIMARY KEY (channel_id, hour_ts)
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_daily (
+        channel_id TEXT NOT NULL,
+        local_day TEXT NOT NULL,    -- ngày theo giờ địa phương
+        sample_count INTEGER NOT NULL DEFAULT 0,
+        power_samples INTEGER NOT NULL DEFAULT 0,
+        power_sum REAL NOT NULL DEFAULT 0,
+        power_min REAL,
+        power_max REAL,
+        on_seconds REAL NOT NULL DEFAULT 0,
+        waste_seconds REAL NOT NULL DEFAULT 0,
+        energy_wh REAL NOT NULL DEFAULT 0,      -- điện năng tiêu thụ trong ngày
+        PRIMARY KEY (channel_id, local_day)
     )
     """)
 
-    # ========================
-    # 3. Lưu & đóng
-    # ========================
-    conn.commit()
-    conn.close()
+    if legacy:
+        _backfill_derived_tables(cur)
+
+def _table_exists(cur, name):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cur.fetchone() is not None
+
+def _upgrade_legacy_fact_measurement(cur):
+    """Thêm các cột channel_id / created_ts / local_day cho bảng fact_measurement cũ."""
+    cur.execute("PRAGMA table_info(fact_measurement)")
+    existing = {row[1] for row in cur.fetchall()}
+
+    default_channel = str(config.CHANNEL_IDS[0]) if config.CHANNEL_IDS else ""
+    if "channel_id" not in existing:
+        cur.execute("ALTER TABLE fact_measurement ADD COLUMN channel_id TEXT NOT NULL DEFAULT ''")
+        cur.execute("UPDATE fact_measurement SET channel_id = ?", (default_channel,))
+    if "created_ts" not in existing:
+        cur.execute("ALTER TABLE fact_measurement ADD COLUMN created_ts INTEGER")
+        cur.execute("UPDATE fact_measurement SET created_ts = CAST(strftime('%s', created_at) AS INTEGER)")
+    if "local_day" not in existing:
+        cur.execute("ALTER TABLE fact_measurement ADD COLUMN local_day TEXT")
+        cur.execute("UPDATE fact_measurement SET local_day = date(created_ts, 'unixepoch', 'localtime')")
+
+    # Bỏ bản ghi trùng (channel_id, entry_id) trước khi tạo khóa duy nhất, giữ bản ghi đầu tiên.
+    # entry_id NULL không trùng nhau (khóa duy nhất cho phép nhiều NULL) -> giữ nguyên.
+    cur.execute("""
+        DELETE FROM fact_measurement
+        WHERE entry_id IS NOT NULL
+          AND id NOT IN (
+              SELECT MIN(id) FROM fact_measurement
+              WHERE entry_id IS NOT NULL
+              GROUP BY channel_id, entry_id
+          )
+    """)
+
+def _backfill_derived_tables(cur):
+    """Tính watermark ETL và rollup từ dữ liệu đã có trong DB cũ."""
+    from src.rollups import rebuild_rollups
+
+    cur.execute("""
+        INSERT OR REPLACE INTO etl_state (
+            channel_id, last_entry_id, last_created_ts, last_created_at,
+            last_run_at, last_run_rows, total_rows
+        )
+        SELECT channel_id, MAX(entry_id), MAX(created_ts),
+               strftime('%Y-%m-%d %H:%M:%S', MAX(created_ts), 'unixepoch'),
+               datetime('now', 'localtime'), 0, COUNT(*)
+        FROM fact_measurement
+        GROUP BY channel_id
+    """)
+    rebuild_rollups(cur.connection)
 
-    print(f"✅ Mini Data Warehouse created at: {db_path}")
+# ===================================================================
+# MIGRATION v2: bảng phiên bật đèn (fact_session)
+# ===================================================================
+def _migrate_v2(cur):
+    """Tạo fact_session và tính phiên từ dữ liệu đã có."""
+    from src.sessions import rebuild_sessions
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS fact_session (
+        channel_id TEXT NOT NULL,
+        start_ts INTEGER NOT NULL,  -- created_ts của bản ghi đầu phiên (state=1)
+        start_at TEXT,
+        end_ts INTEGER NOT NULL,    -- created_ts của bản ghi state=1 cuối cùng
+        end_at TEXT,
+        local_day TEXT,             -- ngày (giờ địa phương) bắt đầu phiên
+        duration_s REAL,            -- end_ts - start_ts
+        max_energy_wh REAL,         -- MAX(energy_wh) trong phiên
+        unoccupied_s REAL,          -- thời gian bật mà không có người
+        sample_count INTEGER,
+        device_time_s REAL,         -- MAX(time_s) thiết bị báo trong phiên
+        is_open INTEGER NOT NULL DEFAULT 0, -- 1: phiên vẫn đang bật ở lần nạp gần nhất
+        PRIMARY KEY (channel_id, start_ts)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_session_end_ts ON fact_session(end_ts);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_session_local_day ON fact_session(local_day);")
+    rebuild_sessions(cur)
+
+# ===================================================================
+# MIGRATION v3: trạng thái rule engine + bảng cảnh báo
+# ===================================================================
+def _migrate_v3(cur):
+    """Tạo rule_state (checkpoint từng channel) và fact_alert."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rule_state (
+        channel_id TEXT PRIMARY KEY,
+        checkpoint_id INTEGER NOT NULL DEFAULT 0, -- id fact_measurement lớn nhất đã xử lý
+        last_ts INTEGER,            -- created_ts của bản ghi cuối đã xử lý
+        last_at TEXT,
+        streak_len INTEGER NOT NULL DEFAULT 0,    -- bộ đếm chuỗi "bật không người"
+        streak_start_ts INTEGER,    -- bản ghi đầu của cửa sổ đang đếm
+        streak_start_at TEXT,
+        session_start_ts INTEGER,   -- phiên 'state=1' đang mở (NULL nếu không có)
+        session_start_at TEXT,
+        session_max_energy REAL,    -- MAX(energy_wh) của phiên đang mở
+        updated_at TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS fact_alert (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id TEXT NOT NULL,
+        rule TEXT NOT NULL,         -- tên luật (waste, high_consumption, ...)
+        start_ts INTEGER NOT NULL,
+        start_at TEXT,
+        end_ts INTEGER,
+        end_at TEXT,
+        value REAL,                 -- giá trị vi phạm (Wh, giây, ...)
+        message TEXT,
+        is_open INTEGER NOT NULL DEFAULT 0, -- 1: vi phạm vẫn đang diễn ra
+        detected_at TEXT,           -- thời điểm phát hiện (giờ địa phương)
+        UNIQUE (channel_id, rule, start_ts)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_alert_start_ts ON fact_alert(start_ts);")
+
+# ===================================================================
+# MIGRATION v4: tính lại rollup (energy_wh bỏ qua mẫu thiếu giữa phiên)
+# ===================================================================
+def _migrate_v4(cur):
+    """Rollup cũ cộng lại toàn bộ energy_wh sau mẫu thiếu giá trị -> tính lại từ fact."""
+    from src.rollups import rebuild_rollups
+
+    rebuild_rollups(cur.connection)
+
+# Danh sách migration theo thứ tự: (phiên bản, hàm nâng cấp)
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+    (4, _migrate_v4),
+]
+
+# ===================================================================
+# HÀM CHÍNH
+# ===================================================================
+def create_database_schema():
+    """
+    Tạo mới hoặc nâng cấp schema TẠI CHỖ theo PRAGMA user_version.
+    Không xóa dữ liệu; nếu schema đã mới nhất thì không làm gì.
+    """
+    db_path = config.DB_FILE
+
+    # isolation_level=None: tự quản lý transaction để cả DDL cũng rollback được
+    # connect() bật WAL (lưu trong file DB) cho mọi kết nối về sau
+    conn = connect(db_path, isolation_level=None)
+    cur = conn.cursor()
+    try:
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            print(f"✅ Schema đã ở phiên bản mới nhất (v{version}): {db_path}")
+            return
+
+        for target, migrate in MIGRATIONS:
+            if target <= version:
+                continue
+            print(f"⏳ Nâng cấp schema v{version} -> v{target}...")
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                migrate(cur)
+                cur.execute(f"PRAGMA user_version = {target}")
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            version = target
+
+        print(f"✅ Mini Data Warehouse (schema v{version}) sẵn sàng tại: {db_path}")
+    finally:
+        conn.close()
+
+def reset_database():
+    """
+    HARD RESET (chỉ gọi khi người dùng xác nhận): xóa file DB rồi tạo schema mới.
+    """
+    # Đóng luồng ghi + pool đọc trước khi xóa file (tránh giữ file WAL cũ)
+    close_all()
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        path = config.DB_FILE + suffix
+        if os.path.exists(path):
+            os.remove(path)
+    create_database_schema()
 
 if __name__ == "__main__":
-    print("Đang chạy create.py độc lập để tạo schema...")
-    create_database_schema()
\ No newline at end of file
+    print("Đang chạy create.py độc lập để tạo / nâng cấp schema...")
+    create_database_schema()
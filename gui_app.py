@@ -1,15 +1,16 @@
-﻿import io
-import os
+﻿import os
 import sqlite3
 import threading
 import tkinter as tk
-from contextlib import redirect_stdout
 from datetime import datetime
 from tkinter import messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
 
 import config
-from database.create import create_database_schema
+from database.connection import read_connection
+from database.create import create_database_schema, reset_database
+from src.query_cache import cached_query
+from src.jobs import Job
 from index import run_full_etl_and_analysis_job
 from src.analyzer import (
     analyze_high_consumption,
@@ -21,12 +22,20 @@ from src.analyzer import (
 class SmartHomeDashboard(tk.Tk):
     """Dashboard giám sát ETL + phân tích dữ liệu Smart Home."""
 
+    LOG_POLL_MS = 16           # ~1 khung hình: gom log của tác vụ rồi chèn 1 lần
+    LOG_BATCH_MAX = 500        # số dòng tối đa chèn mỗi khung hình (giữ UI mượt)
+    LOG_MAX_LINES = 5000       # giới hạn console để bộ nhớ không tăng mãi
+
     def __init__(self):
         super().__init__()
         self.title("Smart Home DW Monitor")
         self.geometry("1100x720")
 
-        self._current_worker = None
+        self._current_job = None
+        # Làm mới thống kê chạy nền: tối đa 1 lượt đang chạy + 1 lượt chờ (gộp các yêu cầu chồng nhau)
+        self._metrics_lock = threading.Lock()
+        self._metrics_running = False
+        self._metrics_pending = False
         self.recommendations = []
         self.metric_vars = {
             "total_records": tk.StringVar(value="0"),
@@ -122,12 +131,15 @@ class SmartHomeDashboard(tk.Tk):
             btn.grid(row=idx // 2, column=idx % 2, padx=4, pady=4, sticky="ew")
             self.action_buttons.append(btn)
 
-        ttk.Button(actions_frame, text="Làm mới thống kê", command=self.refresh_metrics).grid(
-            row=2, column=0, columnspan=2, padx=4, pady=(8, 4), sticky="ew"
+        self.cancel_button = ttk.Button(
+            actions_frame, text="Dừng tác vụ", command=self._cancel_action, state="disabled"
         )
-        ttk.Button(actions_frame, text="Reset database", command=self._confirm_reset_db).grid(
-            row=3, column=0, columnspan=2, padx=4, pady=(4, 0), sticky="ew"
+        self.cancel_button.grid(row=2, column=0, columnspan=2, padx=4, pady=(8, 4), sticky="ew")
+        ttk.Button(actions_frame, text="Làm mới thống kê", command=self.refresh_metrics).grid(
+            row=3, column=0, columnspan=2, padx=4, pady=4, sticky="ew"
         )
+        self.reset_button = ttk.Button(actions_frame, text="Reset database", command=self._confirm_reset_db)
+        self.reset_button.grid(row=4, column=0, columnspan=2, padx=4, pady=(4, 0), sticky="ew")
 
         # Recommendations table (tăng chiều cao)
         rec_frame = ttk.LabelFrame(self, text="Khuyến nghị / Cảnh báo", padding=12)
@@ -161,37 +173,48 @@ class SmartHomeDashboard(tk.Tk):
     # ACTION HANDLERS
     # ------------------------------------------------------------------
     def _run_action(self, label, func):
-        if self._current_worker and self._current_worker.is_alive():
+        if self._current_job and self._current_job.is_alive():
             messagebox.showinfo("Đang bận", "Một tác vụ khác đang chạy. Vui lòng đợi hoàn tất.")
             return
 
         self._set_actions_state("disabled")
+        self.cancel_button.config(state="normal")
         self.status_var.set(f"Đang chạy: {label} ...")
 
-        def worker():
-            buffer = io.StringIO()
-            result = None
-            error = None
+        # Log của tác vụ được đưa lên console ngay khi có (xem _poll_job)
+        self._current_job = Job(label, func).start()
+        self.after(self.LOG_POLL_MS, self._poll_job, self._current_job)
 
-            try:
-                with redirect_stdout(buffer):
-                    result = func()
-            except Exception as exc:
-                error = exc
+    def _poll_job(self, job):
+        records = job.logs.drain(self.LOG_BATCH_MAX)
+        if records:
+            self._append_log_records(records)
 
-            log_output = buffer.getvalue().strip()
-            self.after(0, lambda: self._finalize_action(label, log_output, result, error))
+        if job.done.is_set() and job.logs.empty():
+            self._finalize_action(job)
+        else:
+            self.after(self.LOG_POLL_MS, self._poll_job, job)
 
-        self._current_worker = threading.Thread(target=worker, daemon=True)
-        self._current_worker.start()
+    def _cancel_action(self):
+        if self._current_job and self._current_job.is_alive():
+            self._current_job.cancel()
+            self.cancel_button.config(state="disabled")
+            self.status_var.set(f"Đang hủy: {self._current_job.label} ...")
 
-    def _finalize_action(self, label, log_output, result, error):
+    def _finalize_action(self, job):
+        label, result, error = job.label, job.result, job.error
         self._set_actions_state("normal")
+        self.cancel_button.config(state="disabled")
+
+        if job.cancelled:
+            self.status_var.set(f"Đã hủy: {label}")
+            self._append_log(f"{label} đã bị hủy.", "warning")
+            self.refresh_metrics()
+            return
+
         self.status_var.set("Hoàn tất." if not error else f"Lỗi khi chạy: {label}")
 
-        if log_output:
-            self._append_log(log_output, "info")
-        else:
+        if not job.logs.line_count:
             self._append_log(f"[{label}] Hoàn tất nhưng không có log.", "warning")
 
         if error:
@@ -206,21 +229,39 @@ class SmartHomeDashboard(tk.Tk):
         self.refresh_metrics()
 
     def _set_actions_state(self, state):
-        for btn in self.action_buttons:
+        # Reset xóa file DB -> cũng khóa lại khi đang có tác vụ nền
+        for btn in [*self.action_buttons, self.reset_button]:
             btn.config(state=state)
 
+    def _busy_reason(self):
+        """Tác vụ nền đang giữ kết nối DB (Job / luồng thống kê), None nếu rảnh."""
+        if self._current_job and self._current_job.is_alive():
+            return f"Tác vụ '{self._current_job.label}' đang chạy"
+        with self._metrics_lock:
+            if self._metrics_running:
+                return "Đang cập nhật thống kê"
+        return None
+
     def _confirm_reset_db(self):
+        busy = self._busy_reason()
+        if busy:
+            messagebox.showinfo("Đang bận", f"{busy}. Vui lòng đợi hoàn tất rồi reset database.")
+            return
+
         should_reset = messagebox.askyesno(
             "Xác nhận reset",
             "Thao tác này sẽ xóa toàn bộ dữ liệu hiện có trong database.\nBạn chắc chắn muốn tiếp tục?",
         )
         if not should_reset:
             return
+        # Trong lúc hộp thoại mở, lượt thống kê có thể đã bắt đầu -> kiểm tra lại
+        busy = self._busy_reason()
+        if busy:
+            messagebox.showinfo("Đang bận", f"{busy}. Vui lòng đợi hoàn tất rồi reset database.")
+            return
 
         try:
-            if os.path.exists(config.DB_FILE):
-                os.remove(config.DB_FILE)
-            create_database_schema()
+            reset_database()
             self._append_log("Đã reset và tạo mới database.", "warning")
             self.refresh_metrics()
         except Exception as exc:
@@ -231,14 +272,41 @@ class SmartHomeDashboard(tk.Tk):
     # DATA & UI HELPERS
     # ------------------------------------------------------------------
     def refresh_metrics(self):
-        stats = self._fetch_metrics()
+        """
+        Yêu cầu làm mới thống kê mà không chặn UI: truy vấn chạy trên luồng nền,
+        kết quả được đẩy về luồng Tk bằng after(). Nếu đang có lượt chạy thì chỉ
+        đánh dấu chạy thêm 1 lượt sau đó (nhiều yêu cầu chồng nhau -> 1 lượt).
+        """
+        with self._metrics_lock:
+            if self._metrics_running:
+                self._metrics_pending = True
+                return
+            self._metrics_running = True
+
+        self.status_var.set("Đang cập nhật thống kê...")
+        threading.Thread(target=self._metrics_worker, daemon=True).start()
+
+    def _metrics_worker(self):
+        while True:
+            stats, error = self._fetch_metrics()
+            self.after(0, lambda stats=stats, error=error: self._apply_metrics(stats, error))
+            with self._metrics_lock:
+                if not self._metrics_pending:
+                    self._metrics_running = False
+                    return
+                self._metrics_pending = False
+
+    def _apply_metrics(self, stats, error):
         for key, value in stats.items():
             if key in self.metric_vars:
                 self.metric_vars[key].set(value)
 
+        if error:
+            self._append_log(f"Lỗi SQLite khi lấy thống kê: {error}", "error")
         self.status_var.set("Đã cập nhật thống kê cơ sở dữ liệu.")
 
     def _fetch_metrics(self):
+        """Chạy trên luồng nền: trả về (data, lỗi) - không chạm vào widget Tk."""
         data = {
             "total_records": "0",
             "today_records": "0",
@@ -248,52 +316,71 @@ class SmartHomeDashboard(tk.Tk):
         }
 
         if not os.path.exists(config.DB_FILE):
-            return data
+            return data, None
 
         try:
-            conn = sqlite3.connect(config.DB_FILE)
+            # Cache theo phiên bản dữ liệu: bấm "Làm mới" khi chưa có dữ liệu mới -> không truy vấn lại
+            today = datetime.now().strftime("%Y-%m-%d")
+            data.update(cached_query("dashboard_metrics", (today,), lambda: self._query_metrics(today)))
+        except sqlite3.Error as exc:
+            return data, exc
+
+        return data, None
+
+    @staticmethod
+    def _query_metrics(today):
+        data = {}
+        # Kết nối đọc từ pool (WAL): không bị chặn khi ETL đang nạp dữ liệu
+        with read_connection() as conn:
             cur = conn.cursor()
 
-            cur.execute("SELECT COUNT(*), MAX(created_at) FROM fact_measurement")
-            total, last_ts = cur.fetchone()
+            # Đếm từ bảng rollup theo ngày (vài dòng) thay vì COUNT(*) trên bảng thô
+            cur.execute("SELECT COALESCE(SUM(sample_count), 0) FROM rollup_daily")
+            total = cur.fetchone()[0]
             data["total_records"] = f"{total:,}"
-            if last_ts:
-                data["last_record"] = last_ts
 
+            # Bản ghi mới nhất lấy qua index created_ts (không cần MAX trên cột TEXT)
             cur.execute(
                 """
                 SELECT created_at, power_w, energy_wh
                 FROM fact_measurement
-                ORDER BY created_at DESC
+                ORDER BY created_ts DESC
                 LIMIT 1
                 """
             )
             last_row = cur.fetchone()
             if last_row:
-                _, power, energy = last_row
+                last_ts, power, energy = last_row
+                if last_ts:
+                    data["last_record"] = last_ts
                 data["last_power"] = f"{power:.2f}" if power is not None else "--"
                 data["last_energy"] = f"{energy:.2f}" if energy is not None else "--"
 
             cur.execute(
                 """
-                SELECT COUNT(*)
-                FROM fact_measurement
-                WHERE date(created_at, 'localtime') = date('now', 'localtime')
-                """
+                SELECT COALESCE(SUM(sample_count), 0)
+                FROM rollup_daily
+                WHERE local_day = ?
+                """,
+                (today,),
             )
             today_total = cur.fetchone()[0]
             data["today_records"] = f"{today_total:,}"
-
-            conn.close()
-        except sqlite3.Error as exc:
-            self._append_log(f"Lỗi SQLite khi lấy thống kê: {exc}", "error")
-
         return data
 
     def _append_log(self, text, tag="info"):
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        self._append_log_records([(datetime.now().strftime("%H:%M:%S"), tag, text)])
+
+    def _append_log_records(self, records):
+        """Chèn 1 lô bản ghi (giờ, mức, nội dung) vào console trong 1 lần cập nhật widget."""
         self.log_text.configure(state="normal")
-        self.log_text.insert("end", f"[{timestamp}] {text}\n", tag)
+        for timestamp, tag, text in records:
+            self.log_text.insert("end", f"[{timestamp}] {text}\n", tag)
+
+        # Cắt bớt dòng cũ nhất khi vượt giới hạn
+        lines = int(self.log_text.index("end-1c").split(".")[0])
+        if lines > self.LOG_MAX_LINES:
+            self.log_text.delete("1.0", f"{lines - self.LOG_MAX_LINES + 1}.0")
         self.log_text.configure(state="disabled")
         self.log_text.see("end")
 
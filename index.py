@@ -1,6 +1,7 @@
 import os
 import time
-import schedule
+import signal
+import argparse
 import threading
 import sys
 from datetime import datetime
@@ -8,10 +9,14 @@ from datetime import datetime
 # Import các hàm từ các file theo cấu trúc mới
 import config
 # ✅ SỬA IMPORT: Lấy các hàm đã cập nhật
-from src.utils import fetch_json, json_to_df, load_dataframe_to_dwh, get_last_timestamp
 # ✅ SỬA IMPORT: Lấy các hàm phân tích mới
 from src.analyzer import analyze_waste, analyze_high_consumption, run_all_analyses
-from database.create import create_database_schema
+from src.rule_engine import run_incremental_analyses
+from src.http_client import get_client
+from src.jobs import check_cancelled
+from src.scheduler import run_scheduler
+from src.pipeline import run_etl_pipeline
+from database.create import create_database_schema, reset_database
 
 # Biến toàn cục để điều khiển luồng (thread)
 stop_event = threading.Event()
@@ -21,61 +26,66 @@ def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 # ===================================================================
-# HÀM JOB CHÍNH (Đã sửa logic ETL)
+# HÀM JOB CHÍNH (ETL cho TẤT CẢ channel trong config)
 # ===================================================================
+def _configured_channels():
+    """Ghép CHANNEL_IDS với READ_API_KEYS theo vị trí (thiếu key -> "")."""
+    keys = list(config.READ_API_KEYS or [])
+    return [
+        (str(cid), keys[i] if i < len(keys) else "")
+        for i, cid in enumerate(config.CHANNEL_IDS or [])
+    ]
+
 def run_full_etl_and_analysis_job():
     """
-    Hàm công việc (job) hoàn chỉnh: ETL (tăng dần) cho 1 CHANNEL rồi Phân tích.
+    Hàm công việc (job) hoàn chỉnh: ETL (tăng dần) cho TẤT CẢ channel.
+    - Pipeline (src/pipeline.py): tải trang/cửa sổ song song (config.ETL_WORKERS luồng),
+      transform và nạp (1 writer SQLite duy nhất) chạy gối nhau qua hàng đợi có giới hạn.
+    Một channel lỗi không làm dừng các channel khác.
+    Trả về dict {channel_id: báo cáo} (rows, số trang, thời gian extract/load, lỗi).
     """
     print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🚀 Bắt đầu chu trình ETL")
 
     etl_success = False 
     print(f"--- Bắt đầu ETL---")
+    report = {}
+    http_before = get_client().get_stats()
     
-    if not config.CHANNEL_IDS or len(config.CHANNEL_IDS) == 0:
+    channels = _configured_channels()
+    if not channels:
         print("   [!] ❌ LỖI: Không có CHANNEL_IDS nào được định nghĩa trong config.py")
     else:
-        cid = config.CHANNEL_IDS[0]
-        key = config.READ_API_KEYS[0] if config.READ_API_KEYS else ""
-        
-        print(f"\n--- Đang xử lý Channel {cid} ---")
-        try:
-            # 1. Lấy timestamp cuối cùng
-            last_ts = get_last_timestamp()
-            
-            # 2. Fetch dữ liệu MỚI HƠN
-            js = fetch_json(cid, key, start_time=last_ts)
-            df = json_to_df(js, config.FIELDS)
-
-            if df.empty:
-                print(f"   [E] ⚠️ Channel {cid} không có dữ liệu mới.")
-                etl_success = True 
-            else:
-                # 3. Nạp dữ liệu mới
-                success_load = load_dataframe_to_dwh(df)
-                
-                if success_load:
-                     etl_success = True
-                else:
-                     etl_success = False
-
-        except Exception as e:
-            print(f"   [!] ❌ LỖI NGHIÊM TRỌNG khi xử lý Channel {cid}: {e}")
-            etl_success = False
+        # Pipeline: tải (nhiều luồng) -> transform -> nạp (1 writer) chạy gối nhau
+        report, _ = run_etl_pipeline(channels)
+
+        print(f"\n--- Tổng kết theo Channel ---")
+        for cid, _ in channels:
+            r = report[cid]
+            status = "✅" if r["ok"] else f"❌ {r['error']}"
+            print(f"   Channel {cid}: {r['rows']} bản ghi / {r['pages']} trang | extract {r['extract_s']:.2f}s | "
+                  f"load {r['load_s']:.2f}s | {status}")
+        etl_success = all(r["ok"] for r in report.values())
+
+        http_after = get_client().get_stats()
+        http = {k: http_after[k] - http_before[k] for k in http_after}
+        print(f"   [API] HTTP: {http['requests']} request | {http['retries']} lần thử lại | "
+              f"{http['not_modified']} x 304 | {http['bytes'] / 1024:.0f} KB")
 
     if etl_success:
          print(f"\n--- ✅ ETL hoàn tất ---")
     else:
          print(f"\n--- ❌ ETL thất bại ---")
 
-    # # --- Phần Phân Tích (Chạy TẤT CẢ tự động) ---
-    # if etl_success:
-    #     run_all_analyses() # Gọi hàm chạy tất cả phân tích
-    # else:
-    #     print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ⚠️ Bỏ qua phân tích do ETL gặp lỗi.")
+    # --- Phần Phân Tích: chỉ xử lý bản ghi mới (rule engine tăng dần) ---
+    if etl_success:
+        check_cancelled()
+        run_incremental_analyses()
+    else:
+        print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ⚠️ Bỏ qua phân tích do ETL gặp lỗi.")
 
     print(f"\n-----------------------------------------------")
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✅ Chu trình ETL HOÀN TẤT.")
+    return report
 
 
 # ===================================================================
@@ -94,7 +104,9 @@ def analysis_submenu():
         # print("  2. Phân tích Bật quá lâu")
         print("  2. Phân tích Tiêu thụ trong ngày")
         print("  3. Chạy tất cả phân tích")
-        print("  4. Quay lại Menu chính")
+        print("  4. Phân tích tăng dần (chỉ dữ liệu mới)")
+        print("  5. Phân tích theo khoảng ngày")
+        print("  6. Quay lại Menu chính")
         print("-----------------------------------")
         choice = input("Nhập lựa chọn của bạn: ")
 
@@ -119,6 +131,22 @@ def analysis_submenu():
             run_all_analyses()
             input("\nHoàn tất! Bấm Enter để quay lại...")
         elif choice == '4':
+            clear_screen()
+            print("[App] 🧐 Đang chạy Phân tích tăng dần...")
+            run_incremental_analyses()
+            input("\nHoàn tất! Bấm Enter để quay lại...")
+        elif choice == '5':
+            clear_screen()
+            try:
+                start = datetime.strptime(input("Từ ngày (YYYY-MM-DD): ").strip(), "%Y-%m-%d").date()
+                end = datetime.strptime(input("Đến ngày (YYYY-MM-DD): ").strip(), "%Y-%m-%d").date()
+            except ValueError:
+                input("[App] ❌ Ngày không hợp lệ. (Bấm Enter để quay lại)")
+                continue
+            print(f"[App] 🧐 Đang chạy TẤT CẢ phân tích từ {start} đến {end}...")
+            run_all_analyses(start, end)
+            input("\nHoàn tất! Bấm Enter để quay lại...")
+        elif choice == '6':
             break # Thoát vòng lặp, quay lại main_menu
         else:
             input("[App] ❌ Lựa chọn không hợp lệ. (Bấm Enter để thử lại)")
@@ -126,22 +154,28 @@ def analysis_submenu():
 # ===================================================================
 # PHẦN GIAO DIỆN MENU (Đã sửa)
 # ===================================================================
-# def start_scheduler_thread():
-#     """
-#     Hàm chạy vòng lặp schedule trong một luồng (thread) riêng.
-#     """
-#     print("\n[Scheduler] ⚙️ Luồng lập lịch đã khởi động...")
-    
-#     schedule.every(15).seconds.do(run_full_etl_and_analysis_job)
-
-#     print("[Scheduler] ⏳ Đang chạy lần đầu tiên ngay bây giờ...")
-#     schedule.run_all()
-
-#     while not stop_event.is_set():
-#         schedule.run_pending()
-#         time.sleep(1)
-
-#     print("[Scheduler] 🛑 Luồng lập lịch đã dừng.")
+def run_channel_etl(cid, key):
+    """
+    1 lượt ETL + phân tích tăng dần cho 1 channel (dùng bởi bộ lập lịch).
+    Trả về số bản ghi MỚI thực sự được nạp (bản ghi biên trùng không tính).
+    """
+    # Cùng đường tải / nạp với run_full_etl_and_analysis_job (pipeline ETL)
+    report, _ = run_etl_pipeline([(cid, key)])
+    r = report[cid]
+    if not r["ok"]:
+        # Giữ nguyên lỗi gốc để bộ lập lịch đọc được Retry-After (HTTP 429)
+        raise r["exception"]
+    if r["rows"]:
+        run_incremental_analyses([cid])
+    return r["rows"]
+
+def start_scheduler_thread():
+    """
+    Vòng lặp lập lịch thích ứng cho TẤT CẢ channel (chạy trong luồng riêng
+    hoặc ở chế độ --daemon). Dừng khi stop_event được set.
+    """
+    print("\n[Scheduler] ⚙️ Luồng lập lịch đã khởi động...")
+    run_scheduler(run_channel_etl, _configured_channels(), stop_event)
 
 def main_menu():
     global job_thread
@@ -153,57 +187,56 @@ def main_menu():
         print("  QUẢN LÝ ETL & PHÂN TÍCH DỮ LIỆU   ")
         print("====================================")
 
-        # if is_running:
-        #     print("  Trạng thái: 🟢 ĐANG CHẠY ")
-        # else:
-        #     print("  Trạng thái: 🔴 ĐÃ DỪNG")
+        if is_running:
+            print("  Trạng thái: 🟢 ĐANG CHẠY TỰ ĐỘNG")
+        else:
+            print("  Trạng thái: 🔴 ĐÃ DỪNG")
 
         print("\n--- Lựa chọn ---")
-        # print("  1. Bắt đầu chạy tự động (ETL + Phân tích)")
-        # print("  2. Dừng chạy tự động")
-        print("  1. ETL Và nạp dữ liệu vào DWH")
-        print("  2. Phân tích & Đưa lời khuyên (Mở Menu con)") # ✅ Sửa mô tả
-        print("  3. Xóa và Tạo lại Database (Hard Reset)")
-        print("  4. Thoát")
+        print("  1. Bắt đầu chạy tự động (ETL + Phân tích, chạy nền)")
+        print("  2. Dừng chạy tự động")
+        print("  3. ETL Và nạp dữ liệu vào DWH")
+        print("  4. Phân tích & Đưa lời khuyên (Mở Menu con)") # ✅ Sửa mô tả
+        print("  5. Xóa và Tạo lại Database (Hard Reset)")
+        print("  6. Thoát")
         print("-----------------------------------")
 
         choice = input("Nhập lựa chọn của bạn: ")
 
-        # if choice == '1': # Bắt đầu tự động
-        #     if not is_running:
-        #         print("\n[App] ⏳ Đang khởi động...")
-        #         stop_event.clear()
-        #         job_thread = threading.Thread(target=start_scheduler_thread, daemon=True)
-        #         job_thread.start()
-        #         is_running = True
-        #         print("[App] ✅ Đã BẮT ĐẦU.")
-        #         time.sleep(2)
-        #     else:
-        #         input("[App] ⚠️ Vẫn đang chạy! (Bấm Enter để tiếp tục)")
-
-        # elif choice == '2': # Dừng tự động
-        #     if is_running:
-        #         print("\n[App] ⏳ Đang dừng...")
-        #         stop_event.set()
-        #         job_thread.join()
-        #         schedule.clear()
-        #         is_running = False
-        #         job_thread = None
-        #         print("[App] ✅ Đã DỪNG.")
-        #         time.sleep(2)
-        #     else:
-        #         input("[App] ⚠️ Vốn dĩ đã dừng! (Bấm Enter để tiếp tục)")
-
-        if choice == '1': # Chạy ETL 1 lần
+        if choice == '1': # Bắt đầu tự động
+            if not is_running:
+                print("\n[App] ⏳ Đang khởi động...")
+                stop_event.clear()
+                job_thread = threading.Thread(target=start_scheduler_thread, daemon=True)
+                job_thread.start()
+                is_running = True
+                print("[App] ✅ Đã BẮT ĐẦU.")
+                time.sleep(2)
+            else:
+                input("[App] ⚠️ Vẫn đang chạy! (Bấm Enter để tiếp tục)")
+
+        elif choice == '2': # Dừng tự động
+            if is_running:
+                print("\n[App] ⏳ Đang dừng (chờ các lượt đang chạy xong)...")
+                stop_event.set()
+                job_thread.join()
+                is_running = False
+                job_thread = None
+                print("[App] ✅ Đã DỪNG.")
+                time.sleep(2)
+            else:
+                input("[App] ⚠️ Vốn dĩ đã dừng! (Bấm Enter để tiếp tục)")
+
+        elif choice == '3': # Chạy ETL 1 lần
              clear_screen()
              print("[App] ⚡ Đang chạy ETL & Nạp dữ liệu vào DWH...")
              run_full_etl_and_analysis_job()
              input("\nHoàn tất! Bấm Enter để quay lại menu...")
 
-        elif choice == '2': # ✅ GỌI MENU CON
+        elif choice == '4': # ✅ GỌI MENU CON
             analysis_submenu()
 
-        elif choice == '3': # Reset DB
+        elif choice == '5': # Reset DB
             clear_screen()
             print("[App] 🛑 CẢNH BÁO 🛑")
             print("Thao tác này sẽ XÓA TẤT CẢ dữ liệu trong database")
@@ -215,20 +248,12 @@ def main_menu():
                       was_running = True
                       stop_event.set()
                       job_thread.join()
-                      schedule.clear()
                       is_running = False
                       job_thread = None
 
-                 print(f"[DB] ⏳ Đang xóa file DB cũ: {config.DB_FILE}")
+                 print(f"[DB] ⏳ Đang xóa và tạo lại DB: {config.DB_FILE}")
                  try:
-                      if os.path.exists(config.DB_FILE):
-                           os.remove(config.DB_FILE)
-                           print("[DB] ✅ Đã xóa DB cũ.")
-                      else:
-                           print("[DB] ℹ️ Không tìm thấy file DB cũ, bỏ qua bước xóa.")
-
-                      print("[DB] ⏳ Đang tạo lại schema database...")
-                      create_database_schema()
+                      reset_database()
                       print("[DB] ✅ Tạo lại schema thành công.")
 
                       if was_running:
@@ -245,7 +270,7 @@ def main_menu():
             else:
                  input("\nĐã hủy. Bấm Enter để quay lại menu...")
 
-        elif choice == '4': # Thoát
+        elif choice == '6': # Thoát
             if is_running:
                 print("\n[App] ⏳ Đang dừng các luồng trước khi thoát...")
                 stop_event.set()
@@ -256,7 +281,28 @@ def main_menu():
         else:
             input("[App] ❌ Lựa chọn không hợp lệ. (Bấm Enter để thử lại)")
 
+def run_daemon():
+    """
+    Chế độ dịch vụ (không có menu): `python index.py --daemon`.
+    SIGINT/SIGTERM -> stop_event.set(): dừng nhận lượt mới, chờ các lượt đang chạy xong rồi thoát.
+    """
+    def _request_stop(signum, frame):
+        print(f"\n[App] 🛑 Nhận tín hiệu {signal.Signals(signum).name}, đang dừng...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    create_database_schema()
+    start_scheduler_thread()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quản lý ETL & phân tích dữ liệu Smart Home")
+    parser.add_argument("--daemon", action="store_true", help="chạy lập lịch tự động, không hiển thị menu")
+    if parser.parse_args().daemon:
+        run_daemon()
+        sys.exit()
+
     try:
         clear_screen()
         print("[App] 🏃 Đang kiểm tra và khởi tạo database (nếu cần)...")
@@ -1,8 +1,10 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
 import sys
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 
 # Thêm thư mục gốc vào sys.path để import config
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -10,253 +12,472 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 import config # Import config để lấy DB_FILE
+from src.utils import local_day_bounds
+from src.segmentation import find_streak_windows
+from src.query_cache import cached_query
+from src.jobs import JobCancelled, check_cancelled
+from database.connection import read_connection, connect
 
 # --- Các Ngưỡng Phân Tích (Đã sửa theo yêu cầu) ---
-STREAK_TARGET = 120       
-LONG_DURATION_SECONDS = 14400 
+STREAK_TARGET = 120
+LONG_DURATION_SECONDS = 14400
 HIGH_ENERGY_THRESHOLD_WH = 100 # Ngưỡng Wh
 
 def _get_db_connection():
-    """Hàm helper để kết nối DB"""
-    return sqlite3.connect(config.DB_FILE)
+    """Hàm helper: mượn 1 kết nối đọc từ pool (dùng với `with`)"""
+    return read_connection()
+
+def _get_energy_wh(start_ts, end_ts, channel_ids):
+    """Tổng điện năng trong khoảng [start_ts, end_ts) từ rollup_hourly - chỉ đọc vài dòng / giờ."""
+    return cached_query("energy_wh", (start_ts, end_ts, tuple(channel_ids)),
+                        lambda: _query_energy_wh(start_ts, end_ts, channel_ids))
+
+def _query_energy_wh(start_ts, end_ts, channel_ids):
+    with _get_db_connection() as conn:
+        row = conn.execute(
+            f"""
+            SELECT COALESCE(SUM(energy_wh), 0) FROM rollup_hourly
+            WHERE hour_ts >= ? AND hour_ts < ? AND channel_id IN ({', '.join('?' for _ in channel_ids)})
+            """,
+            (start_ts, end_ts, *channel_ids),
+        ).fetchone()
+        return float(row[0])
+
+# ===================================================================
+# KHOẢNG THỜI GIAN + CHANNEL CẦN PHÂN TÍCH
+# ===================================================================
+def _to_ts(value, is_end=False):
+    """date -> nửa đêm (giờ địa phương); end là date thì tính HẾT ngày đó. datetime -> epoch."""
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    start_ts, end_ts = local_day_bounds(value)
+    return end_ts if is_end else start_ts
+
+def _resolve_range(start=None, end=None):
+    """Mặc định: hôm nay. start/end là date hoặc datetime (giờ địa phương)."""
+    today_start, today_end = local_day_bounds()
+    start_ts = today_start if start is None else _to_ts(start)
+    end_ts = today_end if end is None else _to_ts(end, is_end=True)
+    return start_ts, end_ts
+
+def _range_label(start_ts, end_ts):
+    if (start_ts, end_ts) == local_day_bounds():
+        return "hôm nay"
+    fmt = '%Y-%m-%d %H:%M'
+    return (f"khoảng {datetime.fromtimestamp(start_ts).strftime(fmt)} "
+            f"- {datetime.fromtimestamp(end_ts).strftime(fmt)}")
+
+def _day_partitions(start_ts, end_ts):
+    """Chia [start_ts, end_ts) thành các khoảng theo ngày (giờ địa phương)."""
+    partitions = []
+    day = datetime.fromtimestamp(start_ts).date()
+    while True:
+        day_start, day_end = local_day_bounds(day)
+        if day_start >= end_ts:
+            break
+        partitions.append((max(day_start, start_ts), min(day_end, end_ts)))
+        day += timedelta(days=1)
+    return partitions
+
+def _loaded_channels():
+    """Mọi channel đã có dữ liệu (theo etl_state)."""
+    def query():
+        with _get_db_connection() as conn:
+            return [r[0] for r in conn.execute("SELECT channel_id FROM etl_state ORDER BY channel_id")]
+    return list(cached_query("loaded_channels", (), query))
 
 # ===================================================================
-# HÀM LUẬT 1: PHÂN TÍCH LÃNG PHÍ (Logic quét 30-streak)
+# BỘ ĐĂNG KÝ LUẬT (rule registry)
 # ===================================================================
-def analyze_waste():
+# Mỗi luật khai báo nguồn dữ liệu nó cần, các cột cần đọc và ngưỡng.
+# Một luật gồm 3 bước:
+# - summarize(df, thresholds): tóm tắt 1 khối LIÊN TIẾP (theo thời gian) của
+#   1 channel -> kết quả nhỏ, pickle được (chạy được trong process pool).
+# - combine(a, b, thresholds): ghép tóm tắt b vào NGAY SAU a (nối các chuỗi vắt
+#   qua ranh giới khối / ngày). a=None nghĩa là b là khối đầu tiên của khoảng.
+# - report(summary, thresholds, label): in và trả về danh sách cảnh báo.
+# Dữ liệu được đọc theo từng khối (config.ANALYSIS_CHUNK_ROWS dòng) và gộp dần,
+# nên bộ nhớ không phụ thuộc độ dài khoảng thời gian.
+# Các luật cùng nguồn dùng chung 1 lần đọc dữ liệu -> thêm luật không thêm truy vấn.
+
+# Nguồn dữ liệu: (bảng, điều kiện khoảng thời gian, cột sắp xếp)
+_SOURCES = {
+    "measurement": ("fact_measurement", "created_ts >= ? AND created_ts < ?", "created_ts"),
+    "session": ("fact_session", "end_ts >= ? AND start_ts < ?", "start_ts"),
+}
+
+RULES = {}
+
+def register_rule(name, title, source, columns, summarize, combine, report, thresholds=None, enabled=True):
+    """Đăng ký 1 luật phân tích (xem mô tả summarize / combine / report ở trên)."""
+    RULES[name] = {
+        "title": title,
+        "source": source,
+        "columns": tuple(columns),
+        "summarize": summarize,
+        "combine": combine,
+        "report": report,
+        "thresholds": dict(thresholds or {}),
+        "enabled": enabled,
+    }
+
+def _source_columns(rules, source):
+    cols = []
+    for rule in rules:
+        if rule["source"] == source:
+            cols += [c for c in rule["columns"] if c not in cols]
+    return cols
+
+def _read_source_chunks(conn, source, cols, channel_ids, start_ts, end_ts):
+    """Đọc nguồn theo từng khối config.ANALYSIS_CHUNK_ROWS dòng (luôn có ít nhất 1 khối)."""
+    table, where, order_by = _SOURCES[source]
+    query = (
+        f"SELECT channel_id, {', '.join(cols)} FROM {table} "
+        f"WHERE {where} AND channel_id IN ({', '.join('?' for _ in channel_ids)}) "
+        f"ORDER BY channel_id, {order_by} ASC;"
+    )
+    empty = True
+    for chunk in pd.read_sql_query(query, conn, params=(start_ts, end_ts, *channel_ids),
+                                   chunksize=config.ANALYSIS_CHUNK_ROWS):
+        empty = False
+        yield chunk
+    if empty:
+        yield pd.DataFrame(columns=["channel_id", *cols])
+
+def _summarize_partition(db_file, rule_specs, cols, channel_id, start_ts, end_ts):
     """
-    Luật 1 (Logic mới): Quét các bản ghi TRONG NGÀY HÔM NAY.
-    Nếu tìm thấy 30 bản ghi LIÊN TIẾP (state=1, presence=0) thì cảnh báo.
+    Tóm tắt 1 phân vùng (channel, ngày) của fact_measurement cho các luật.
+    Chạy được trong process con: tự mở kết nối chỉ đọc tới db_file.
+    rule_specs: [(tên luật, ngưỡng)] -> trả về {tên luật: tóm tắt}.
     """
-    print(f"\n--- 1. Phân tích Lãng phí---")
-    recommendations = []
-    
+    summaries = {}
+    conn = connect(db_file, readonly=True)
     try:
-        conn = _get_db_connection()
-        
-        # Lấy TẤT CẢ bản ghi của ngày hôm nay, sắp xếp từ cũ đến mới
-        query = """
-        SELECT created_at, state, presence
-        FROM fact_measurement
-        WHERE date(created_at, 'localtime') = date('now', 'localtime')
-        ORDER BY created_at ASC;
-        """
-        
-        # Dùng 'itertuples' để duyệt hiệu quả, không cần nhiều RAM
-        df = pd.read_sql_query(query, conn, parse_dates=['created_at'])
+        for chunk in _read_source_chunks(conn, "measurement", cols, [channel_id], start_ts, end_ts):
+            for name, thresholds in rule_specs:
+                rule = RULES[name]
+                part = rule["summarize"](chunk, thresholds)
+                # Khối đầu của phân vùng giữ nguyên (chưa biết phân vùng trước), các khối sau ghép dần
+                summaries[name] = part if name not in summaries else rule["combine"](summaries[name], part, thresholds)
+    finally:
         conn.close()
+    return summaries
 
-        if df.empty:
-            print("   (Không có dữ liệu hôm nay để phân tích)")
-            return recommendations
-
-        bad_streak_counter = 0
-        streak_start_time = None
-
-        print(f"   🔎 Đang quét {len(df)} bản ghi của hôm nay...")
-        # Duyệt qua dữ liệu TỪ CŨ ĐẾN MỚI
-        for row in df.itertuples():
-            # (row[0] là Index, row[1] là created_at, row[2] là state, row[3] là presence)
-            is_bad_state = (row.state == 1 and row.presence == 0)
-
-            if is_bad_state:
-                # Nếu là trạng thái xấu, bắt đầu đếm
-                if bad_streak_counter == 0:
-                    streak_start_time = row.created_at # Ghi lại thời điểm bắt đầu chuỗi
-                bad_streak_counter += 1
-            
-            else:
-                # Nếu gặp trạng thái reset, đặt lại bộ đếm
-                bad_streak_counter = 0
-                streak_start_time = None
-            
-            # Kiểm tra xem đã đạt mục tiêu 30 chưa
-            if bad_streak_counter == STREAK_TARGET:
-                streak_end_time = row.created_at
-                rec = (
-                    f"   ❗️ CẢNH BÁO: Đèn bật không người ! "
-                    f"Từ {streak_start_time} đến {streak_end_time}."
-                )
-                print(rec)
-                recommendations.append(rec)
-                
-                # Reset bộ đếm để tìm chuỗi tiếp theo
-                bad_streak_counter = 0
-                streak_start_time = None
-        
-        if not recommendations:
-             print("   (Không phát hiện lãng phí nào trong ngày hôm nay.)")
+def _summarize_measurements(rules, cols, channel_ids, start_ts, end_ts, totals):
+    """
+    Tóm tắt fact_measurement theo phân vùng (channel, ngày) rồi ghép dần vào
+    totals[(tên luật, channel_id)] theo thứ tự thời gian.
+    Nhiều phân vùng -> chạy song song trên process pool (config.ANALYSIS_WORKERS).
+    """
+    rule_specs = [(name, rule["thresholds"]) for name, rule in rules.items()]
+    tasks = [
+        (config.DB_FILE, rule_specs, cols, cid, p_start, p_end)
+        for cid in channel_ids
+        for p_start, p_end in _day_partitions(start_ts, end_ts)
+    ]
+
+    def fold(results):
+        for task, result in zip(tasks, results):
+            check_cancelled()
+            cid = task[3]
+            for name, rule in rules.items():
+                totals[(name, cid)] = rule["combine"](totals.get((name, cid)), result[name], rule["thresholds"])
 
+    workers = min(config.ANALYSIS_WORKERS, len(tasks), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map giữ đúng thứ tự phân vùng; gom vài phân vùng / lần gửi để giảm chi phí IPC
+            chunk = max(1, len(tasks) // (workers * 4))
+            try:
+                fold(pool.map(_summarize_partition, *zip(*tasks), chunksize=chunk))
+            except JobCancelled:
+                pool.shutdown(cancel_futures=True)
+                raise
+    else:
+        fold(_summarize_partition(*task) for task in tasks)
+
+def _summarize_sessions(rules, cols, channel_ids, start_ts, end_ts, totals):
+    """fact_session đã gộp sẵn phiên trọn vẹn -> 1 truy vấn qua index, không cần chia ngày."""
+    with _get_db_connection() as conn:
+        for chunk in _read_source_chunks(conn, "session", cols, channel_ids, start_ts, end_ts):
+            check_cancelled()
+            for cid, part in chunk.groupby("channel_id", sort=False):
+                for name, rule in rules.items():
+                    summary = rule["summarize"](part, rule["thresholds"])
+                    totals[(name, cid)] = rule["combine"](totals.get((name, cid)), summary, rule["thresholds"])
+
+def _compute_totals(rules, channel_ids, start_ts, end_ts):
+    """Đọc dữ liệu và ghép tóm tắt: {(tên luật, channel_id): tóm tắt của cả khoảng}."""
+    totals = {}
+    if channel_ids:
+        for source, summarize in (("measurement", _summarize_measurements), ("session", _summarize_sessions)):
+            source_rules = {n: r for n, r in rules.items() if r["source"] == source}
+            if source_rules:
+                cols = _source_columns(source_rules.values(), source)
+                summarize(source_rules, cols, channel_ids, start_ts, end_ts, totals)
+    return totals
+
+def _run_rules(names, start=None, end=None, channel_ids=None):
+    """
+    Chạy các luật theo tên trên khoảng [start, end] (mặc định hôm nay) và tập channel
+    (mặc định mọi channel đã nạp). Cảnh báo trả về theo thứ tự luật -> channel -> thời gian.
+    """
+    start_ts, end_ts = _resolve_range(start, end)
+    label = _range_label(start_ts, end_ts)
+    rules = {name: RULES[name] for name in names}
+
+    try:
+        channel_ids = [str(c) for c in channel_ids] if channel_ids else _loaded_channels()
+        # Cache theo phiên bản dữ liệu: chạy lại khi chưa có dữ liệu mới -> không đọc lại DB
+        cache_params = (
+            tuple((name, tuple(sorted(rule["thresholds"].items()))) for name, rule in rules.items()),
+            start_ts, end_ts, tuple(channel_ids),
+        )
+        totals = cached_query(
+            "rules", cache_params, lambda: _compute_totals(rules, channel_ids, start_ts, end_ts)
+        )
     except sqlite3.Error as e:
-         print(f"   ❌ Lỗi SQLite khi phân tích lãng phí: {e}")
-    except Exception as e:
-         print(f"   ❌ Lỗi Pandas/Python: {e}")
-            
+        print(f"   ❌ Lỗi SQLite khi đọc dữ liệu phân tích: {e}")
+        return []
+
+    all_recs = []
+    for name, rule in rules.items():
+        print(f"\n--- {rule['title']} ---")
+        if not channel_ids:
+            print(f"   (Không có dữ liệu {label} để phân tích)")
+            continue
+        for cid in channel_ids:
+            if len(channel_ids) > 1:
+                print(f"   📡 Channel {cid}:")
+            try:
+                all_recs.extend(rule["report"](totals.get((name, cid)), rule["thresholds"], label))
+                if rule["source"] == "session":
+                    total_wh = _get_energy_wh(start_ts, end_ts, [cid])
+                    print(f"   🔎 TỔNG TIÊU THỤ ĐIỆN {'TRONG NGÀY' if label == 'hôm nay' else label.upper()}: {total_wh:.0f} Wh")
+            except sqlite3.Error as e:
+                print(f"   ❌ Lỗi SQLite khi phân tích: {e}")
+            except Exception as e:
+                print(f"   ❌ Lỗi Pandas/Python: {e}")
+    return all_recs
+
+# ===================================================================
+# LUẬT 1: LÃNG PHÍ (chuỗi STREAK_TARGET bản ghi state=1, presence=0)
+# ===================================================================
+def _summarize_waste(df, thresholds):
+    """
+    Tóm tắt 1 khối: chuỗi 'xấu' ở ĐẦU khối (có thể nối với khối trước) được
+    giữ lại (lead) để combine xử lý; phần còn lại tìm cửa sổ với bộ đếm từ 0.
+    tail: created_at các bản ghi của cửa sổ đang đếm dở ở cuối khối (< streak_target).
+    """
+    # Trạng thái xấu: đèn bật (state=1) nhưng không có người (presence=0)
+    is_bad_state = ((df['state'] == 1) & (df['presence'] == 0)).to_numpy()
+    created_at = df['created_at'].to_numpy()
+    n = len(is_bad_state)
+    lead_len = n if is_bad_state.all() else int(np.argmin(is_bad_state))
+
+    start_idx, end_idx, carry = find_streak_windows(
+        is_bad_state[lead_len:], thresholds["streak_target"], return_carry=True
+    )
+    return {
+        "rows": n,
+        "lead": list(created_at[:lead_len]),
+        "all_bad": lead_len == n,
+        "windows": list(zip(created_at[lead_len + start_idx], created_at[lead_len + end_idx])),
+        "tail": list(created_at[n - carry:]) if carry else [],
+    }
+
+def _fold_lead(pending, lead, target):
+    """Nối chuỗi xấu `lead` vào cửa sổ đang đếm dở `pending` -> (các cửa sổ mới, pending mới)."""
+    start_idx, end_idx, carry = find_streak_windows(
+        np.ones(len(lead), dtype=bool), target, carry=len(pending), return_carry=True
+    )
+    windows = [(pending[len(pending) + s] if s < 0 else lead[s], lead[e]) for s, e in zip(start_idx, end_idx)]
+    if carry == 0:
+        pending = []
+    elif carry <= len(lead):
+        pending = lead[len(lead) - carry:]
+    else:
+        pending = pending + lead  # chưa đủ 1 cửa sổ: cộng dồn (luôn < target phần tử)
+    return windows, pending
+
+def _combine_waste(a, b, thresholds):
+    """
+    Ghép khối b ngay sau a. a=None: b là khối đầu của khoảng -> chuỗi đầu của b
+    đếm từ 0 và tóm tắt trả về đã "chốt" (lead=None), chỉ còn cửa sổ + tail.
+    """
+    if a is None:
+        a = {"rows": 0, "lead": None, "all_bad": False, "windows": [], "tail": []}
+    if a["lead"] is not None and a["all_bad"]:
+        # a toàn bản ghi xấu và chưa biết phần trước -> chuỗi đầu kéo dài sang b
+        return {
+            "rows": a["rows"] + b["rows"], "lead": a["lead"] + b["lead"], "all_bad": b["all_bad"],
+            "windows": b["windows"], "tail": b["tail"],
+        }
+
+    windows, pending = _fold_lead(a["tail"], b["lead"], thresholds["streak_target"])
+    a["windows"].extend(windows)
+    a["windows"].extend(b["windows"])
+    return {
+        "rows": a["rows"] + b["rows"], "lead": a["lead"], "all_bad": False,
+        "windows": a["windows"], "tail": pending if b["all_bad"] else b["tail"],
+    }
+
+def _report_waste(summary, thresholds, label):
+    """
+    Luật 1 (Logic mới): Quét các bản ghi trong khoảng đã chọn.
+    Nếu tìm thấy `streak_target` bản ghi LIÊN TIẾP (state=1, presence=0) thì cảnh báo.
+    """
+    recommendations = []
+    if summary is None or summary["rows"] == 0:
+        print(f"   (Không có dữ liệu {label} để phân tích)")
+        return recommendations
+
+    print(f"   🔎 Đang quét {summary['rows']} bản ghi của {label}...")
+    for streak_start_time, streak_end_time in summary["windows"]:
+        rec = (
+            f"   ❗️ CẢNH BÁO: Đèn bật không người ! "
+            f"Từ {streak_start_time} đến {streak_end_time}."
+        )
+        print(rec)
+        recommendations.append(rec)
+
+    if not recommendations:
+         print(f"   (Không phát hiện lãng phí nào trong {'ngày ' if label == 'hôm nay' else ''}{label}.)")
     return recommendations
-# # ===================================================================
-# # HÀM LUẬT 2: PHÂN TÍCH BẬT QUÁ LÂU (Đã sửa query)
-# # ===================================================================
-# def analyze_long_duration():
-#     """
-#     Luật 2 (Sửa đổi): Kiểm tra bản ghi MỚI NHẤT.
-#     Nếu state=1 VÀ time_s > 4 giờ (14400 giây).
-#     """
-#     print(f"\n--- 2. Phân tích Bật quá lâu (> {LONG_DURATION_SECONDS / 3600:.0f} giờ) ---")
-#     recommendations = []
-    
-#     try:
-#         conn = _get_db_connection()
-#         # ✅ SỬA QUERY: Không JOIN nữa, chỉ lấy 1 bản ghi mới nhất
-#         query = """
-#         SELECT created_at, state, time_s
-#         FROM fact_measurement
-#         ORDER BY created_at DESC
-#         LIMIT 1;
-#         """
-#         df = pd.read_sql_query(query, conn)
-#         conn.close()
-
-#         if df.empty:
-#             print("   (Không có dữ liệu để phân tích)")
-#             return recommendations
-
-#         row = df.iloc[0]
-#         is_on = (row['state'] == 1)
-#         time_s_duration = row['time_s'] if pd.notna(row['time_s']) else 0
-        
-#         print(f"   🔎 Trạng thái mới nhất: state={int(row['state'])}, "
-#               f"time_s={time_s_duration:.0f}s")
-
-#         if is_on and (time_s_duration > LONG_DURATION_SECONDS):
-#             hours_on = round(time_s_duration / 3600, 1)
-#             rec = f"   ⚠️ CẢNH BÁO: Đèn đã bật liên tục {hours_on} giờ. Bạn có quên tắt không?"
-#             print(rec)
-#             recommendations.append(rec)
-#         else:
-#             print("      (Trạng thái OK)")
-                
-#     except sqlite3.Error as e:
-#         print(f"   ❌ Lỗi SQLite khi phân tích bật lâu: {e}")
-#     except Exception as e:
-#          print(f"   ❌ Lỗi Pandas/Python: {e}")
-        
-#     return recommendations
 
 # ===================================================================
-# HÀM LUẬT 3: PHÂN TÍCH TIÊU THỤ CAO (✅ SỬA LOGIC THEO YÊU CẦU)
+# LUẬT 2: BẬT QUÁ LÂU (bản ghi mới nhất: state=1 và time_s > ngưỡng)
 # ===================================================================
-def analyze_high_consumption():
+def _summarize_long_duration(df, thresholds):
+    """Chỉ cần bản ghi cuối của khối."""
+    if df.empty:
+        return None
+    row = df.iloc[-1]
+    return {"state": row['state'], "time_s": row['time_s']}
+
+def _combine_long_duration(a, b, thresholds):
+    return a if b is None else b
+
+def _report_long_duration(row, thresholds, label):
     """
-    Luật 3 (Sửa đổi): Quét dữ liệu hôm nay, tìm các chuỗi state=1.
-    Trong mỗi chuỗi, tìm MAX(energy_wh) và so sánh với ngưỡng.
+    Luật 2 (Sửa đổi): Kiểm tra bản ghi MỚI NHẤT.
+    Nếu state=1 VÀ time_s > `long_duration_seconds` (mặc định 4 giờ).
     """
-    print(f"\n--- 3. Phân tích Tiêu thụ cao (Tìm MAX(energy_wh) trong chuỗi 'state=1') ---")
     recommendations = []
-    
-    try:
-        conn = _get_db_connection()
-        
-        # Lấy TẤT CẢ bản ghi của ngày hôm nay, sắp xếp từ cũ đến mới
-        query = f"""
-        SELECT created_at, state, energy_wh
-        FROM fact_measurement
-        WHERE date(created_at, 'localtime') = date('now', 'localtime')
-        ORDER BY created_at ASC;
-        """
-        df = pd.read_sql_query(query, conn, parse_dates=['created_at'])
-        conn.close()
+    if row is None:
+        print("   (Không có dữ liệu để phân tích)")
+        return recommendations
 
-        if df.empty or df['energy_wh'].isnull().all():
-            print(f"   (Chưa có dữ liệu năng lượng cho ngày hôm nay)")
-            return recommendations
-
-        list_of_max_energies = []
-        streak_start_time = None
-        current_streak_max_energy = 0.0
-        current_streak_end_time = None
-
-        print(f"   🔎 Đang quét {len(df)} bản ghi MỚI của hôm nay...")
-        
-        # Duyệt qua dữ liệu TỪ CŨ ĐẾN MỚI
-        for row in df.itertuples():
-            # (row[0] = Index, row[1] = created_at, row[2] = state, row[3] = energy_wh)
-            
-            if row.state == 1:
-                # Đèn đang BẬT (đang trong chuỗi)
-                if streak_start_time is None:
-                    # Đây là bản ghi BẮT ĐẦU chuỗi
-                    streak_start_time = row.created_at
-                    # Gán giá trị năng lượng đầu tiên (xử lý NaN)
-                    current_streak_max_energy = row.energy_wh if pd.notna(row.energy_wh) else 0.0
-                
-                # Cập nhật max energy và thời gian kết thúc
-                if pd.notna(row.energy_wh):
-                    current_streak_max_energy = max(current_streak_max_energy, row.energy_wh)
-                
-                current_streak_end_time = row.created_at # Luôn cập nhật thời điểm cuối
+    is_on = (row['state'] == 1)
+    time_s_duration = row['time_s'] if pd.notna(row['time_s']) else 0
 
-            else:
-                # Đèn TẮT (state == 0). Đây là lúc kết thúc chuỗi.
-                if streak_start_time is not None:
-                    list_of_max_energies.append(current_streak_max_energy)
-                    if current_streak_max_energy > HIGH_ENERGY_THRESHOLD_WH:
-                        rec = (
-                            f"   ⚡️ CẢNH BÁO: Tiêu thụ vượt ngưỡng! {current_streak_max_energy:.0f} Wh / {HIGH_ENERGY_THRESHOLD_WH}. "
-                            f"từ {streak_start_time} đến {current_streak_end_time}."
-                        )
-                        print(rec)
-                        recommendations.append(rec)
-
-                # Reset
-                streak_start_time = None
-                current_streak_max_energy = 0.0
-                current_streak_end_time = None
-        
-        # Xử lý Edge Case: Nếu file kết thúc mà đèn VẪN BẬT
-        if streak_start_time is not None:
-            list_of_max_energies.append(current_streak_max_energy)
-            if current_streak_max_energy > HIGH_ENERGY_THRESHOLD_WH:
+    print(f"   🔎 Trạng thái mới nhất: state={int(row['state'])}, "
+          f"time_s={time_s_duration:.0f}s")
+
+    if is_on and (time_s_duration > thresholds["long_duration_seconds"]):
+        hours_on = round(time_s_duration / 3600, 1)
+        rec = f"   ⚠️ CẢNH BÁO: Đèn đã bật liên tục {hours_on} giờ. Bạn có quên tắt không?"
+        print(rec)
+        recommendations.append(rec)
+    else:
+        print("      (Trạng thái OK)")
+    return recommendations
+
+# ===================================================================
+# LUẬT 3: TIÊU THỤ CAO (MAX(energy_wh) mỗi phiên 'state=1', từ fact_session)
+# ===================================================================
+def _summarize_high_consumption(df, thresholds):
+    """Phiên trong fact_session đã trọn vẹn -> chỉ cần giữ các cột hiển thị."""
+    return list(df[['start_at', 'end_at', 'max_energy_wh', 'is_open']].itertuples(index=False, name=None))
+
+def _combine_high_consumption(a, b, thresholds):
+    if a is None:
+        return b
+    a.extend(b)
+    return a
+
+def _report_high_consumption(sessions, thresholds, label):
+    """
+    Luật 3 (Sửa đổi): Lấy các phiên state=1 trong khoảng đã chọn từ fact_session
+    và so sánh MAX(energy_wh) của mỗi phiên với ngưỡng.
+    """
+    threshold = thresholds["high_energy_threshold_wh"]
+    recommendations = []
+    if not sessions or all(pd.isna(s[2]) for s in sessions):
+        print(f"   (Chưa có dữ liệu năng lượng cho {'ngày ' if label == 'hôm nay' else ''}{label})")
+        return recommendations
+
+    print(f"   🔎 Đang xét {len(sessions)} phiên bật đèn của {label}...")
+
+    for start_at, end_at, streak_max_energy, is_open in sessions:
+        if is_open:
+            # Phiên vẫn đang bật ở lần nạp gần nhất
+            if streak_max_energy > threshold:
                 rec = (
-                    f"   ⚡️ CẢNH BÁO: Tiêu thụ vượt ngưỡng! {current_streak_max_energy:.0f} Wh / {HIGH_ENERGY_THRESHOLD_WH}. "
-                    f"Đèn đã bật từ {streak_start_time} "
+                    f"   ⚡️ CẢNH BÁO: Tiêu thụ vượt ngưỡng! {streak_max_energy:.0f} Wh / {threshold}. "
+                    f"Đèn đã bật từ {start_at} "
                 )
                 print(rec)
                 recommendations.append(rec)
             else:
-                 print(f"      Đèn vẫn đang bật trong ngưỡng cho phép.{current_streak_max_energy:.0f} W.h ")
+                 print(f"      Đèn vẫn đang bật trong ngưỡng cho phép.{streak_max_energy:.0f} W.h ")
+        elif streak_max_energy > threshold:
+            rec = (
+                f"   ⚡️ CẢNH BÁO: Tiêu thụ vượt ngưỡng! {streak_max_energy:.0f} Wh / {threshold}. "
+                f"từ {start_at} đến {end_at}."
+            )
+            print(rec)
+            recommendations.append(rec)
+    return recommendations
 
-            # --- ✅ LOGIC MỚI: Tính tổng tiêu thụ trong ngày (Dùng df_total) ---
-        if list_of_max_energies:
-            total_wh_from_streaks = sum(list_of_max_energies)
-        print(f"   🔎 TỔNG TIÊU THỤ ĐIỆN TRONG NGÀY: {total_wh_from_streaks:.0f} Wh")
+# Thứ tự đăng ký = thứ tự chạy trong run_all_analyses()
+register_rule(
+    "waste", "1. Phân tích Lãng phí", "measurement",
+    ("created_at", "state", "presence"),
+    _summarize_waste, _combine_waste, _report_waste,
+    thresholds={"streak_target": STREAK_TARGET},
+)
+register_rule(
+    "long_duration", f"2. Phân tích Bật quá lâu (> {LONG_DURATION_SECONDS / 3600:.0f} giờ)", "measurement",
+    ("created_at", "state", "time_s"),
+    _summarize_long_duration, _combine_long_duration, _report_long_duration,
+    thresholds={"long_duration_seconds": LONG_DURATION_SECONDS},
+    enabled=False,  # Tạm tắt (giống bản cũ); bật lại bằng RULES["long_duration"]["enabled"] = True
+)
+register_rule(
+    "high_consumption", "3. Phân tích Tiêu thụ cao (Tìm MAX(energy_wh) trong chuỗi 'state=1')", "session",
+    ("start_at", "end_at", "max_energy_wh", "is_open"),
+    _summarize_high_consumption, _combine_high_consumption, _report_high_consumption,
+    thresholds={"high_energy_threshold_wh": HIGH_ENERGY_THRESHOLD_WH},
+)
 
+# ===================================================================
+# CÁC HÀM PHÂN TÍCH (giữ nguyên tên để menu / GUI gọi)
+# ===================================================================
+# start / end: date hoặc datetime (giờ địa phương); mặc định là hôm nay.
+# end là date thì tính trọn ngày đó. channel_ids: mặc định mọi channel đã nạp.
+def analyze_waste(start=None, end=None, channel_ids=None):
+    """Chỉ chạy Luật 1 (Lãng phí)."""
+    return _run_rules(["waste"], start, end, channel_ids)
 
-    except sqlite3.Error as e:
-        print(f"   ❌ Lỗi SQLite khi phân tích tiêu thụ: {e}")
-    except Exception as e:
-         print(f"   ❌ Lỗi Pandas/Python: {e}")
-        
-    return recommendations
+def analyze_long_duration(start=None, end=None, channel_ids=None):
+    """Chỉ chạy Luật 2 (Bật quá lâu)."""
+    return _run_rules(["long_duration"], start, end, channel_ids)
+
+def analyze_high_consumption(start=None, end=None, channel_ids=None):
+    """Chỉ chạy Luật 3 (Tiêu thụ cao)."""
+    return _run_rules(["high_consumption"], start, end, channel_ids)
 
 # ===================================================================
-# HÀM CHẠY TẤT CẢ (Không đổi)
+# HÀM CHẠY TẤT CẢ
 # ===================================================================
-def run_all_analyses():
+def run_all_analyses(start=None, end=None, channel_ids=None):
     """
-    Chạy tất cả 3 hàm phân tích và gộp kết quả.
+    Chạy tất cả luật đang bật trong 1 lượt: mỗi nguồn dữ liệu chỉ đọc 1 lần.
     """
     print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🧐 Bắt đầu phân tích toàn bộ...")
-    all_recs = []
-    
-    recs1 = analyze_waste()
-    all_recs.extend(recs1)
-    
-    # recs2 = analyze_long_duration()
-    # all_recs.extend(recs2)
-    
-    recs3 = analyze_high_consumption()
-    all_recs.extend(recs3)
-    
+    all_recs = _run_rules([name for name, rule in RULES.items() if rule["enabled"]], start, end, channel_ids)
+
     print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✅ Phân tích toàn bộ hoàn tất.")
     if not all_recs:
         print("   👍 Tổng kết: Không có cảnh báo hoặc đề xuất nào.")
@@ -264,4 +485,4 @@ def run_all_analyses():
 
 if __name__ == '__main__':
     # Cho phép chạy file này độc lập để test
-    run_all_analyses()
\ No newline at end of file
+    run_all_analyses()
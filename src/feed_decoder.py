@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import codecs
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+# ===================================================================
+# GIẢI MÃ JSON CỦA THINGSPEAK THEO LUỒNG -> CÁC CỘT CÓ KIỂU
+# ===================================================================
+# Đọc {"channel": {...}, "feeds": [{...}, ...]} từ các khối byte của phản hồi
+# HTTP, không giữ toàn bộ phản hồi hay danh sách dict của mọi feed:
+# - Mỗi lần nhận thêm dữ liệu, cắt phần mảng feeds đã trọn (tới dấu '}' cuối)
+#   và giải mã cả khối bằng 1 lần json.loads (C), rồi đổi ngay khối đó sang
+#   mảng NumPy theo cột (float64 / datetime64). Bộ nhớ đỉnh ~ các cột kết quả
+#   + 1 khối, thay vì (bytes phản hồi + dict Python cho mọi feed + DataFrame).
+# - Cắt nhầm (vd '}' nằm trong chuỗi) thì json.loads báo lỗi -> giải mã từng
+#   object một cho khối đó, nên kết quả luôn giống json.loads cả phản hồi.
+# Các field giữ float64 (NaN cho giá trị thiếu / không hợp lệ) như json_to_df.
+
+_BUFFER_TRIM = 1 << 16
+
+
+class _Columns:
+    """Gom các khối feed thành cột: created_at, entry_id và các field."""
+
+    def __init__(self, fields=None):
+        # Không chỉ định -> lấy các key field* của feed đầu tiên (giống json_to_df)
+        self.fields = list(fields) if fields else None
+        self._parts = {}
+
+    def add_batch(self, feeds):
+        if not feeds:
+            return
+        if self.fields is None:
+            self.fields = [k for k in feeds[0] if k.startswith("field")]
+
+        self._append("created_at", _time_column([f.get("created_at") for f in feeds]))
+        self._append("entry_id", _float_column([f.get("entry_id") for f in feeds]))
+        for fld in self.fields:
+            self._append(fld, _float_column([f.get(fld) for f in feeds]))
+
+    def _append(self, name, values):
+        self._parts.setdefault(name, []).append(values)
+
+    def to_arrays(self):
+        """dict cột NumPy: created_at (datetime64, UTC), entry_id (int64 nếu không thiếu), các field (float64)."""
+        if not self._parts:
+            return {"created_at": np.array([], dtype="datetime64[s]"), "entry_id": np.array([], dtype="int64")}
+
+        columns = {name: np.concatenate(parts) for name, parts in self._parts.items()}
+        if not np.isnan(columns["entry_id"]).any():
+            columns["entry_id"] = columns["entry_id"].astype("int64")
+        return columns
+
+
+def _time_column(values):
+    """list chuỗi thời gian -> datetime64 theo UTC (không kèm múi giờ); không hợp lệ -> NaT."""
+    text = np.array(values)
+    # Định dạng của ThingSpeak 'YYYY-mm-ddTHH:MM:SSZ': bỏ 'Z' rồi để NumPy đọc thẳng
+    if text.dtype == "<U20" and np.char.endswith(text, "Z").all():
+        try:
+            return text.astype("<U19").astype("datetime64[s]")
+        except ValueError:
+            pass
+    times = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", utc=True)
+    return times.dt.tz_convert(None).to_numpy()
+
+def _float_column(values):
+    """list giá trị JSON -> float64; None / chuỗi không phải số -> NaN."""
+    try:
+        return np.array(values, dtype="float64")
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(
+            dtype="float64", na_value=np.nan)
+
+
+class _StreamScanner:
+    """Đọc văn bản JSON theo từng khối, giải mã từng giá trị ở vị trí hiện tại."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Đọc thêm 1 khối; False nếu đã hết dữ liệu."""
+        if self.eof:
+            return False
+        # Bỏ phần đã xử lý để buffer không lớn dần theo kích thước phản hồi
+        if self.pos > _BUFFER_TRIM:
+            self.buf, self.pos = self.buf[self.pos:], 0
+        for chunk in self._chunks:
+            text = self._decode.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        self.buf += self._decode.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Ký tự khác khoảng trắng kế tiếp ('' nếu hết dữ liệu)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON không hợp lệ: cần '{char}' tại vị trí {self.pos}")
+        self.pos += 1
+
+    def skip(self, char):
+        if self.peek() == char:
+            self.pos += 1
+
+    def value(self):
+        """Giải mã 1 giá trị JSON (đọc thêm khối nếu giá trị chưa trọn)."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+                # Giá trị chạm cuối buffer có thể chưa trọn (vd: số bị cắt) -> đọc thêm
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def array_batch(self):
+        """
+        Các phần tử đã trọn của mảng đang đọc, trong buffer hiện có (ít nhất 1 phần tử).
+        Dừng trước ']' đóng mảng.
+        """
+        # Thử '}' cuối buffer, rồi '}' liền trước (khối cuối: '}' cuối là của object ngoài cùng)
+        cut = len(self.buf)
+        for _ in range(2):
+            cut = self.buf.rfind("}", self.pos, cut)
+            if cut <= self.pos:
+                break
+            try:
+                batch = json.loads("[" + self.buf[self.pos:cut + 1] + "]")
+            except json.JSONDecodeError:
+                continue
+            self.pos = cut + 1
+            self.skip(",")
+            return batch
+        batch = [self.value()]
+        self.skip(",")
+        return batch
+
+
+def decode_feeds(chunks, fields=None):
+    """
+    Giải mã phản hồi feeds.json của ThingSpeak từ các khối byte (vd: iter_content).
+    Trả về (channel_info, dict cột NumPy) - xem _Columns.to_arrays().
+    """
+    scanner = _StreamScanner(chunks)
+    columns = _Columns(fields)
+    channel_info = {}
+
+    scanner.expect("{")
+    while scanner.peek() != "}":
+        key = scanner.value()
+        scanner.expect(":")
+        if key == "feeds":
+            scanner.expect("[")
+            while scanner.peek() != "]":
+                columns.add_batch(scanner.array_batch())
+            scanner.pos += 1
+        else:
+            value = scanner.value()
+            if key == "channel":
+                channel_info = value
+        scanner.skip(",")
+    return channel_info, columns.to_arrays()
@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import random
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+
+# Mã lỗi tạm thời -> thử lại (429: bị giới hạn tần suất)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# ===================================================================
+# HTTP CLIENT DÙNG CHUNG: keep-alive, retry/backoff, conditional request
+# ===================================================================
+class ThingSpeakClient:
+    """
+    Client HTTP dùng chung cho toàn bộ extractor:
+    - 1 requests.Session (keep-alive) với connection pool giới hạn.
+    - Thử lại với exponential backoff + jitter, tôn trọng header Retry-After.
+    - Conditional request (If-None-Match / If-Modified-Since) nếu server trả ETag/Last-Modified.
+    - Bộ đếm: số request, số lần thử lại, số byte nhận, số phản hồi 304.
+    """
+
+    def __init__(self, pool_size=None, max_retries=None, backoff_base=None,
+                 backoff_max=None, timeout=None, validator_cache_size=64):
+        self.pool_size = pool_size or config.HTTP_POOL_SIZE
+        self.max_retries = config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = config.HTTP_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = config.HTTP_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.timeout = timeout or config.HTTP_TIMEOUT
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # (url, params) -> (etag, last_modified, json) của phản hồi 200 gần nhất
+        self._validators = OrderedDict()
+        self._validator_cache_size = validator_cache_size
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "bytes": 0, "not_modified": 0, "errors": 0}
+
+    # ------------------------------------------------------------------
+    def get_json(self, url, params=None):
+        """GET url và trả về JSON; tự thử lại khi lỗi mạng/lỗi tạm thời."""
+        params = params or {}
+        key = (url, tuple(sorted(params.items())))
+        cached = self._get_validator(key)
+
+        headers = {}
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        r = self._send(url, params, headers)
+        if r.status_code == 304 and cached:
+            # Dữ liệu không đổi so với lần trước -> dùng lại JSON đã có
+            self._count("not_modified")
+            return cached[2]
+
+        r.raise_for_status()
+        js = r.json()
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        if etag or last_modified:
+            self._set_validator(key, (etag, last_modified, js))
+        return js
+
+    def iter_content(self, url, params=None, chunk_size=64 * 1024):
+        """
+        GET url và trả về từng khối byte của thân phản hồi (không đọc hết vào bộ nhớ).
+        Thử lại như get_json cho tới khi nhận được phản hồi; lỗi giữa chừng khi
+        đang đọc thì không thử lại (người gọi đã xử lý một phần dữ liệu).
+        """
+        r = self._send(url, params or {}, {}, stream=True)
+        with r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                self._count("bytes", len(chunk))
+                yield chunk
+
+    def _send(self, url, params, headers, stream=False):
+        """Gửi GET, thử lại khi lỗi mạng / mã lỗi tạm thời. Trả về Response cuối cùng."""
+        attempt = 0
+        while True:
+            try:
+                r = self.session.get(url, params=params, headers=headers, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._count("errors")
+                if attempt >= self.max_retries:
+                    raise
+                self._wait(attempt, None, reason=str(e))
+                attempt += 1
+                continue
+
+            self._count("requests")
+            if not stream:
+                self._count("bytes", len(r.content))
+
+            if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                r.close()
+                self._wait(attempt, r.headers.get("Retry-After"), reason=f"HTTP {r.status_code}")
+                attempt += 1
+                continue
+            return r
+
+    def get_stats(self):
+        """Trả về bản sao các bộ đếm."""
+        with self._lock:
+            return dict(self._stats)
+
+    # ------------------------------------------------------------------
+    def _wait(self, attempt, retry_after, reason=""):
+        delay = self._retry_after_seconds(retry_after)
+        if delay is None:
+            # Full jitter: ngẫu nhiên trong [0, min(max, base * 2^attempt)]
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        self._count("retries")
+        print(f"   [API] ⏳ {reason} -> thử lại sau {delay:.1f}s (lần {attempt + 1}/{self.max_retries})")
+        time.sleep(delay)
+
+    def _retry_after_seconds(self, value):
+        """Retry-After có thể là số giây hoặc một mốc thời gian HTTP."""
+        if not value:
+            return None
+        try:
+            return min(self.backoff_max, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return min(self.backoff_max, max(0.0, (when - datetime.now(timezone.utc)).total_seconds()))
+        except (TypeError, ValueError):
+            return None
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _get_validator(self, key):
+        with self._lock:
+            if key in self._validators:
+                self._validators.move_to_end(key)
+                return self._validators[key]
+            return None
+
+    def _set_validator(self, key, value):
+        with self._lock:
+            self._validators[key] = value
+            self._validators.move_to_end(key)
+            while len(self._validators) > self._validator_cache_size:
+                self._validators.popitem(last=False)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Client dùng chung cho cả tiến trình (tạo khi cần)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ThingSpeakClient()
+        return _client
@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from src.utils import load_channels_to_dwh
+from database.connection import read_connection
+
+# ===================================================================
+# SERVER NHẬN DỮ LIỆU ĐẨY (tương thích ThingSpeak /update)
+# ===================================================================
+# Thiết bị chỉ cần đổi địa chỉ server: cùng payload như ThingSpeak.writeFields
+# (api_key, field1..field5, status, created_at tùy chọn) qua GET hoặc POST.
+# - Mỗi request được xếp vào hàng đợi; 1 luồng gom hàng đợi thành lô (đủ
+#   INGEST_BATCH_SIZE bản ghi hoặc sau INGEST_FLUSH_INTERVAL_S giây) rồi nạp cả lô
+#   (nhiều channel) trong 1 transaction bằng load_channels_to_dwh (cùng
+#   transform/INSERT/rollup với ETL).
+# - Request chỉ được trả entry_id (200) SAU KHI lô chứa nó đã commit; entry_id
+#   được cấp lúc nạp nên lô lỗi không làm nhảy số. Lô lỗi / hàng đợi đầy
+#   -> 503 + Retry-After, thiết bị gửi lại ở chu kỳ sau.
+# fact_measurement chưa có cột status nên status được nhận nhưng không lưu.
+
+# field của thiết bị -> cột DB (giống thứ tự trong _codeWokwi/sketch.ino)
+FIELD_TO_COLUMN = {
+    "field1": "power_w",
+    "field2": "energy_wh",
+    "field3": "presence",
+    "field4": "state",
+    "field5": "time_s",
+}
+
+API_KEY_HEADER = "X-THINGSPEAKAPIKEY"
+
+
+class IngestBatcher:
+    """
+    Gom bản ghi đẩy vào thành lô và nạp trên 1 luồng riêng.
+    entry_id của mỗi channel chỉ được cấp / tăng trên luồng nạp, khi lô đã commit.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, queue_max=None):
+        self.batch_size = batch_size or config.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or config.INGEST_FLUSH_INTERVAL_S
+        self._queue = queue.Queue(maxsize=queue_max or config.INGEST_QUEUE_MAX)
+        self._entry_ids = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="ingest-flusher", daemon=True)
+        self._stats = {"accepted": 0, "rejected": 0, "batches": 0, "loaded": 0, "failed": 0}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Dừng nhận và nạp nốt những gì còn trong hàng đợi."""
+        self._stop.set()
+        self._thread.join()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+    def submit(self, channel_id, created_at, values):
+        """
+        Xếp 1 bản ghi vào hàng đợi. Trả về Future cho entry_id (có kết quả khi lô
+        đã commit; None nếu nạp lỗi), hoặc None nếu hàng đợi đầy.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((channel_id, created_at, values, future))
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            return None
+        with self._lock:
+            self._stats["accepted"] += 1
+        return future
+
+    def _loop(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        t0 = time.perf_counter()
+        # Cấp entry_id tiếp theo của từng channel (chỉ giữ lại nếu lô commit thành công)
+        next_ids = {}
+        entry_ids = []
+        try:
+            rows = []
+            for cid, created_at, values, _ in batch:
+                if cid not in next_ids:
+                    if cid not in self._entry_ids:
+                        self._entry_ids[cid] = _max_entry_id(cid)
+                    next_ids[cid] = self._entry_ids[cid]
+                next_ids[cid] += 1
+                entry_ids.append(next_ids[cid])
+                rows.append(dict(values, channel_id=cid, entry_id=next_ids[cid], created_at=created_at))
+            df = pd.DataFrame(rows, columns=["channel_id", "created_at", "entry_id", *FIELD_TO_COLUMN.values()])
+            ok = load_channels_to_dwh(df)
+        except Exception as e:
+            print(f"   [Ingest] ❌ Lỗi khi nạp lô: {e}")
+            ok = False
+
+        if ok:
+            self._entry_ids.update(next_ids)
+        for i, (_, _, _, future) in enumerate(batch):
+            future.set_result(entry_ids[i] if ok else None)
+
+        n_channels = len(next_ids)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["loaded" if ok else "failed"] += len(batch)
+        status = "✅" if ok else "❌ Thất bại:"
+        print(f"   [Ingest] {status} Nạp {len(batch)} bản ghi / {n_channels} channel "
+              f"trong {(time.perf_counter() - t0) * 1000:.0f} ms (đang chờ {self._queue.qsize()}).")
+
+
+def _max_entry_id(channel_id):
+    """entry_id lớn nhất đã có của channel (tiếp tục đánh số sau khi khởi động lại)."""
+    with read_connection() as conn:
+        row = conn.execute(
+            "SELECT MAX(entry_id) FROM fact_measurement WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+    return row[0] or 0
+
+
+def _parse_created_at(value):
+    """created_at tùy chọn (ISO 8601); không có múi giờ -> coi là UTC. Trả về chuỗi dạng ThingSpeak."""
+    if not value:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    ts = pd.Timestamp(value)
+    ts = ts.tz_convert("UTC") if ts.tzinfo is not None else ts
+    return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class _UpdateHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: thiết bị / client tái sử dụng kết nối
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._handle(url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", errors="replace") if length else ""
+        params = dict(parse_qsl(url.query))
+        if "json" in (self.headers.get("Content-Type") or ""):
+            try:
+                params.update(json.loads(body or "{}"))
+            except ValueError:
+                return self._reply(400, "0")
+        else:
+            params.update(parse_qsl(body))
+        self._handle(url.path, params)
+
+    def _handle(self, path, params):
+        if path not in ("/update", "/update.json"):
+            return self._reply(404, "0")
+
+        api_key = params.get("api_key") or self.headers.get(API_KEY_HEADER)
+        channel_id = config.INGEST_WRITE_KEYS.get(api_key)
+        if channel_id is None:
+            return self._reply(401, "0")
+
+        values = {col: params.get(field) for field, col in FIELD_TO_COLUMN.items()}
+        if all(v is None for v in values.values()):
+            return self._reply(400, "0")
+        try:
+            created_at = _parse_created_at(params.get("created_at"))
+        except ValueError:
+            return self._reply(400, "0")
+
+        # Chờ lô chứa bản ghi commit xong mới trả entry_id (không xác nhận bản ghi chưa lưu)
+        future = self.server.batcher.submit(str(channel_id), created_at, values)
+        entry_id = future.result() if future is not None else None
+        if entry_id is None:
+            return self._reply(503, "0", {"Retry-After": "1"})
+
+        if path == "/update.json":
+            return self._reply(200, json.dumps({
+                "channel_id": int(channel_id) if str(channel_id).isdigit() else channel_id,
+                "created_at": created_at,
+                "entry_id": entry_id,
+                **{field: params.get(field) for field in FIELD_TO_COLUMN},
+                "status": params.get("status"),
+            }), content_type="application/json")
+        self._reply(200, str(entry_id))
+
+    def _reply(self, code, body, headers=None, content_type="text/plain"):
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Không in từng request (hàng nghìn thiết bị); xem IngestBatcher.get_stats()
+        pass
+
+
+class IngestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher):
+        super().__init__(address, _UpdateHandler)
+        self.batcher = batcher
+
+    def stop(self):
+        """Ngừng nhận request, rồi nạp nốt hàng đợi."""
+        self.shutdown()
+        self.server_close()
+        self.batcher.close()
+
+
+def start_ingest_server(host=None, port=None):
+    """Khởi động server + luồng gom lô (chạy nền). Trả về IngestServer; gọi .stop() để dừng."""
+    batcher = IngestBatcher().start()
+    server = IngestServer((host or config.INGEST_HOST, config.INGEST_PORT if port is None else port), batcher)
+    threading.Thread(target=server.serve_forever, name="ingest-http", daemon=True).start()
+    print(f"[Ingest] 📡 Đang nhận dữ liệu tại http://{server.server_address[0]}:{server.server_address[1]}/update")
+    return server
+
+
+if __name__ == "__main__":
+    from database.create import create_database_schema
+
+    create_database_schema()
+    server = start_ingest_server()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"[Ingest] 📊 {server.batcher.get_stats()}")
+    except KeyboardInterrupt:
+        print("\n[Ingest] 🛑 Đang dừng (nạp nốt hàng đợi)...")
+        server.stop()
@@ -0,0 +1,143 @@
+import os
+import sys
+import queue
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+# ===================================================================
+# TÁC VỤ NỀN: LOG TRỰC TIẾP + HỦY HỢP TÁC
+# ===================================================================
+# - LogChannel: thay stdout trong lúc chạy tác vụ; mỗi dòng print() thành
+#   1 bản ghi (giờ, mức, nội dung) trong hàng đợi an toàn đa luồng, để GUI
+#   lấy ra theo từng khung hình thay vì chờ tác vụ kết thúc.
+# - Hủy hợp tác: Job.cancel() bật cờ; các vòng lặp dài (ETL, backfill,
+#   phân tích) gọi check_cancelled() giữa các bước và dừng bằng JobCancelled.
+
+class JobCancelled(Exception):
+    """Tác vụ bị người dùng hủy."""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._event.is_set()
+
+
+# Token của tác vụ đang chạy (mỗi lúc tối đa 1 tác vụ); các luồng con của
+# tác vụ (thread pool ETL/backfill) cũng thấy được nên không cần truyền tham số.
+_active_token = None
+
+def check_cancelled():
+    """Điểm kiểm tra trong vòng lặp dài: raise JobCancelled nếu tác vụ hiện tại đã bị hủy."""
+    token = _active_token
+    if token is not None and token.is_cancelled:
+        raise JobCancelled("Tác vụ đã bị hủy.")
+
+
+def _level_of(line):
+    """Phân loại dòng log theo biểu tượng mà các module đang dùng."""
+    if "❌" in line or "LỖI" in line:
+        return "error"
+    if "⚠️" in line or "❗️" in line or "⚡️" in line:
+        return "warning"
+    if "✅" in line or "👍" in line:
+        return "success"
+    return "info"
+
+
+class LogChannel:
+    """Đối tượng kiểu file (dùng với redirect_stdout) đẩy từng dòng vào hàng đợi."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._partial = ""
+        self._lock = threading.Lock()
+        self.line_count = 0
+
+    def write(self, text):
+        # Nhiều luồng cùng print -> khóa để không trộn lẫn phần dòng dở
+        with self._lock:
+            lines = (self._partial + text).split("\n")
+            self._partial = lines.pop()
+        for line in lines:
+            self.put(line)
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            line, self._partial = self._partial, ""
+        if line:
+            self.put(line)
+
+    def put(self, line, level=None):
+        if line.strip():
+            with self._lock:
+                self.line_count += 1
+            self._queue.put((datetime.now().strftime("%H:%M:%S"), level or _level_of(line), line))
+
+    def drain(self, max_items=500):
+        """Lấy tối đa max_items bản ghi đang chờ (không chặn)."""
+        records = []
+        while len(records) < max_items:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def empty(self):
+        return self._queue.empty()
+
+
+class Job:
+    """Chạy func() trên luồng nền, log đi qua LogChannel, có thể hủy bằng cancel()."""
+
+    def __init__(self, label, func):
+        self.label = label
+        self.func = func
+        self.logs = LogChannel()
+        self.token = CancelToken()
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        if not self.done.is_set():
+            self.token.cancel()
+            self.logs.put(f"⏹ Đang hủy: {self.label} (dừng ở điểm kiểm tra kế tiếp)...", "warning")
+
+    @property
+    def cancelled(self):
+        return isinstance(self.error, JobCancelled)
+
+    def is_alive(self):
+        return not self.done.is_set()
+
+    def _run(self):
+        global _active_token
+        _active_token = self.token
+        try:
+            with redirect_stdout(self.logs):
+                self.result = self.func()
+        except Exception as exc:
+            self.error = exc
+        finally:
+            _active_token = None
+            self.logs.flush()
+            self.done.set()
@@ -0,0 +1,325 @@
+import os
+import sys
+import time
+import queue
+import threading
+from datetime import datetime
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from src.utils import (
+    get_last_timestamp, plan_new_data, json_to_df, fetch_window, prepare_records, load_records,
+)
+from src.jobs import JobCancelled, check_cancelled
+
+# ===================================================================
+# PIPELINE ETL: EXTRACT -> TRANSFORM -> LOAD CHẠY GỐI NHAU
+# ===================================================================
+# [fetch x ETL_WORKERS] --q1--> [transform x 1] --q2--> [load: luồng gọi -> luồng ghi SQLite]
+# - Đơn vị công việc là 1 TRANG: lần gọi tăng dần của 1 channel, hoặc 1 cửa sổ
+#   backfill (BACKFILL_WINDOW_HOURS giờ). Nhờ vậy mạng, CPU và SQLite cùng bận
+#   trong lúc backfill thay vì chờ tải xong cả lịch sử mới bắt đầu nạp.
+# - q1, q2 có giới hạn (PIPELINE_QUEUE_SIZE): tầng sau chậm thì tầng trước bị
+#   chặn lại (backpressure), bộ nhớ không tăng theo độ dài lịch sử.
+# - Trang của cùng 1 channel được nạp ĐÚNG THỨ TỰ (rollup / phiên / watermark
+#   cần thứ tự thời gian); trang về sớm được giữ lại chờ trang trước. Số trang
+#   đang xử lý (đang tải + trong hàng đợi + đang giữ) bị giới hạn nên 1 cửa sổ
+#   tải chậm không làm các trang sau dồn lại trong bộ nhớ.
+#   1 trang lỗi -> bỏ các trang sau của channel đó (tránh để lại lỗ hổng sau
+#   watermark); lần ETL sau sẽ tải lại từ watermark.
+
+_DONE = object()
+_POLL_S = 0.2
+
+class _StageStats:
+    """Thống kê 1 tầng: số trang, số bản ghi, thời gian làm việc / bị chặn, độ sâu hàng đợi đầu ra."""
+
+    def __init__(self, name, threads):
+        self.name = name
+        self.threads = threads
+        self.pages = 0
+        self.rows = 0
+        self.busy_s = 0.0
+        self.blocked_s = 0.0
+        self.depth_max = 0
+        self._depth_sum = 0
+        self._depth_n = 0
+        self._lock = threading.Lock()
+
+    def record(self, rows, busy_s):
+        with self._lock:
+            self.pages += 1
+            self.rows += rows
+            self.busy_s += busy_s
+
+    def record_put(self, depth, blocked_s):
+        with self._lock:
+            self.blocked_s += blocked_s
+            self.depth_max = max(self.depth_max, depth)
+            self._depth_sum += depth
+            self._depth_n += 1
+
+    def as_dict(self, wall_s):
+        rate = self.rows / self.busy_s if self.busy_s else 0.0
+        return {
+            "pages": self.pages, "rows": self.rows,
+            "busy_s": self.busy_s, "blocked_s": self.blocked_s,
+            "rows_per_s": rate,
+            # tỉ lệ thời gian các luồng của tầng thực sự làm việc -> tầng cao nhất là nút thắt
+            "utilization": self.busy_s / (wall_s * self.threads) if wall_s else 0.0,
+            "queue_max": self.depth_max,
+            "queue_avg": self._depth_sum / self._depth_n if self._depth_n else 0.0,
+        }
+
+
+class EtlPipeline:
+    """1 chu trình ETL cho danh sách channel [(channel_id, api_key)]; gọi run()."""
+
+    def __init__(self, channels, fetch_workers=None, queue_size=None):
+        self.channels = channels
+        self.fetch_workers = max(1, fetch_workers or config.ETL_WORKERS)
+        size = queue_size or config.PIPELINE_QUEUE_SIZE
+        self._tasks = queue.Queue()                    # trang cần tải (không giới hạn: chỉ là kế hoạch)
+        self._fetched = queue.Queue(maxsize=size)      # fetch -> transform
+        self._ready = queue.Queue(maxsize=size)        # transform -> load
+        self._outstanding = len(channels)
+        self._credits = threading.Semaphore(self.fetch_workers + 3 * size)
+        self._outstanding_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._fetch_done = threading.Event()
+        self.stats = {
+            "fetch": _StageStats("fetch", self.fetch_workers),
+            "transform": _StageStats("transform", 1),
+            "load": _StageStats("load", 1),
+        }
+        self.report = {
+            cid: {"rows": 0, "pages": 0, "extract_s": 0.0, "load_s": 0.0, "ok": True, "error": None,
+                  "exception": None}
+            for cid, _ in channels
+        }
+
+    # ---------------------------------------------------------------
+    # Điều phối
+    # ---------------------------------------------------------------
+    def run(self):
+        """Chạy tới khi nạp xong mọi trang. Trả về báo cáo theo channel (như ETL tuần tự)."""
+        t0 = time.perf_counter()
+        for cid, key in self.channels:
+            self._tasks.put(("plan", cid, key, None))
+
+        threads = [threading.Thread(target=self._fetch_loop, name=f"etl-fetch-{i}", daemon=True)
+                   for i in range(self.fetch_workers)]
+        threads.append(threading.Thread(target=self._transform_loop, name="etl-transform", daemon=True))
+        for t in threads:
+            t.start()
+        try:
+            self._load_loop()
+        finally:
+            # Bình thường các luồng đã tự kết thúc; khi hủy / lỗi thì báo dừng
+            self._stop.set()
+            for t in threads:
+                t.join()
+        self.wall_s = time.perf_counter() - t0
+        return self.report
+
+    def get_stats(self):
+        wall_s = getattr(self, "wall_s", 0.0)
+        return {name: st.as_dict(wall_s) for name, st in self.stats.items()}
+
+    def print_stats(self):
+        stats = self.get_stats()
+        print(f"\n--- [Pipeline] Thống kê theo tầng ({self.wall_s:.2f}s) ---")
+        for name, st in stats.items():
+            queue_info = (f" | hàng đợi ra: tối đa {st['queue_max']}, TB {st['queue_avg']:.1f}"
+                          f" / {self._fetched.maxsize}, bị chặn {st['blocked_s']:.2f}s"
+                          if name != "load" else "")
+            print(f"   [Pipeline] {name:<9}: {st['pages']} trang | {st['rows']} bản ghi | "
+                  f"{st['rows_per_s']:.0f} bản ghi/s | bận {st['utilization'] * 100:.0f}%{queue_info}")
+        bottleneck = max(stats, key=lambda name: stats[name]["utilization"])
+        print(f"   [Pipeline] Nút thắt: {bottleneck}")
+
+    def _put(self, q, item, stats):
+        """put có giới hạn, nhường khi pipeline dừng. Ghi nhận thời gian bị chặn (backpressure)."""
+        t0 = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_S)
+            except queue.Full:
+                continue
+            stats.record_put(q.qsize(), time.perf_counter() - t0)
+            return True
+        return False
+
+    def _get(self, q):
+        """get có thời hạn để kiểm tra dừng / hủy; None nếu pipeline dừng."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_S)
+            except queue.Empty:
+                check_cancelled()
+        return None
+
+    # ---------------------------------------------------------------
+    # Tầng 1: fetch (nhiều luồng)
+    # ---------------------------------------------------------------
+    def _fetch_loop(self):
+        while not self._stop.is_set():
+            # Mỗi trang giữ 1 "suất" từ lúc bắt đầu tải tới khi được nạp xong
+            if not self._credits.acquire(timeout=_POLL_S):
+                continue
+            try:
+                task = self._tasks.get(timeout=_POLL_S)
+            except queue.Empty:
+                self._credits.release()
+                if self._fetch_done.is_set():
+                    return
+                continue
+            produced = False
+            try:
+                produced = self._fetch_task(*task)
+            finally:
+                if not produced:
+                    self._credits.release()
+                self._task_finished()
+
+    def _add_tasks(self, tasks):
+        with self._outstanding_lock:
+            self._outstanding += len(tasks)
+        for task in tasks:
+            self._tasks.put(task)
+
+    def _task_finished(self):
+        with self._outstanding_lock:
+            self._outstanding -= 1
+            finished = self._outstanding == 0
+        if finished:
+            self._fetch_done.set()
+            self._put(self._fetched, _DONE, self.stats["fetch"])
+
+    def _fetch_task(self, kind, cid, key, arg):
+        """Tải 1 trang và chuyển sang tầng transform. True nếu đã tạo ra 1 trang."""
+        t0 = time.perf_counter()
+        seq, df, error = 0, None, None
+        try:
+            check_cancelled()
+            if kind == "plan":
+                df = self._plan_channel(cid, key)
+            else:
+                seq, (lo, hi) = arg
+                _, df = fetch_window(cid, key, lo, hi)
+        except JobCancelled:
+            self._stop.set()
+            return False
+        except Exception as e:
+            error = e
+        if kind == "plan" and df is None and error is None:
+            return False   # đã chia thành các cửa sổ backfill
+        elapsed = time.perf_counter() - t0
+        self.stats["fetch"].record(0 if df is None else len(df), elapsed)
+        return self._put(self._fetched, (cid, seq, df, error, elapsed, 0.0), self.stats["fetch"])
+
+    def _plan_channel(self, cid, key):
+        """
+        Lập kế hoạch bằng utils.plan_new_data (dùng chung với fetch_new_data). Cần backfill
+        -> trả về None, mỗi cửa sổ thành 1 trang được xếp vào hàng đợi.
+        """
+        print(f"\n--- Đang xử lý Channel {cid} ---")
+        df, windows = plan_new_data(cid, key, get_last_timestamp(cid))
+        if windows is None:
+            return df
+        if not windows:
+            return json_to_df({})
+        self._add_tasks([("window", cid, key, (seq, window)) for seq, window in enumerate(windows)])
+        return None
+
+    # ---------------------------------------------------------------
+    # Tầng 2: transform (1 luồng)
+    # ---------------------------------------------------------------
+    def _transform_loop(self):
+        stats = self.stats["transform"]
+        while True:
+            try:
+                item = self._get(self._fetched)
+            except JobCancelled:
+                self._stop.set()
+                return
+            if item is None:
+                return
+            if item is _DONE:
+                self._put(self._ready, _DONE, stats)
+                return
+
+            cid, seq, df, error, fetch_s, _ = item
+            records = None
+            t0 = time.perf_counter()
+            if error is None and not df.empty:
+                try:
+                    records = prepare_records(df, cid)
+                    if records is None:
+                        error = ValueError(f"Không có cột nào khớp CSV_TO_DB_MAP: {list(df.columns)}")
+                except Exception as e:
+                    error = e
+            elapsed = time.perf_counter() - t0
+            stats.record(len(records or ()), elapsed)
+            self._put(self._ready, (cid, seq, records, error, fetch_s, elapsed), stats)
+
+    # ---------------------------------------------------------------
+    # Tầng 3: load (luồng gọi; ghi qua luồng ghi SQLite duy nhất)
+    # ---------------------------------------------------------------
+    def _load_loop(self):
+        next_seq = {cid: 0 for cid, _ in self.channels}
+        held = {}   # (cid, seq) -> trang về sớm, chờ trang trước của cùng channel
+        while True:
+            check_cancelled()
+            item = self._get(self._ready)
+            if item is None or item is _DONE:
+                break
+            cid, seq = item[0], item[1]
+            held[(cid, seq)] = item
+            while (cid, next_seq[cid]) in held:
+                self._load_page(*held.pop((cid, next_seq[cid])))
+                next_seq[cid] += 1
+                self._credits.release()
+        check_cancelled()
+
+        for cid, r in self.report.items():
+            if r["ok"] and not r["rows"]:
+                print(f"   [E] ⚠️ Channel {cid} không có dữ liệu mới.")
+
+    def _load_page(self, cid, seq, records, error, fetch_s, transform_s):
+        r = self.report[cid]
+        r["pages"] += 1
+        r["extract_s"] += fetch_s + transform_s
+        if not r["ok"]:
+            return   # channel đã lỗi ở trang trước -> không nạp tiếp (tránh lỗ hổng dữ liệu)
+        if error is not None:
+            print(f"   [!] ❌ LỖI NGHIÊM TRỌNG khi xử lý Channel {cid}: {error}")
+            r["ok"], r["error"], r["exception"] = False, str(error), error
+            return
+        if not records:
+            return
+
+        t0 = time.perf_counter()
+        print(f"   [DB] Đang nạp {len(records)} bản ghi (Channel {cid}, trang {seq + 1})...")
+        inserted = load_records(records, cid)
+        elapsed = time.perf_counter() - t0
+        self.stats["load"].record(len(records), elapsed)
+        # Chỉ tính bản ghi thực sự được chèn (bản ghi biên tải lại ở mỗi lần gọi bị bỏ qua)
+        r["rows"] += inserted or 0
+        r["load_s"] += elapsed
+        if inserted is None:
+            r["ok"], r["error"] = False, "Nạp dữ liệu thất bại"
+            r["exception"] = RuntimeError(r["error"])
+
+
+def run_etl_pipeline(channels):
+    """Chạy pipeline ETL cho các channel, in thống kê theo tầng. Trả về (báo cáo theo channel, thống kê)."""
+    pipeline = EtlPipeline(channels)
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [Pipeline] {len(channels)} channel | "
+          f"{pipeline.fetch_workers} luồng tải | hàng đợi {pipeline._fetched.maxsize} trang")
+    report = pipeline.run()
+    pipeline.print_stats()
+    return report, pipeline.get_stats()
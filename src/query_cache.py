@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from database.connection import data_version
+
+# ===================================================================
+# CACHE KẾT QUẢ TRUY VẤN (LRU, theo phiên bản dữ liệu)
+# ===================================================================
+# Khóa = (phiên bản dữ liệu, tên truy vấn, tham số). Khi luồng ghi commit
+# (vd: load_dataframe_to_dwh) phiên bản đổi -> khóa cũ không còn được dùng
+# và dần bị đẩy ra theo LRU. Bấm lại khi chưa có dữ liệu mới -> trả ngay.
+
+class QueryCache:
+    """Cache LRU giới hạn số phần tử, an toàn đa luồng."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._items[key]
+            self._stats["misses"] += 1
+
+        # Tính ngoài khóa để các truy vấn khác không phải chờ
+        value = compute()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._items))
+
+
+query_cache = QueryCache(config.QUERY_CACHE_SIZE)
+
+def cached_query(name, params, compute):
+    """
+    Trả kết quả compute() cho (name, params) ở phiên bản dữ liệu hiện tại.
+    Kết quả được dùng chung giữa các lần gọi -> người gọi không được sửa nó.
+    """
+    return query_cache.get_or_compute((data_version(), name, params), compute)
@@ -0,0 +1,242 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+
+# ===================================================================
+# BẢNG TỔNG HỢP (ROLLUP) THEO GIỜ / NGÀY
+# ===================================================================
+# rollup_hourly: (channel_id, hour_ts)   - hour_ts = created_ts làm tròn xuống theo giờ
+# rollup_daily:  (channel_id, local_day) - ngày theo giờ địa phương
+#
+# Mỗi bản ghi đóng góp:
+# - dt: khoảng cách tới bản ghi trước (tối đa config.MAX_SAMPLE_GAP_S giây)
+# - on_seconds += dt nếu state=1; waste_seconds += dt nếu state=1 và presence=0
+# - energy_wh += phần tăng của energy_wh trong phiên bật (thiết bị reset energy khi bật);
+#   mẫu thiếu energy_wh cộng 0 và phần tăng kế tiếp tính từ giá trị gần nhất của phiên,
+#   nên tổng của 1 phiên = MAX(energy_wh) của phiên đó (như fact_session)
+
+# Lô nhỏ hơn ngưỡng này (vd: dữ liệu đẩy 1-2 bản ghi/channel) không cần groupby:
+# ON CONFLICT DO UPDATE cộng dồn từng dòng cho cùng kết quả, nhanh hơn nhiều.
+_GROUPBY_MIN_ROWS = 32
+
+_ROW_QUERY = """
+    SELECT channel_id, created_ts, local_day, power_w, energy_wh, presence, state
+    FROM fact_measurement
+"""
+
+def _previous_row(cur, channel_id, before_ts, max_id):
+    """
+    Bản ghi ngay trước before_ts của channel (chỉ trong dữ liệu đã có, id <= max_id):
+    (created_ts, energy_wh, state). Nếu bản ghi đó đang bật mà thiếu energy_wh thì
+    energy_wh là giá trị khác NULL gần nhất của CÙNG phiên (None nếu phiên chưa có).
+    """
+    cur.execute("""
+        SELECT created_ts, energy_wh, state
+        FROM fact_measurement
+        WHERE channel_id = ? AND created_ts < ? AND id <= ?
+        ORDER BY created_ts DESC
+        LIMIT 1
+    """, (channel_id, before_ts, max_id))
+    row = cur.fetchone()
+    if row is None or row[1] is not None or row[2] != 1:
+        return row
+
+    # Lùi theo index tới bản ghi có energy_wh, nhưng không vượt qua bản ghi tắt gần nhất
+    cur.execute("""
+        SELECT energy_wh FROM fact_measurement
+        WHERE channel_id = ?1 AND created_ts < ?2 AND id <= ?3 AND energy_wh IS NOT NULL
+          AND created_ts > COALESCE((
+              SELECT created_ts FROM fact_measurement
+              WHERE channel_id = ?1 AND created_ts < ?2 AND id <= ?3 AND state IS NOT 1
+              ORDER BY created_ts DESC LIMIT 1
+          ), -1)
+        ORDER BY created_ts DESC
+        LIMIT 1
+    """, (channel_id, before_ts, max_id))
+    carried = cur.fetchone()
+    return (row[0], carried[0] if carried else None, row[2])
+
+def _channel_starts(df):
+    """Chỉ số dòng đầu tiên của mỗi channel trong df (đã sắp theo channel_id, created_ts)."""
+    channels = df["channel_id"].to_numpy()
+    return np.concatenate(([0], np.flatnonzero(channels[1:] != channels[:-1]) + 1))
+
+def _row_metrics(df, prevs):
+    """
+    Tính đóng góp của từng bản ghi (đã sắp theo channel_id, created_ts) vào rollup.
+    prevs: với mỗi channel trong df (theo thứ tự), (created_ts, energy_wh, state)
+    của bản ghi đứng trước nó (xem _previous_row), hoặc None.
+    Cột session_energy: energy_wh khác NULL gần nhất của phiên tới hết bản ghi đó
+    (dùng làm prev cho khối kế tiếp), không được ghi vào rollup.
+    """
+    n = len(df)
+    idx = np.arange(n)
+    ts = df["created_ts"].to_numpy(dtype="float64")
+    energy = df["energy_wh"].to_numpy(dtype="float64", na_value=np.nan)
+    on = (df["state"] == 1).to_numpy()
+    waste = on & (df["presence"] == 0).to_numpy()
+
+    last_ts = np.concatenate(([np.nan], ts[:-1]))
+    last_on = np.concatenate(([False], on[:-1]))
+    seed = np.full(n, np.nan)
+    # Dòng đầu mỗi channel nối với bản ghi trước đó của CHÍNH channel đó
+    starts = _channel_starts(df)
+    for start, prev in zip(starts, prevs):
+        last_ts[start], last_on[start] = np.nan, False
+        if prev is not None:
+            last_ts[start] = prev[0] if prev[0] is not None else np.nan
+            last_on[start] = prev[2] == 1
+            if last_on[start] and prev[1] is not None:
+                seed[start] = prev[1]
+
+    # energy_wh khác NULL gần nhất TRƯỚC mỗi bản ghi trong cùng phiên bật (giữ qua các mẫu
+    # thiếu energy_wh); phiên nối tiếp từ bản ghi trước khối lấy giá trị của prev
+    run_begin = on & ~last_on
+    run_begin[starts] = on[starts]
+    run_first = np.maximum.accumulate(np.where(run_begin, idx, 0))
+    valid = on & ~np.isnan(energy)
+    last_valid = np.maximum.accumulate(np.where(valid, idx, -1))
+    before = np.concatenate(([-1], last_valid[:-1]))
+    in_run = before >= run_first
+    carried = np.where(in_run, energy[np.maximum(before, 0)], seed[run_first])
+    carried = np.where(last_on, carried, np.nan)
+
+    dt = np.clip(np.nan_to_num(ts - last_ts, nan=0.0), 0, config.MAX_SAMPLE_GAP_S)
+    # Trong cùng phiên: cộng phần tăng; bắt đầu phiên (hoặc energy bị reset): cộng cả giá trị;
+    # mẫu thiếu energy_wh: cộng 0, phiên vẫn tiếp tục
+    continuing = ~np.isnan(carried) & (energy >= carried)
+    energy_delta = np.where(on, np.where(continuing, energy - carried, energy), 0.0)
+
+    power = df["power_w"].to_numpy(dtype="float64", na_value=np.nan)
+    return pd.DataFrame({
+        "channel_id": df["channel_id"].to_numpy(),
+        "hour_ts": (df["created_ts"] // 3600 * 3600).to_numpy(),
+        "local_day": df["local_day"].to_numpy(),
+        "sample_count": 1,
+        "power_samples": (~np.isnan(power)).astype(np.int64),
+        "power_sum": np.nan_to_num(power, nan=0.0),
+        "power_min": power,
+        "power_max": power,
+        "on_seconds": np.where(on, dt, 0.0),
+        "waste_seconds": np.where(waste, dt, 0.0),
+        "energy_wh": np.nan_to_num(energy_delta, nan=0.0),
+        "session_energy": np.where(on, np.where(valid, energy, carried), np.nan),
+    })
+
+def _upsert(cur, table, key, metrics):
+    """Gom nhóm theo khóa và cộng dồn vào bảng rollup (INSERT ... ON CONFLICT DO UPDATE)."""
+    spec = {
+        "sample_count": ("sample_count", "sum"),
+        "power_samples": ("power_samples", "sum"),
+        "power_sum": ("power_sum", "sum"),
+        "power_min": ("power_min", "min"),
+        "power_max": ("power_max", "max"),
+        "on_seconds": ("on_seconds", "sum"),
+        "waste_seconds": ("waste_seconds", "sum"),
+        "energy_wh": ("energy_wh", "sum"),
+    }
+    if key == "hour_ts":
+        spec["local_day"] = ("local_day", "first")
+    if len(metrics) < _GROUPBY_MIN_ROWS:
+        agg = metrics[["channel_id", key, *spec]]
+    else:
+        agg = metrics.groupby(["channel_id", key], sort=False).agg(**spec).reset_index()
+
+    cols = list(agg.columns)
+    values = agg.astype(object).where(agg.notna(), None)
+    rows = list(values.itertuples(index=False, name=None))
+    placeholders = ", ".join("?" for _ in cols)
+    cur.executemany(f"""
+        INSERT INTO {table} ({", ".join(cols)})
+        VALUES ({placeholders})
+        ON CONFLICT(channel_id, {key}) DO UPDATE SET
+            sample_count = sample_count + excluded.sample_count,
+            power_samples = power_samples + excluded.power_samples,
+            power_sum = power_sum + excluded.power_sum,
+            power_min = COALESCE(MIN(power_min, excluded.power_min), power_min, excluded.power_min),
+            power_max = COALESCE(MAX(power_max, excluded.power_max), power_max, excluded.power_max),
+            on_seconds = on_seconds + excluded.on_seconds,
+            waste_seconds = waste_seconds + excluded.waste_seconds,
+            energy_wh = energy_wh + excluded.energy_wh
+    """, rows)
+
+def _apply_frame(cur, df, prevs):
+    """Cộng df vào rollup_hourly / rollup_daily. Trả về metrics (None nếu df rỗng)."""
+    if df.empty:
+        return None
+    metrics = _row_metrics(df, prevs)
+    _upsert(cur, "rollup_hourly", "hour_ts", metrics)
+    _upsert(cur, "rollup_daily", "local_day", metrics)
+    return metrics
+
+def update_rollups(cur, channel_id, max_id_before):
+    """
+    Cộng các bản ghi VỪA CHÈN (id > max_id_before) của channel vào rollup.
+    Gọi trong cùng transaction với lệnh INSERT để rollup luôn khớp dữ liệu thô.
+    (Dữ liệu nạp không theo thứ tự thời gian chỉ làm lệch nhẹ dt/energy của
+    bản ghi liền sau; rebuild_rollups() tính lại chính xác.)
+    """
+    df = pd.read_sql_query(
+        _ROW_QUERY + " WHERE id > ? AND channel_id = ? ORDER BY created_ts",
+        cur.connection, params=(max_id_before, channel_id),
+    )
+    df = df[df["created_ts"].notna()]
+    if df.empty:
+        return
+    prev = _previous_row(cur, channel_id, int(df["created_ts"].iloc[0]), max_id_before)
+    _apply_frame(cur, df, [prev])
+
+def update_rollups_many(cur, max_id_before):
+    """
+    Như update_rollups nhưng cho MỌI channel có bản ghi id > max_id_before:
+    1 lần đọc + 1 lần gom nhóm cho cả lô (vd: lô dữ liệu đẩy của hàng trăm channel).
+    """
+    df = pd.read_sql_query(
+        _ROW_QUERY + " WHERE id > ? AND created_ts IS NOT NULL ORDER BY channel_id, created_ts",
+        cur.connection, params=(max_id_before,),
+    )
+    if df.empty:
+        return
+    starts = _channel_starts(df)
+    firsts = zip(df["channel_id"].to_numpy()[starts], df["created_ts"].to_numpy()[starts])
+    prevs = [_previous_row(cur, cid, int(ts), max_id_before) for cid, ts in firsts]
+    _apply_frame(cur, df, prevs)
+
+def rebuild_rollups(conn, chunk_size=200_000, channel_ids=None):
+    """
+    Tính lại rollup từ fact_measurement (đọc theo từng khối để giới hạn bộ nhớ).
+    channel_ids=None: toàn bộ; ngược lại chỉ các channel đó (vd: sau khi nạp hàng loạt).
+    """
+    cur = conn.cursor()
+    if channel_ids is None:
+        cur.execute("DELETE FROM rollup_hourly")
+        cur.execute("DELETE FROM rollup_daily")
+        channels = [r[0] for r in cur.execute("SELECT DISTINCT channel_id FROM fact_measurement").fetchall()]
+    else:
+        channels = list(channel_ids)
+        for channel_id in channels:
+            cur.execute("DELETE FROM rollup_hourly WHERE channel_id = ?", (channel_id,))
+            cur.execute("DELETE FROM rollup_daily WHERE channel_id = ?", (channel_id,))
+
+    for channel_id in channels:
+        prev = None
+        for df in pd.read_sql_query(
+            _ROW_QUERY + " WHERE channel_id = ? AND created_ts IS NOT NULL ORDER BY created_ts",
+            conn, params=(channel_id,), chunksize=chunk_size,
+        ):
+            metrics = _apply_frame(cur, df, [prev])
+            last = df.iloc[-1]
+            energy = metrics["session_energy"].iloc[-1]
+            prev = (
+                int(last["created_ts"]),
+                None if pd.isna(energy) else float(energy),
+                None if pd.isna(last["state"]) else int(last["state"]),
+            )
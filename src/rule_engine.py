@@ -0,0 +1,275 @@
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from src.segmentation import find_streak_windows, segment_sessions
+from src.analyzer import STREAK_TARGET, HIGH_ENERGY_THRESHOLD_WH
+from database.connection import get_writer, read_connection
+from src.jobs import check_cancelled
+
+# ===================================================================
+# RULE ENGINE TĂNG DẦN (streaming)
+# ===================================================================
+# Mỗi channel có 1 dòng rule_state giữ:
+# - checkpoint_id: MAX(id) của fact_measurement lúc lần chạy trước bắt đầu đọc
+# - bộ đếm chuỗi "bật không người" (+ thời điểm bắt đầu cửa sổ đang đếm)
+# - phiên 'state=1' đang mở (thời điểm bắt đầu, MAX(energy_wh) đến hiện tại)
+# Mỗi lần chạy chỉ đọc các bản ghi sau last_ts / checkpoint_id, nên chi phí tỉ lệ
+# với lượng dữ liệu mới; chuỗi/phiên kéo dài qua nhiều lần chạy (hoặc qua
+# nửa đêm) vẫn được phát hiện đúng. Cảnh báo được lưu vào fact_alert.
+# Bản ghi mới được đọc theo khối config.ANALYSIS_CHUNK_ROWS trên pool đọc
+# (bộ đếm chuỗi / phiên mở nối tiếp giữa các khối); luồng ghi chỉ nhận phần
+# ghi cảnh báo + state ở cuối.
+
+RULE_WASTE = "waste"
+RULE_HIGH_CONSUMPTION = "high_consumption"
+
+_STATE_COLUMNS = (
+    "checkpoint_id", "last_ts", "last_at",
+    "streak_len", "streak_start_ts", "streak_start_at",
+    "session_start_ts", "session_start_at", "session_max_energy",
+)
+
+# Bản ghi mới = sau bản ghi cuối đã xử lý (created_ts > last_ts) và đã commit lúc bắt đầu
+# đọc (id <= MAX(id)): quét theo khoảng của idx_fact_channel_ts, chi phí tỉ lệ với
+# lượng bản ghi mới thay vì toàn bộ lịch sử của channel.
+_ROW_QUERY = """
+    SELECT id, created_ts, created_at, state, presence, energy_wh
+    FROM fact_measurement
+    WHERE channel_id = ? AND created_ts > ? AND id > ? AND id <= ?
+    ORDER BY created_ts, id
+"""
+
+# Bản ghi đến trễ (created_ts <= last_ts) chèn sau checkpoint: chỉ đếm để báo.
+# '+' tắt index theo channel / created_ts -> quét theo khoảng rowid (checkpoint, MAX(id)].
+_LATE_QUERY = """
+    SELECT COUNT(*) FROM fact_measurement
+    WHERE id > ? AND id <= ? AND +channel_id = ? AND +created_ts <= ?
+"""
+
+def _load_state(cur, channel_id):
+    cur.execute(f"SELECT {', '.join(_STATE_COLUMNS)} FROM rule_state WHERE channel_id = ?", (channel_id,))
+    row = cur.fetchone()
+    if row is None:
+        return dict.fromkeys(_STATE_COLUMNS, None) | {"checkpoint_id": 0, "streak_len": 0}
+    return dict(zip(_STATE_COLUMNS, row))
+
+def _save_state(cur, channel_id, state):
+    cols = ("channel_id",) + _STATE_COLUMNS + ("updated_at",)
+    values = (channel_id,) + tuple(state[c] for c in _STATE_COLUMNS) + (
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    )
+    cur.execute(
+        f"INSERT OR REPLACE INTO rule_state ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})",
+        values,
+    )
+
+def _add_alert(alerts, rule, start_ts, start_at, end_ts, end_at, value, message, is_open, announce=True):
+    """
+    Gom cảnh báo của lần chạy theo (luật, thời điểm bắt đầu): khối sau cập nhật cảnh báo
+    của khối trước (vd: phiên mở -> đóng), vẫn báo nếu 1 khối nào đó đã cần báo.
+    """
+    key = (rule, start_ts)
+    announce = announce or (key in alerts and alerts[key][1])
+    alerts[key] = ((rule, start_ts, start_at, end_ts, end_at, value, message, is_open), announce)
+
+def _upsert_alert(cur, channel_id, rule, start_ts, start_at, end_ts, end_at, value, message, is_open):
+    """Ghi cảnh báo; cùng (channel, luật, thời điểm bắt đầu) thì cập nhật (vd: phiên mở -> đóng)."""
+    cur.execute("""
+        INSERT INTO fact_alert (
+            channel_id, rule, start_ts, start_at, end_ts, end_at,
+            value, message, is_open, detected_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(channel_id, rule, start_ts) DO UPDATE SET
+            end_ts = excluded.end_ts,
+            end_at = excluded.end_at,
+            value = excluded.value,
+            message = excluded.message,
+            is_open = excluded.is_open
+    """, (
+        channel_id, rule, start_ts, start_at, end_ts, end_at, value, message, int(is_open),
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    ))
+
+def _high_consumption_message(max_energy, start_at, end_at, is_open):
+    if is_open:
+        return (
+            f"   ⚡️ CẢNH BÁO: Tiêu thụ vượt ngưỡng! {max_energy:.0f} Wh / {HIGH_ENERGY_THRESHOLD_WH}. "
+            f"Đèn đã bật từ {start_at} "
+        )
+    return (
+        f"   ⚡️ CẢNH BÁO: Tiêu thụ vượt ngưỡng! {max_energy:.0f} Wh / {HIGH_ENERGY_THRESHOLD_WH}. "
+        f"từ {start_at} đến {end_at}."
+    )
+
+# -------------------------------------------------------------------
+# Luật 1: chuỗi STREAK_TARGET bản ghi liên tiếp (state=1, presence=0)
+# -------------------------------------------------------------------
+def _apply_waste_rule(alerts, df, state):
+    ts = df["created_ts"].to_numpy(dtype="int64")
+    created_at = df["created_at"].to_numpy()
+    is_bad_state = ((df["state"] == 1) & (df["presence"] == 0)).to_numpy()
+
+    start_idx, end_idx, carry = find_streak_windows(
+        is_bad_state, STREAK_TARGET, carry=state["streak_len"] or 0, return_carry=True
+    )
+
+    recs = []
+    for s, e in zip(start_idx, end_idx):
+        # s < 0: cửa sổ bắt đầu từ lần chạy trước
+        start_ts, start_at = (int(ts[s]), created_at[s]) if s >= 0 else (state["streak_start_ts"], state["streak_start_at"])
+        rec = (
+            f"   ❗️ CẢNH BÁO: Đèn bật không người ! "
+            f"Từ {start_at} đến {created_at[e]}."
+        )
+        _add_alert(alerts, RULE_WASTE, start_ts, start_at, int(ts[e]), created_at[e],
+                   float(ts[e] - start_ts), rec, False)
+
+    # Bộ đếm + thời điểm bắt đầu cửa sổ đang đếm dở cho lần chạy sau
+    if carry == 0:
+        state["streak_start_ts"], state["streak_start_at"] = None, None
+    elif carry <= len(df):
+        first = len(df) - carry
+        state["streak_start_ts"], state["streak_start_at"] = int(ts[first]), created_at[first]
+    state["streak_len"] = carry
+
+# -------------------------------------------------------------------
+# Luật 3: MAX(energy_wh) của mỗi phiên 'state=1' vượt ngưỡng
+# -------------------------------------------------------------------
+def _apply_high_consumption_rule(alerts, df, state):
+    ts = df["created_ts"].to_numpy(dtype="int64")
+    created_at = df["created_at"].to_numpy()
+    on = (df["state"] == 1).to_numpy()
+    carry_max = state["session_max_energy"] if state["session_start_ts"] is not None else None
+
+    def emit(start_ts, start_at, end_ts, end_at, max_energy, is_open, announce=True):
+        if max_energy is None or np.isnan(max_energy) or max_energy <= HIGH_ENERGY_THRESHOLD_WH:
+            return
+        rec = _high_consumption_message(max_energy, start_at, end_at, is_open)
+        _add_alert(alerts, RULE_HIGH_CONSUMPTION, start_ts, start_at, end_ts, end_at,
+                   float(max_energy), rec, is_open, announce)
+
+    # Phiên mở từ lần trước đã kết thúc ngay trước khối này
+    if carry_max is not None and not on[0]:
+        emit(state["session_start_ts"], state["session_start_at"], state["last_ts"], state["last_at"],
+             carry_max, False)
+
+    start_idx, end_idx, max_energies, last_is_open = segment_sessions(
+        on, df["energy_wh"].to_numpy(dtype="float64", na_value=np.nan), carry_max=carry_max
+    )
+    continued = carry_max is not None and on[0]
+    n = len(start_idx)
+    for i in range(n):
+        s, e = start_idx[i], end_idx[i]
+        if i == 0 and continued:
+            start_ts, start_at = state["session_start_ts"], state["session_start_at"]
+        else:
+            start_ts, start_at = int(ts[s]), created_at[s]
+        is_open = last_is_open and i == n - 1
+        # Phiên vẫn mở và đã cảnh báo ở lần trước -> chỉ cập nhật fact_alert, không báo lại
+        already_alerted = i == 0 and continued and carry_max > HIGH_ENERGY_THRESHOLD_WH
+        emit(start_ts, start_at, int(ts[e]), created_at[e], max_energies[i], is_open,
+             announce=not (is_open and already_alerted))
+        if is_open:
+            state["session_start_ts"], state["session_start_at"] = start_ts, start_at
+            state["session_max_energy"] = float(max_energies[i])
+
+    if not last_is_open:
+        state["session_start_ts"] = state["session_start_at"] = state["session_max_energy"] = None
+
+# -------------------------------------------------------------------
+def _scan_channel(channel_id):
+    """
+    Chạy trên pool đọc: áp các luật lên bản ghi mới của 1 channel theo từng khối.
+    Trả về (số bản ghi, checkpoint_id cũ, state mới, cảnh báo đã gom) hoặc None nếu
+    không có bản ghi nào được chèn từ lần chạy trước.
+    """
+    with read_connection() as conn:
+        state = _load_state(conn.cursor(), channel_id)
+        start_checkpoint, start_last_ts = state["checkpoint_id"], state["last_ts"]
+        checkpoint_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM fact_measurement").fetchone()[0]
+        if checkpoint_id <= start_checkpoint:
+            return None
+
+        n_rows, alerts = 0, {}
+        lower_ts = -2**62 if start_last_ts is None else start_last_ts
+        for df in pd.read_sql_query(_ROW_QUERY, conn, params=(channel_id, lower_ts, start_checkpoint, checkpoint_id),
+                                    chunksize=config.ANALYSIS_CHUNK_ROWS):
+            if df.empty:
+                continue
+            _apply_waste_rule(alerts, df, state)
+            _apply_high_consumption_rule(alerts, df, state)
+            state["last_ts"] = int(df["created_ts"].iloc[-1])
+            state["last_at"] = df["created_at"].iloc[-1]
+            n_rows += len(df)
+
+        # Bản ghi đến trễ (cũ hơn bản ghi đã xử lý) không thể chèn lại vào chuỗi -> bỏ qua
+        n_late = 0
+        if start_last_ts is not None:
+            n_late = conn.execute(_LATE_QUERY, (start_checkpoint, checkpoint_id, channel_id, start_last_ts)).fetchone()[0]
+
+    if n_late:
+        print(f"   [Rule] ⚠️ Channel {channel_id}: bỏ qua {n_late} bản ghi đến trễ.")
+    # checkpoint = MAX(id) lúc đọc: lần sau chỉ xét bản ghi chèn sau đó
+    state["checkpoint_id"] = checkpoint_id
+    return n_rows, start_checkpoint, state, alerts
+
+def _save_results(conn, channel_id, start_checkpoint, state, alerts):
+    """
+    Chạy trên luồng ghi: lưu cảnh báo + state trong 1 transaction.
+    Nếu checkpoint đã đổi từ lúc đọc (1 lần chạy khác đã xử lý) thì bỏ qua.
+    """
+    cur = conn.cursor()
+    if _load_state(cur, channel_id)["checkpoint_id"] != start_checkpoint:
+        return False
+    for row, _ in alerts.values():
+        _upsert_alert(cur, channel_id, *row)
+    _save_state(cur, channel_id, state)
+    conn.commit()
+    return True
+
+def _process_channel(channel_id):
+    """Xử lý bản ghi mới của 1 channel: đọc + áp luật trên pool đọc, chỉ phần ghi qua luồng ghi."""
+    scanned = _scan_channel(channel_id)
+    if scanned is None:
+        return 0, []
+    n_rows, start_checkpoint, state, alerts = scanned
+    if not get_writer().run(_save_results, channel_id, start_checkpoint, state, alerts):
+        print(f"   [Rule] ⚠️ Channel {channel_id}: đã được xử lý bởi lần chạy khác, bỏ qua.")
+        return 0, []
+    # Cảnh báo cần báo: luật 1 trước, luật 3 sau (theo thứ tự phát hiện)
+    return n_rows, [
+        row[6] for rule in (RULE_WASTE, RULE_HIGH_CONSUMPTION)
+        for (row, announce) in alerts.values() if announce and row[0] == rule
+    ]
+
+def run_incremental_analyses(channel_ids=None):
+    """
+    Chạy các luật trên dữ liệu MỚI (id > checkpoint) của từng channel.
+    Trả về danh sách cảnh báo mới / được cập nhật trong lần chạy này.
+    """
+    print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🧐 Phân tích tăng dần...")
+    if channel_ids is None:
+        with read_connection() as conn:
+            channel_ids = [r[0] for r in conn.execute("SELECT channel_id FROM etl_state ORDER BY channel_id")]
+
+    all_recs = []
+    for channel_id in channel_ids:
+        check_cancelled()
+        n_rows, recs = _process_channel(str(channel_id))
+        print(f"   🔎 Channel {channel_id}: {n_rows} bản ghi mới, {len(recs)} cảnh báo.")
+        for rec in recs:
+            print(rec)
+        all_recs.extend(recs)
+
+    if not all_recs:
+        print("   👍 Không có cảnh báo mới.")
+    return all_recs
@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+
+# ===================================================================
+# LẬP LỊCH TỰ ĐỘNG THÍCH ỨNG (mỗi channel một chu kỳ)
+# ===================================================================
+# - Có dữ liệu mới -> hỏi lại sau SCHEDULER_MIN_INTERVAL_S (bám chu kỳ 15s của thiết bị).
+# - Không có dữ liệu mới -> chu kỳ x SCHEDULER_IDLE_BACKOFF (tối đa SCHEDULER_MAX_INTERVAL_S).
+# - Lỗi / HTTP 429 -> chu kỳ x SCHEDULER_ERROR_BACKOFF (429 có Retry-After thì chờ ít nhất chừng đó).
+# Mỗi channel có tối đa 1 lượt đang chạy (không chồng lấn); lượt sau được
+# tính từ lúc lượt trước KẾT THÚC. stop_event.set() -> dừng nhận lượt mới,
+# chờ các lượt đang chạy xong rồi thoát.
+
+def _retry_after(error):
+    """Số giây trong header Retry-After của lỗi HTTP 429 (nếu có)."""
+    response = getattr(error, "response", None)
+    if response is None or response.status_code != 429:
+        return None
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return 0.0
+
+def next_interval(current, new_rows, error=None):
+    """Chu kỳ kế tiếp (giây) của 1 channel sau 1 lượt chạy."""
+    low, high = config.SCHEDULER_MIN_INTERVAL_S, config.SCHEDULER_MAX_INTERVAL_S
+    if error is not None:
+        interval = min(high, max(current, low) * config.SCHEDULER_ERROR_BACKOFF)
+        return max(interval, _retry_after(error) or 0)
+    if new_rows:
+        return low
+    return min(high, max(current, low) * config.SCHEDULER_IDLE_BACKOFF)
+
+
+def _run_once(job, channel_id, api_key):
+    t0 = time.perf_counter()
+    try:
+        return job(channel_id, api_key), None, time.perf_counter() - t0
+    except Exception as e:
+        return 0, e, time.perf_counter() - t0
+
+
+def run_scheduler(job, channels, stop_event, workers=None):
+    """
+    Vòng lặp lập lịch (chặn cho tới khi stop_event được set).
+    job(channel_id, api_key) -> số bản ghi mới; channels: [(channel_id, api_key)].
+    Trả về thống kê theo channel.
+    """
+    now = time.monotonic()
+    state = {
+        cid: {"key": key, "interval": config.SCHEDULER_MIN_INTERVAL_S, "next_run": now,
+              "runs": 0, "rows": 0, "errors": 0}
+        for cid, key in channels
+    }
+    workers = max(1, min(workers or config.ETL_WORKERS, len(state)))
+    print(f"[Scheduler] ⚙️ Bắt đầu lập lịch {len(state)} channel ({workers} luồng), "
+          f"chu kỳ {config.SCHEDULER_MIN_INTERVAL_S}-{config.SCHEDULER_MAX_INTERVAL_S}s.")
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # 1. Thu kết quả các lượt đã xong -> tính chu kỳ kế tiếp
+            for cid, future in list(running.items()):
+                if not future.done():
+                    continue
+                del running[cid]
+                new_rows, error, elapsed = future.result()
+                st = state[cid]
+                st["runs"] += 1
+                st["rows"] += new_rows
+                st["errors"] += error is not None
+                st["interval"] = next_interval(st["interval"], new_rows, error)
+                # Jitter nhỏ để nhiều channel không gọi API cùng lúc
+                st["next_run"] = time.monotonic() + st["interval"] * random.uniform(1.0, 1.1)
+                if error is not None:
+                    kind = "bị giới hạn tần suất (429)" if _retry_after(error) is not None else "lỗi"
+                    print(f"[Scheduler] ❌ Channel {cid} {kind}: {error} -> thử lại sau {st['interval']:.0f}s")
+                else:
+                    print(f"[Scheduler] Channel {cid}: {new_rows} bản ghi mới ({elapsed:.1f}s) "
+                          f"-> lần sau sau {st['interval']:.0f}s")
+
+            if stop_event.is_set():
+                if not running:
+                    break
+                wait(running.values(), timeout=1.0)
+                continue
+
+            # 2. Chạy các channel đến hạn (bỏ qua channel đang chạy)
+            now = time.monotonic()
+            for cid, st in state.items():
+                if cid not in running and st["next_run"] <= now:
+                    running[cid] = pool.submit(_run_once, job, cid, st["key"])
+
+            # 3. Ngủ tới khi có lượt xong, channel kế tiếp đến hạn, hoặc có lệnh dừng (tối đa 1s)
+            idle = [st["next_run"] for cid, st in state.items() if cid not in running]
+            delay = min([max(0.0, t - time.monotonic()) for t in idle] + [1.0])
+            if running:
+                wait(running.values(), timeout=delay, return_when=FIRST_COMPLETED)
+            else:
+                stop_event.wait(delay)
+
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [Scheduler] 🛑 Đã dừng.")
+    return {cid: {k: st[k] for k in ("runs", "rows", "errors", "interval")} for cid, st in state.items()}
@@ -0,0 +1,92 @@
+import numpy as np
+
+# ===================================================================
+# ENGINE PHÂN ĐOẠN (run-length) DÙNG CHO CÁC LUẬT PHÂN TÍCH
+# ===================================================================
+# Thay cho các vòng lặp itertuples() trong analyzer: mọi phép tính
+# đều làm trên mảng NumPy (cumsum / diff), không có vòng lặp Python theo dòng.
+
+def find_streak_windows(mask, target, carry=0, return_carry=False):
+    """
+    Tìm các cửa sổ gồm `target` bản ghi LIÊN TIẾP thỏa `mask`.
+
+    Giữ đúng hành vi của bộ đếm cũ: khi đủ `target` bản ghi thì cảnh báo
+    và đặt lại bộ đếm, nên một chuỗi dài L sinh ra L // target cửa sổ.
+
+    carry: giá trị bộ đếm ở cuối khối dữ liệu trước (xử lý theo từng khối);
+    chuỗi ở đầu khối này được tính tiếp từ đó. Khi đó start_idx có thể âm
+    (cửa sổ bắt đầu từ khối trước).
+
+    Trả về (start_idx, end_idx): 2 mảng vị trí (0-based) của bản ghi đầu
+    và cuối mỗi cửa sổ, theo thứ tự thời gian. Nếu return_carry=True thì
+    trả thêm bộ đếm ở cuối khối (để truyền cho khối tiếp theo).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    n = len(mask)
+    if n == 0 or target <= 0:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty, carry if n == 0 else 0) if return_carry else (empty, empty)
+
+    idx = np.arange(n, dtype=np.int64)
+
+    # Vị trí bắt đầu của chuỗi hiện tại: đánh dấu các điểm 0 -> 1 rồi lan truyền bằng maximum.accumulate
+    run_starts = mask & ~np.concatenate(([False], mask[:-1]))
+    run_start_idx = np.maximum.accumulate(np.where(run_starts, idx, 0))
+
+    # Vị trí trong chuỗi (0-based); bộ đếm cũ reset sau mỗi `target` bản ghi
+    pos_in_run = idx - run_start_idx
+    if carry and mask[0]:
+        # Chuỗi đầu khối nối tiếp chuỗi của khối trước
+        pos_in_run = pos_in_run + np.where(run_start_idx == 0, carry, 0)
+    hits = mask & ((pos_in_run + 1) % target == 0)
+
+    end_idx = np.flatnonzero(hits)
+    start_idx = end_idx - (target - 1)
+    if not return_carry:
+        return start_idx, end_idx
+    new_carry = int((pos_in_run[-1] + 1) % target) if mask[-1] else 0
+    return start_idx, end_idx, new_carry
+
+
+def segment_sessions(on, values=None, carry_max=None):
+    """
+    Chia dữ liệu thành các phiên liên tiếp thỏa `on` (vd: state=1).
+
+    Ranh giới phiên lấy từ các điểm chuyển trạng thái 0 -> 1 / 1 -> 0, sau đó
+    gom nhóm một lần (reduceat) để lấy MAX(values) của từng phiên.
+    Giống vòng lặp cũ: nếu bản ghi đầu phiên là NaN thì tính như 0.0,
+    các NaN còn lại được bỏ qua.
+
+    Trả về (start_idx, end_idx, max_values, last_is_open):
+    - start_idx / end_idx: vị trí bản ghi đầu và cuối của mỗi phiên
+    - max_values: MAX(values) mỗi phiên (None nếu không truyền values)
+    - last_is_open: True nếu phiên cuối vẫn còn mở ở cuối dữ liệu
+
+    carry_max: MAX(values) của phiên còn mở ở cuối khối trước. Nếu khối này
+    bắt đầu bằng on=True thì phiên đầu tiên là phần tiếp theo của phiên đó.
+    """
+    on = np.asarray(on, dtype=bool)
+    n = len(on)
+    if n == 0 or not on.any():
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, (np.empty(0) if values is not None else None), False
+
+    prev_on = np.concatenate(([False], on[:-1]))
+    next_on = np.concatenate((on[1:], [False]))
+    start_idx = np.flatnonzero(on & ~prev_on)
+    end_idx = np.flatnonzero(on & ~next_on)
+
+    max_values = None
+    if values is not None:
+        values = np.array(values, dtype=np.float64)
+        continued = carry_max is not None and on[0]
+        true_starts = start_idx[1:] if continued else start_idx
+        values[true_starts] = np.nan_to_num(values[true_starts], nan=0.0)
+        # Các bản ghi 'on' nằm liền nhau theo phiên -> reduceat theo offset đầu mỗi phiên
+        on_values = values[on]
+        offsets = np.concatenate(([0], np.cumsum(end_idx - start_idx + 1)[:-1]))
+        max_values = np.fmax.reduceat(on_values, offsets)
+        if continued:
+            max_values[0] = np.fmax(max_values[0], carry_max)
+
+    return start_idx, end_idx, max_values, bool(on[-1])
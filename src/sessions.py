@@ -0,0 +1,123 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+import config
+from src.segmentation import segment_sessions
+
+# ===================================================================
+# BẢNG PHIÊN BẬT ĐÈN (fact_session)
+# ===================================================================
+# Mỗi phiên = chuỗi bản ghi liên tiếp (theo created_ts) có state=1 của 1 channel.
+# Phiên cuối có is_open=1 nếu bản ghi mới nhất của channel vẫn state=1;
+# lần nạp sau sẽ tính lại phiên đó (kéo dài hoặc đóng lại).
+
+_ROW_QUERY = """
+    SELECT created_ts, created_at, local_day, presence, state, energy_wh, time_s
+    FROM fact_measurement
+    WHERE channel_id = ? AND created_ts >= ?
+    ORDER BY created_ts
+"""
+
+_INSERT = """
+    INSERT OR REPLACE INTO fact_session (
+        channel_id, start_ts, start_at, end_ts, end_at, local_day, duration_s,
+        max_energy_wh, unoccupied_s, sample_count, device_time_s, is_open
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _to_float_or_none(x):
+    return None if np.isnan(x) else float(x)
+
+def _sessions_from_frame(df, channel_id):
+    """Tách df (đã sắp theo created_ts) thành các dòng fact_session."""
+    on = (df["state"] == 1).to_numpy()
+    energy = df["energy_wh"].to_numpy(dtype="float64", na_value=np.nan)
+    start_idx, end_idx, max_energy, last_is_open = segment_sessions(on, energy)
+    if len(start_idx) == 0:
+        return []
+
+    ts = df["created_ts"].to_numpy(dtype="int64")
+    # dt chỉ tính giữa 2 bản ghi liên tiếp CÙNG phiên (tối đa MAX_SAMPLE_GAP_S)
+    prev_on = np.concatenate(([False], on[:-1]))
+    dt = np.where(on & prev_on, np.minimum(np.diff(ts, prepend=ts[0]), config.MAX_SAMPLE_GAP_S), 0)
+    unoccupied = np.where((df["presence"] == 0).to_numpy(), dt, 0).astype("float64")
+
+    # reduceat theo đầu mỗi phiên: các bản ghi 'off' xen giữa có dt=0 / time_s=NaN nên không ảnh hưởng
+    unoccupied_s = np.add.reduceat(unoccupied, start_idx)
+    time_s = np.where(on, df["time_s"].to_numpy(dtype="float64", na_value=np.nan), np.nan)
+    device_time_s = np.fmax.reduceat(time_s, start_idx)
+
+    created_at = df["created_at"].to_numpy()
+    local_day = df["local_day"].to_numpy()
+    rows = []
+    for i, (s, e) in enumerate(zip(start_idx, end_idx)):
+        rows.append((
+            channel_id, int(ts[s]), created_at[s], int(ts[e]), created_at[e], local_day[s],
+            float(ts[e] - ts[s]), _to_float_or_none(max_energy[i]), float(unoccupied_s[i]),
+            int(e - s + 1), _to_float_or_none(device_time_s[i]),
+            int(last_is_open and i == len(start_idx) - 1),
+        ))
+    return rows
+
+def _recompute_from(cur, channel_id, from_ts):
+    """Xóa và tính lại mọi phiên của channel bắt đầu từ from_ts."""
+    cur.execute("DELETE FROM fact_session WHERE channel_id = ? AND start_ts >= ?", (channel_id, from_ts))
+    df = pd.read_sql_query(_ROW_QUERY, cur.connection, params=(channel_id, from_ts))
+    rows = _sessions_from_frame(df, channel_id)
+    cur.executemany(_INSERT, rows)
+    return len(rows)
+
+def update_sessions(cur, channel_id, max_id_before):
+    """
+    Cập nhật fact_session sau khi chèn các bản ghi id > max_id_before (cùng transaction).
+    Chỉ tính lại từ phiên chứa/đứng trước bản ghi mới sớm nhất, nên chi phí
+    tỉ lệ với lượng dữ liệu mới (cộng phiên đang mở), không phải cả bảng.
+    """
+    cur.execute(
+        "SELECT MIN(created_ts) FROM fact_measurement WHERE id > ? AND channel_id = ?",
+        (max_id_before, channel_id),
+    )
+    first_new_ts = cur.fetchone()[0]
+    if first_new_ts is None:
+        return
+
+    # Phiên gần nhất bắt đầu trước first_new_ts chỉ cần tính lại khi còn mở, hoặc khi
+    # kéo tới bản ghi cũ ngay trước first_new_ts (bản ghi mới nối tiếp / chen vào phiên).
+    # Phiên đã đóng từ lâu (sau đó là nhiều bản ghi state=0) thì giữ nguyên.
+    cur.execute(
+        """
+        SELECT start_ts, end_ts, is_open FROM fact_session
+        WHERE channel_id = ? AND start_ts <= ?
+        ORDER BY start_ts DESC LIMIT 1
+        """,
+        (channel_id, first_new_ts),
+    )
+    last = cur.fetchone()
+    resume_ts = first_new_ts
+    if last is not None:
+        start_ts, end_ts, is_open = last
+        cur.execute(
+            "SELECT MAX(created_ts) FROM fact_measurement WHERE channel_id = ? AND created_ts < ?",
+            (channel_id, first_new_ts),
+        )
+        prev_ts = cur.fetchone()[0]
+        if is_open or (prev_ts is not None and end_ts >= prev_ts):
+            resume_ts = start_ts
+    _recompute_from(cur, channel_id, resume_ts)
+
+def rebuild_sessions(cur, channel_ids=None):
+    """Tính lại fact_session từ fact_measurement (channel_ids=None: toàn bộ)."""
+    if channel_ids is None:
+        cur.execute("DELETE FROM fact_session")
+        channels = [r[0] for r in cur.execute("SELECT DISTINCT channel_id FROM fact_measurement").fetchall()]
+    else:
+        channels = list(channel_ids)
+    for channel_id in channels:
+        _recompute_from(cur, channel_id, -2**62)
@@ -1,10 +1,13 @@
-import requests
+import numpy as np
 import pandas as pd
 import os
 import sys
 import re
+import time
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # SỬA LỖI IMPORT: Đưa khối sys.path lên TRƯỚC import config
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -12,61 +15,244 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 import config
+from src.http_client import get_client
+from src.feed_decoder import decode_feeds
+from src.rollups import update_rollups, update_rollups_many, rebuild_rollups
+from src.sessions import update_sessions, rebuild_sessions
+from src.jobs import JobCancelled, check_cancelled
+from database.connection import get_writer, read_connection
+from database.create import FACT_INDEXES
+
+# ===================================================================
+# HÀM THỜI GIAN: khoảng epoch của 1 ngày theo giờ địa phương
+# ===================================================================
+def local_day_bounds(day=None):
+    """
+    Trả về (start_ts, end_ts) dạng epoch (giây) của ngày `day` theo giờ địa phương,
+    dùng cho điều kiện `created_ts >= start_ts AND created_ts < end_ts` (dùng được index).
+    Mặc định là ngày hôm nay.
+    """
+    day = day or datetime.now().date()
+    start = datetime.combine(day, datetime.min.time())
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    return int(start.timestamp()), int(end.timestamp())
 
 # ===================================================================
 # HÀM LẤY TIMESTAMP CUỐI CÙNG (Đã đơn giản hóa)
 # ===================================================================
-def get_last_timestamp():
+def _default_channel_id():
+    """Channel mặc định: channel đầu tiên trong config (nếu có)."""
+    return str(config.CHANNEL_IDS[0]) if config.CHANNEL_IDS else ""
+
+def get_last_timestamp(channel_id=None):
     """
-    Truy vấn DB để tìm timestamp (created_at) mới nhất.
-    (Không cần channel_id nữa)
+    Đọc watermark (created_at mới nhất đã nạp) của một channel từ bảng etl_state.
+    Tra cứu theo khóa chính -> O(1), không quét fact_measurement.
     """
-    conn = sqlite3.connect(config.DB_FILE)
-    cur = conn.cursor()
+    if channel_id is None:
+        channel_id = _default_channel_id()
+
     try:
-        # Lấy MAX(created_at) từ toàn bộ bảng
-        query = "SELECT MAX(created_at) FROM fact_measurement"
-        cur.execute(query)
-        result = cur.fetchone()
+        with read_connection() as conn:
+            query = "SELECT last_created_ts FROM etl_state WHERE channel_id = ?"
+            result = conn.execute(query, (str(channel_id),)).fetchone()
         
-        if result and result[0]:
-            return datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S')
+        if result and result[0] is not None:
+            # created_at lưu theo UTC (không kèm múi giờ)
+            return datetime.fromtimestamp(result[0], timezone.utc).replace(tzinfo=None)
         else:
-            return None # DB trống
+            return None # Channel chưa có dữ liệu
             
     except Exception as e:
         print(f"   [DB] ❌ Lỗi khi lấy last_timestamp: {e}")
         return None
-    finally:
-        conn.close()
+
+def get_etl_state(channel_id):
+    """Dòng etl_state của channel dưới dạng dict ({} nếu channel chưa được nạp)."""
+    with read_connection() as conn:
+        cur = conn.execute("SELECT * FROM etl_state WHERE channel_id = ?", (str(channel_id),))
+        row = cur.fetchone()
+        return dict(zip([d[0] for d in cur.description], row)) if row else {}
 
 # ===================================================================
 # HÀM TRÍCH XUẤT JSON (Không đổi nhiều)
 # ===================================================================
 
-def fetch_json(channel_id, api_key="", start_time=None):
-    """
-    Lấy JSON từ ThingSpeak.
-    Nếu có start_time, chỉ lấy dữ liệu mới hơn thời điểm đó.
-    """
-    url = f"https://api.thingspeak.com/channels/{channel_id}/feeds.json"
+def _feeds_request(channel_id, api_key="", start_time=None, end_time=None, results=None, verbose=True):
+    """URL + tham số của feeds.json (dùng chung cho fetch_json / fetch_feeds_df)."""
+    url = f"{config.THINGSPEAK_URL}/channels/{channel_id}/feeds.json"
     
     params = {}
     if api_key:
         params["api_key"] = api_key
         
     if start_time:
-        start_time_str = (start_time + pd.Timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+        start_time_str = start_time.strftime('%Y-%m-%d %H:%M:%S')
         params["start"] = start_time_str
-        print(f"   [API] Lấy dữ liệu từ sau: {start_time_str}")
-    else:
+        if verbose:
+            print(f"   [API] Lấy dữ liệu từ: {start_time_str}")
+    if end_time:
+        params["end"] = end_time.strftime('%Y-%m-%d %H:%M:%S')
+
+    if results is not None:
+        params["results"] = results
+    elif not start_time:
         print(f"   [API] DB trống, lấy {config.RESULTS} bản ghi đầu tiên...")
         params["results"] = config.RESULTS
     
-    print(f"   [API] Đang gọi Channel {channel_id}...")
-    r = requests.get(url, params=params, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    if verbose:
+        print(f"   [API] Đang gọi Channel {channel_id}...")
+    return url, params
+
+def fetch_json(channel_id, api_key="", start_time=None, end_time=None, results=None, verbose=True):
+    """
+    Lấy JSON từ ThingSpeak.
+    Nếu có start_time, chỉ lấy dữ liệu từ thời điểm đó trở đi (end_time: giới hạn trên).
+    (Bản ghi trùng ở biên cửa sổ bị bỏ qua khi nạp nhờ khóa (channel_id, entry_id).)
+    """
+    url, params = _feeds_request(channel_id, api_key, start_time, end_time, results, verbose)
+    # Client dùng chung: keep-alive, retry/backoff, conditional request
+    return get_client().get_json(url, params)
+
+def fetch_feeds_df(channel_id, api_key="", start_time=None, end_time=None, results=None,
+                   verbose=True, fields=None):
+    """
+    Giống fetch_json + json_to_df nhưng giải mã theo luồng: byte của phản hồi đi
+    thẳng vào các cột NumPy (src/feed_decoder.py), không dựng JSON/dict cho từng feed.
+    Dùng cho các phản hồi lớn (backfill, tới config.RESULTS bản ghi/lần).
+    Trả về (channel_info, DataFrame cùng dạng json_to_df).
+    """
+    url, params = _feeds_request(channel_id, api_key, start_time, end_time, results, verbose)
+    channel_info, columns = decode_feeds(get_client().iter_content(url, params), fields or config.FIELDS)
+    return channel_info, columns_to_df(channel_info, columns)
+
+# ===================================================================
+# BACKFILL LỊCH SỬ: chia khoảng thời gian thành nhiều cửa sổ, tải song song
+# ===================================================================
+
+def fetch_channel_info(channel_id, api_key=""):
+    """Lấy metadata của channel (không kèm feeds), vd: created_at, tên các field."""
+    js = fetch_json(channel_id, api_key, results=0, verbose=False)
+    return js.get("channel", {})
+
+def _split_windows(start_time, end_time, window):
+    """Chia [start_time, end_time] thành các cửa sổ liên tiếp có độ dài tối đa `window`."""
+    windows = []
+    cursor = start_time
+    while cursor < end_time:
+        upper = min(cursor + window, end_time)
+        windows.append((cursor, upper))
+        cursor = upper
+    return windows
+
+def fetch_window(channel_id, api_key, start_time, end_time):
+    """
+    Tải 1 cửa sổ [start_time, end_time]. ThingSpeak trả tối đa config.RESULTS bản ghi/lần,
+    nên nếu cửa sổ bị cắt (đủ RESULTS bản ghi) thì chia đôi và tải lại từng nửa.
+    Trả về (channel_info, DataFrame các feed).
+    """
+    check_cancelled()
+    channel_info, df = fetch_feeds_df(channel_id, api_key, start_time=start_time, end_time=end_time,
+                                      results=config.RESULTS, verbose=False)
+
+    if len(df) >= config.RESULTS and (end_time - start_time) > timedelta(seconds=1):
+        middle = start_time + (end_time - start_time) / 2
+        _, left = fetch_window(channel_id, api_key, start_time, middle)
+        _, right = fetch_window(channel_id, api_key, middle, end_time)
+        df = pd.concat([left, right], ignore_index=True)
+
+    return channel_info, df
+
+def backfill_windows(channel_id, api_key="", start_time=None, end_time=None):
+    """
+    Các cửa sổ backfill [(lo, hi)] (config.BACKFILL_WINDOW_HOURS giờ) của 1 channel.
+    - start_time=None: lấy từ thời điểm tạo channel (None nếu không xác định được).
+    - end_time=None: tới hiện tại.
+    """
+    if start_time is None:
+        created = fetch_channel_info(channel_id, api_key).get("created_at")
+        if not created:
+            print(f"   [API] ⚠️ Không xác định được thời điểm tạo Channel {channel_id}.")
+            return None
+        start_time = pd.to_datetime(created, utc=True).tz_convert(None).to_pydatetime()
+    if end_time is None:
+        end_time = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    windows = _split_windows(start_time, end_time, timedelta(hours=config.BACKFILL_WINDOW_HOURS))
+    print(f"   [API] Backfill Channel {channel_id}: {start_time} -> {end_time} ({len(windows)} cửa sổ)...")
+    return windows
+
+def fetch_windows(channel_id, api_key, windows):
+    """
+    Tải đồng thời các cửa sổ [(lo, hi)] bằng thread pool giới hạn (config.BACKFILL_WORKERS luồng).
+    Trả về DataFrame đã gộp (cùng dạng json_to_df), sắp xếp theo entry_id, không trùng.
+    """
+    frames = []
+    with ThreadPoolExecutor(max_workers=config.BACKFILL_WORKERS) as pool:
+        futures = [pool.submit(fetch_window, channel_id, api_key, lo, hi) for lo, hi in windows]
+        try:
+            for future in as_completed(futures):
+                _, df = future.result()
+                if not df.empty:
+                    frames.append(df)
+        except JobCancelled:
+            # Bỏ các cửa sổ chưa bắt đầu tải
+            pool.shutdown(cancel_futures=True)
+            raise
+
+    if not frames:
+        print(f"   [API] ✅ Backfill xong: 0 bản ghi.")
+        return pd.DataFrame()
+    merged = (pd.concat(frames, ignore_index=True)
+              .dropna(subset=["entry_id"])
+              .drop_duplicates(subset="entry_id", keep="last")
+              .sort_values("entry_id", ignore_index=True))
+    print(f"   [API] ✅ Backfill xong: {len(merged)} bản ghi.")
+    return merged
+
+def backfill_channel(channel_id, api_key="", start_time=None, end_time=None):
+    """Backfill lịch sử của 1 channel: tải các cửa sổ của backfill_windows bằng fetch_windows."""
+    windows = backfill_windows(channel_id, api_key, start_time, end_time)
+    if windows is None:
+        return fetch_feeds_df(channel_id, api_key)[1]
+    return fetch_windows(channel_id, api_key, windows)
+
+def plan_new_data(channel_id, api_key="", last_ts=None):
+    """
+    Bước lập kế hoạch chung của ETL tăng dần (fetch_new_data và pipeline ETL).
+    Trả về (df, windows):
+    - (DataFrame, None): đã tải xong trong 1 lần gọi (lần gọi tăng dần thường nhỏ nên vẫn
+      đi qua fetch_json để giữ conditional request / 304; hoặc không rõ thời điểm tạo channel).
+    - (None, [(lo, hi)]): DB trống, hoặc lần gọi bị cắt ở config.RESULTS bản ghi (mất kết nối lâu)
+      -> các cửa sổ backfill cần tải để không bỏ sót lịch sử.
+    """
+    if last_ts is not None:
+        js = fetch_json(channel_id, api_key, start_time=last_ts)
+        if len(js.get("feeds", [])) < config.RESULTS:
+            return json_to_df(js, config.FIELDS), None
+        print(f"   [API] ⚠️ Nhận đủ {config.RESULTS} bản ghi (có thể bị cắt), chuyển sang backfill...")
+
+    windows = backfill_windows(channel_id, api_key, start_time=last_ts)
+    if windows is None:
+        return fetch_feeds_df(channel_id, api_key)[1], None
+    return None, windows
+
+def fetch_new_data(channel_id, api_key="", last_ts=None):
+    """Lấy dữ liệu mới của 1 channel kể từ last_ts (theo plan_new_data), trả về DataFrame (dạng json_to_df)."""
+    df, windows = plan_new_data(channel_id, api_key, last_ts)
+    if windows is None:
+        return df
+    return fetch_windows(channel_id, api_key, windows)
+
+def _rename_map(channel_info, fields):
+    """field1.. -> tên field trong metadata của channel (nếu có)."""
+    rename_map = {}
+    for f in fields:
+        if f in channel_info and channel_info[f]:
+            rename_map[f] = channel_info[f].strip() # Xóa khoảng trắng thừa
+        else:
+            rename_map[f] = f
+    return rename_map
 
 def json_to_df(js, fields=None):
     feeds = js.get("feeds", [])
@@ -79,12 +265,7 @@ def json_to_df(js, fields=None):
         sample = feeds[0]
         fields = [k for k in sample.keys() if k.startswith("field")]
 
-    rename_map = {}
-    for f in fields:
-        if f in channel_info and channel_info[f]:
-            rename_map[f] = channel_info[f].strip() # Xóa khoảng trắng thừa
-        else:
-            rename_map[f] = f
+    rename_map = _rename_map(channel_info, fields)
 
     rows = []
     for f in feeds:
@@ -106,21 +287,92 @@ def json_to_df(js, fields=None):
     df = df[["created_at", "entry_id"] + all_renamed_cols] 
     return df
 
+def columns_to_df(channel_info, columns):
+    """
+    Dựng DataFrame (cùng dạng json_to_df) từ các cột của decode_feeds.
+    Đổi tên field theo metadata của channel 1 lần cho cả cột, không sao chép dữ liệu.
+    """
+    if len(columns["entry_id"]) == 0:
+        return pd.DataFrame()
+    fields = [k for k in columns if k not in ("created_at", "entry_id")]
+    rename_map = _rename_map(channel_info, fields)
+
+    data = {
+        "created_at": pd.DatetimeIndex(columns["created_at"]).tz_localize("UTC"),
+        "entry_id": columns["entry_id"],
+    }
+    for f in fields:
+        data[rename_map[f]] = columns[f]
+    return pd.DataFrame(data, copy=False)
+
 # ===================================================================
 # HÀM NẠP VÀO DWH (Đã sửa để khớp DB mới)
 # ===================================================================
 
-def to_int_or_none(v):
-    try:
-        return int(v) if pd.notna(v) else None
-    except (ValueError, TypeError):
-        return None
+def _numeric_column(df, col, as_int=False):
+    """
+    Ép kiểu cả cột một lần (int hoặc float), NaN/không hợp lệ -> None (NULL).
+    Trả về mảng object chứa int/float Python để sqlite3 nhận trực tiếp.
+    """
+    if col not in df.columns:
+        return repeat(None, len(df))
 
-def to_float_or_none(v):
-    try:
-        return float(v) if pd.notna(v) else None
-    except (ValueError, TypeError):
-        return None
+    values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    missing = ~np.isfinite(values) if as_int else np.isnan(values)
+    if as_int:
+        out = np.where(missing, 0, values).astype(np.int64).astype(object)
+    else:
+        out = values.astype(object)
+    out[missing] = None
+    return out
+
+def _timestamp_seconds(df):
+    """
+    created_at -> (giây "trên đồng hồ", epoch giây UTC, mặt nạ mốc thiếu), mảng int64 (mốc thiếu = 0).
+    Mốc thời gian không có múi giờ được coi là UTC (giống Timestamp.timestamp()).
+    Dùng chung cho đường nạp thường (_timestamp_columns) và bulk (_bulk_columns).
+    """
+    ts = pd.to_datetime(df["created_at"], errors="coerce")
+    missing = ts.isna().to_numpy()
+    wall_clock = ts.dt.tz_localize(None) if ts.dt.tz is not None else ts
+    naive_utc = ts.dt.tz_convert(None) if ts.dt.tz is not None else ts
+    wall = wall_clock.to_numpy().astype("datetime64[s]").astype(np.int64)
+    epoch = naive_utc.to_numpy().astype("datetime64[s]").astype(np.int64)
+    wall[missing] = epoch[missing] = 0
+    return wall, epoch, missing
+
+def _timestamp_columns(df):
+    """Chuyển cột created_at một lần sang (chuỗi 'YYYY-mm-dd HH:MM:SS', epoch giây)."""
+    if "created_at" not in df.columns:
+        return repeat(None, len(df)), repeat(None, len(df))
+
+    wall, seconds, missing = _timestamp_seconds(df)
+    # Định dạng bằng NumPy (giống strftime) thay vì từng Timestamp
+    text = np.char.replace(np.datetime_as_string(wall.astype("datetime64[s]")), "T", " ").astype(object)
+    text[missing] = None
+    epoch = seconds.astype(object)
+    epoch[missing] = None
+    return text, epoch
+
+def _dataframe_to_records(df_final, channel_id):
+    """
+    Transform dạng cột: mỗi cột được định dạng/ép kiểu đúng 1 lần,
+    sau đó ghép thành generator các tuple cho executemany (không truy cập pandas theo dòng).
+    Thứ tự: channel_id + 7 cột trong DB + created_ts (epoch UTC).
+    channel_id: 1 giá trị cho cả df, hoặc 1 mảng (mỗi dòng 1 channel).
+    """
+    created_at, created_ts = _timestamp_columns(df_final)
+    return zip(
+        repeat(channel_id) if isinstance(channel_id, str) else channel_id,
+        created_at,
+        _numeric_column(df_final, "entry_id", as_int=True),
+        _numeric_column(df_final, "power_w"),
+        _numeric_column(df_final, "energy_wh"),
+        _numeric_column(df_final, "presence", as_int=True),
+        _numeric_column(df_final, "state", as_int=True),
+        _numeric_column(df_final, "time_s"),
+        created_ts,
+    )
 
 CSV_TO_DB_MAP = {
     "created_at": "created_at",
@@ -132,71 +384,394 @@ CSV_TO_DB_MAP = {
     "Time_s (s)": "time_s"
 }
 
-def load_dataframe_to_dwh(df):
+def _update_etl_state(cur, channel_id, max_id_before, inserted):
     """
-    Nạp một DataFrame (chỉ chứa dữ liệu MỚI) vào DWH (bảng 7 cột).
+    Ghi watermark của channel dựa trên các bản ghi vừa chèn (id > max_id_before).
+    Watermark chỉ tiến lên, không bao giờ lùi (nạp lại dữ liệu cũ không làm hỏng).
     """
-    print(f"--- [TL] Bắt đầu Transform & Load ---")
+    cur.execute("""
+        SELECT MAX(entry_id), MAX(created_ts)
+        FROM fact_measurement
+        WHERE id > ? AND channel_id = ?
+    """, (max_id_before, channel_id))
+    last_entry_id, last_created_ts = cur.fetchone()
+    last_created_at = (
+        datetime.fromtimestamp(last_created_ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        if last_created_ts is not None else None
+    )
 
-    conn = sqlite3.connect(config.DB_FILE)
-    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO etl_state (
+            channel_id, last_entry_id, last_created_ts, last_created_at,
+            last_run_at, last_run_rows, total_rows
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(channel_id) DO UPDATE SET
+            last_entry_id = COALESCE(MAX(excluded.last_entry_id, last_entry_id), excluded.last_entry_id, last_entry_id),
+            last_created_at = CASE
+                WHEN last_created_ts IS NULL OR excluded.last_created_ts > last_created_ts
+                THEN excluded.last_created_at ELSE last_created_at END,
+            last_created_ts = COALESCE(MAX(excluded.last_created_ts, last_created_ts), excluded.last_created_ts, last_created_ts),
+            last_run_at = excluded.last_run_at,
+            last_run_rows = excluded.last_run_rows,
+            total_rows = total_rows + excluded.total_rows
+    """, (
+        channel_id, last_entry_id, last_created_ts, last_created_at,
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), inserted, inserted,
+    ))
+
+def load_dataframe_to_dwh(df, channel_id=None, bulk=False):
+    """
+    Nạp một DataFrame vào DWH (bảng 7 cột) cho một channel.
+    Idempotent: bản ghi đã có (cùng channel_id, entry_id) sẽ được bỏ qua.
+    Transform chạy trên luồng gọi; phần ghi DB được gửi cho luồng ghi duy nhất.
+    bulk=True: chế độ nạp hàng loạt cho lần nhập lịch sử lớn (xem bulk_load_dataframe).
+    """
+    print(f"--- [TL] Bắt đầu Transform & Load{' (bulk)' if bulk else ''} ---")
+    if channel_id is None:
+        channel_id = _default_channel_id()
+    channel_id = str(channel_id)
+    if bulk:
+        return bulk_load_dataframe(df, channel_id)
 
     try:
-        # Bước 1: Đổi tên cột DF để khớp với DB
-        # Chỉ giữ lại các cột có trong bản đồ map
-        df_renamed = df.rename(columns=CSV_TO_DB_MAP)
-        
-        # Lấy danh sách các cột DB mà chúng ta thực sự có
-        db_cols_to_insert = [col for col in df_renamed.columns if col in CSV_TO_DB_MAP.values()]
-        
-        if len(db_cols_to_insert) < 2: # Ít nhất phải có created_at
+        facts_to_insert = prepare_records(df, channel_id)
+        if facts_to_insert is None:
              print(f"   [TL] ⚠️ Không tìm thấy cột nào khớp với bản đồ . Bỏ qua.")
              print(f"      Các cột tìm thấy: {list(df.columns)}")
              return False
 
-        df_final = df_renamed[db_cols_to_insert]
+        n_records = len(facts_to_insert)
+        print(f"   [TL] Chuẩn bị {n_records} bản ghi...")
 
-        facts_to_insert = []
-        print(f"   [TL] Chuẩn bị {len(df_final)} bản ghi MỚI...")
-        
-        for _, row in df_final.iterrows():
-            # Tạo tuple theo đúng thứ tự 7 cột trong DB
-            facts_to_insert.append((
-                row.get("created_at").strftime("%Y-%m-%d %H:%M:%S") if pd.notna(row.get("created_at")) else None,
-                to_int_or_none(row.get("entry_id")),
-                to_float_or_none(row.get("power_w")),
-                to_float_or_none(row.get("energy_wh")),
-                to_int_or_none(row.get("presence")),
-                to_int_or_none(row.get("state")),
-                to_float_or_none(row.get("time_s"))
-            ))
-
-        if not facts_to_insert:
+        if n_records == 0:
             print("   [DB] Không có bản ghi mới nào để nạp.")
             return True
 
-        print(f"   [DB] Đang nạp {len(facts_to_insert)} bản ghi MỚI...")
-        
-        # Câu lệnh INSERT khớp với 7 cột
-        cur.executemany("""
-            INSERT INTO fact_measurement (
-                created_at, entry_id, power_w, energy_wh,
-                presence, state, time_s
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, facts_to_insert)
-        
+        print(f"   [DB] Đang nạp {n_records} bản ghi...")
+        return load_records(facts_to_insert, channel_id) is not None
+
+    except Exception as e:
+         print(f"   [TL] ❌ Lỗi không xác định trong quá trình Transform/Load: {e}")
+         print(f"      Kiểm tra lại tên cột trong CSV_TO_DB_MAP?")
+         return False
+
+def _map_columns(df):
+    """
+    Đổi tên cột DF để khớp với DB (CSV_TO_DB_MAP), chỉ giữ lại các cột có trong bản đồ map.
+    None nếu không có cột nào khớp. Dùng chung cho đường nạp thường và bulk.
+    """
+    df_renamed = df.rename(columns=CSV_TO_DB_MAP)
+    db_cols_to_insert = [col for col in df_renamed.columns if col in CSV_TO_DB_MAP.values()]
+    if len(db_cols_to_insert) < 2: # Ít nhất phải có created_at
+        return None
+    return df_renamed[db_cols_to_insert]
+
+def prepare_records(df, channel_id):
+    """
+    Bước Transform của load_dataframe_to_dwh: đổi tên cột theo CSV_TO_DB_MAP rồi
+    chuyển sang list tuple cho executemany. None nếu không có cột nào khớp.
+    """
+    df_final = _map_columns(df)
+    if df_final is None:
+        return None
+    return list(_dataframe_to_records(df_final, str(channel_id)))
+
+def load_records(facts_to_insert, channel_id):
+    """
+    Bước Load: gửi các bản ghi đã transform cho luồng ghi (1 transaction).
+    Trả về số bản ghi thực sự được chèn (bỏ qua bản ghi trùng), None nếu lỗi.
+    """
+    return get_writer().run(_write_records, facts_to_insert, len(facts_to_insert), str(channel_id))
+
+def load_channels_to_dwh(df):
+    """
+    Nạp 1 lô gồm NHIỀU channel (cột channel_id + các cột DB) trong 1 transaction.
+    Dành cho lô nhỏ, nhiều channel (vd: server nhận dữ liệu đẩy): transform 1 lần
+    cho cả lô và 1 commit thay vì 1 lần / channel. Chỉ in lỗi; trả về True/False.
+    """
+    if df.empty:
+        return True
+    df = df.sort_values("channel_id", kind="stable")
+    channels = df["channel_id"].astype(str).to_numpy()
+    records = list(_dataframe_to_records(df.rename(columns=CSV_TO_DB_MAP), channels))
+
+    bounds = [0, *(np.flatnonzero(channels[1:] != channels[:-1]) + 1), len(channels)]
+    groups = [(channels[s], records[s:e]) for s, e in zip(bounds[:-1], bounds[1:])]
+    return get_writer().run(_write_channel_groups, groups)
+
+def _write_channel_groups(conn, groups):
+    """
+    Chạy trên luồng ghi: [(channel_id, records)] -> INSERT + bảng dẫn xuất, 1 commit.
+    Rollup của cả lô được tính trong 1 lần (update_rollups_many).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM fact_measurement")
+        max_id_before = cur.fetchone()[0]
+        inserted = {}
+        for channel_id, records in groups:
+            changes_before = conn.total_changes
+            cur.executemany(_INSERT_FACT, records)
+            inserted[channel_id] = conn.total_changes - changes_before
+
+        for channel_id, n in inserted.items():
+            _update_etl_state(cur, channel_id, max_id_before, n)
+        update_rollups_many(cur, max_id_before)
+        for channel_id, n in inserted.items():
+            if n:
+                update_sessions(cur, channel_id, max_id_before)
         conn.commit()
-        print(f"   [DB] ✅ Đã nạp thành công {len(facts_to_insert)} bản ghi.")
         return True
+    except sqlite3.Error as e:
+        print(f"   [DB] ❌ Lỗi SQLite khi nạp dữ liệu: {e}")
+        conn.rollback()
+        return False
+
+# Câu lệnh INSERT khớp với 7 cột; local_day do SQLite tính từ created_ts (?9)
+# ON CONFLICT DO NOTHING: nạp lại cửa sổ chồng lấn là thao tác rỗng
+_INSERT_FACT = """
+    INSERT INTO fact_measurement (
+        channel_id, created_at, entry_id, power_w, energy_wh,
+        presence, state, time_s, created_ts, local_day
+    ) VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, date(?9, 'unixepoch', 'localtime'))
+    ON CONFLICT(channel_id, entry_id) DO NOTHING
+"""
+
+def _insert_channel_records(cur, facts_to_insert, channel_id):
+    """INSERT + watermark + rollup + phiên của 1 channel (chưa commit). Trả về số bản ghi đã chèn."""
+    conn = cur.connection
+    changes_before = conn.total_changes
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM fact_measurement")
+    max_id_before = cur.fetchone()[0]
+    cur.executemany(_INSERT_FACT, facts_to_insert)
+    inserted = conn.total_changes - changes_before
+
+    # Cập nhật watermark + rollup + phiên trong CÙNG transaction: nếu nạp lỗi
+    # giữa chừng thì các bảng dẫn xuất cũng không thay đổi.
+    _update_etl_state(cur, channel_id, max_id_before, inserted)
+    if inserted:
+        update_rollups(cur, channel_id, max_id_before)
+        update_sessions(cur, channel_id, max_id_before)
+    return inserted
+
+def _write_records(conn, facts_to_insert, n_records, channel_id):
+    """Chạy trên luồng ghi: INSERT + watermark + rollup trong 1 transaction. Trả về số bản ghi đã chèn / None."""
+    cur = conn.cursor()
+    try:
+        inserted = _insert_channel_records(cur, facts_to_insert, channel_id)
+        conn.commit()
+        skipped = n_records - inserted
+        print(f"   [DB] ✅ Đã nạp thành công {inserted} bản ghi (bỏ qua {skipped} bản ghi trùng).")
+        return inserted
 
     except sqlite3.Error as e:
         print(f"   [DB] ❌ Lỗi SQLite khi nạp dữ liệu: {e}")
         conn.rollback()
+        return None
+
+# ===================================================================
+# NẠP HÀNG LOẠT (bulk): nhập lịch sử lớn
+# ===================================================================
+# Khác đường nạp thường (executemany từng dòng, tính rollup/phiên tăng dần):
+# - Transform trả về các cột dạng list (không dựng tuple cho từng dòng);
+#   local_day tính ở Python theo từng khối 15 phút thay vì date(..., 'localtime') mỗi dòng.
+# - INSERT nhiều dòng / câu lệnh (_BULK_ROWS_PER_STATEMENT) trong 1 transaction duy nhất.
+# - PRAGMA nới lỏng trong lúc nạp: synchronous=OFF, journal_mode=MEMORY (chỉ đổi được
+#   khi không có kết nối nào khác đang mở file DB; nếu không thì giữ WAL), cache lớn.
+# - Dựng lại index trì hoãn: các index không duy nhất (database.create.FACT_INDEXES) bị
+#   xóa trong lúc chèn và tạo lại 1 lần sau đó (sắp xếp 1 lần thay vì cập nhật B-tree
+#   từng dòng). Chỉ giữ khóa duy nhất (channel_id, entry_id) để bỏ bản ghi trùng.
+# - Rollup + phiên tính lại 1 lần cho channel ở cuối (rebuild_rollups / rebuild_sessions),
+#   trong cùng transaction: không cập nhật tăng dần theo từng khối.
+# - Kết thúc (kể cả khi lỗi): trả lại WAL + synchronous cũ rồi fsync file DB / WAL,
+#   nên khi hàm trả về dữ liệu đã bền vững như đường nạp thường.
+# Trong lúc nạp, người đọc có thể phải chờ; chỉ dùng cho các lần nhập lớn, chủ động.
+
+_BULK_ROWS_PER_STATEMENT = 1000   # 10 tham số / dòng -> 10.000 tham số (< giới hạn 32766 của SQLite)
+_BULK_COLUMNS = [
+    "channel_id", "created_at", "entry_id", "power_w", "energy_wh",
+    "presence", "state", "time_s", "created_ts", "local_day",
+]
+
+def _bulk_insert_sql(n_rows):
+    values = ",".join(["(" + ",".join("?" * len(_BULK_COLUMNS)) + ")"] * n_rows)
+    return (f"INSERT INTO fact_measurement ({', '.join(_BULK_COLUMNS)}) VALUES {values} "
+            "ON CONFLICT(channel_id, entry_id) DO NOTHING")
+
+def _seconds_to_text(seconds, fmt_len=19):
+    """
+    epoch (giây, int64) -> list chuỗi 'YYYY-mm-dd HH:MM:SS' (fmt_len=10: 'YYYY-mm-dd').
+    Phần ngày định dạng 1 lần cho mỗi ngày khác nhau, giờ:phút:giây ghép bằng phép tính số.
+    """
+    days, inverse = np.unique(seconds // 86400, return_inverse=True)
+    day_text = np.datetime_as_string(days.astype("datetime64[D]")).astype("U10")
+    if fmt_len == 10:
+        return day_text[inverse].tolist()
+
+    chars = np.empty((len(seconds), 19), dtype=np.uint32)
+    chars[:, :10] = day_text.view(np.uint32).reshape(-1, 10)[inverse]
+    sod = seconds - days[inverse] * 86400
+    for pos, value in ((11, sod // 3600), (14, sod // 60 % 60), (17, sod % 60)):
+        chars[:, pos] = 48 + value // 10
+        chars[:, pos + 1] = 48 + value % 10
+    chars[:, 10] = ord(" ")
+    chars[:, 13] = chars[:, 16] = ord(":")
+    return chars.view("U19").ravel().tolist()
+
+def _local_days(epoch):
+    """
+    epoch UTC (int64) -> list 'YYYY-mm-dd' theo giờ địa phương (giống date(?, 'unixepoch', 'localtime')).
+    Độ lệch múi giờ / chuyển giờ mùa hè luôn là bội của 15 phút nên chỉ cần đổi mỗi khối 15 phút 1 lần.
+    """
+    blocks, inverse = np.unique(epoch // 900, return_inverse=True)
+    block_days = np.array(
+        [datetime.fromtimestamp(int(b) * 900).strftime("%Y-%m-%d") for b in blocks], dtype=object
+    )
+    return block_days[inverse].tolist()
+
+def _bulk_columns(df_final, channel_id):
+    """
+    Transform dạng cột cho bulk: list giá trị của từng cột trong _BULK_COLUMNS.
+    Số thực giữ dạng float (NaN -> SQLite lưu NULL); cột INT nhận float nguyên và tự
+    chuyển về INTEGER theo kiểu cột, nên dữ liệu lưu giống hệt đường nạp thường.
+    """
+    n = len(df_final)
+    missing_column = [np.nan] * n
+
+    def numeric(col, as_int=False):
+        if col not in df_final.columns:
+            return missing_column
+        values = pd.to_numeric(df_final[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        if as_int:
+            values = np.where(np.isfinite(values), np.trunc(values), np.nan)
+        return values.tolist()
+
+    created_at, created_ts, local_day = [None] * n, [None] * n, [None] * n
+    if "created_at" in df_final.columns:
+        wall, epoch, missing = _timestamp_seconds(df_final)
+        created_at = _seconds_to_text(wall)
+        created_ts = epoch.tolist()
+        local_day = _local_days(epoch)
+        for i in np.flatnonzero(missing):
+            created_at[i] = created_ts[i] = local_day[i] = None
+
+    return [
+        [channel_id] * n,
+        created_at,
+        numeric("entry_id", as_int=True),
+        numeric("power_w"),
+        numeric("energy_wh"),
+        numeric("presence", as_int=True),
+        numeric("state", as_int=True),
+        numeric("time_s"),
+        created_ts,
+        local_day,
+    ]
+
+def _bulk_pragmas(conn, relaxed):
+    """Bật (relaxed=True) / trả lại các PRAGMA của chế độ bulk. Trả về journal_mode đang dùng."""
+    if relaxed:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"PRAGMA cache_size = -{config.BULK_CACHE_KB}")
+        try:
+            # Rời WAL cần quyền độc quyền: thất bại ngay nếu còn kết nối khác (vd: GUI đang mở)
+            return conn.execute("PRAGMA journal_mode = MEMORY").fetchone()[0]
+        except sqlite3.OperationalError:
+            return "wal"
+
+    mode = "wal"
+    try:
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    except sqlite3.OperationalError:
+        # Không vào lại được WAL lúc này: dùng rollback journal trên đĩa (vẫn bền vững)
+        mode = conn.execute("PRAGMA journal_mode = DELETE").fetchone()[0]
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{config.DB_CACHE_KB}")
+    return mode
+
+def _fsync_database(db_path):
+    """Đẩy mọi thứ đã ghi khi synchronous=OFF xuống đĩa (file DB và WAL nếu có)."""
+    for path in (db_path, db_path + "-wal"):
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                os.fsync(f.fileno())
+
+def _write_bulk(conn, columns, n_records, channel_id, db_path):
+    """Chạy trên luồng ghi: nạp hàng loạt 1 channel trong 1 transaction (xem chú thích ở trên)."""
+    cur = conn.cursor()
+    timings = {}
+    journal_mode = _bulk_pragmas(conn, relaxed=True)
+    try:
+        t0 = time.perf_counter()
+        cur.execute("BEGIN")
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM fact_measurement")
+        max_id_before = cur.fetchone()[0]
+        changes_before = conn.total_changes
+        # DROP / CREATE INDEX nằm trong transaction: lỗi -> rollback trả lại index cũ
+        for name, _ in FACT_INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+        step = _BULK_ROWS_PER_STATEMENT
+        full_sql = _bulk_insert_sql(step)
+        width = len(_BULK_COLUMNS)
+        params = [None] * (step * width)
+        for start in range(0, n_records, step):
+            stop = min(start + step, n_records)
+            if stop - start < step:
+                params = [None] * ((stop - start) * width)
+            # Xen kẽ các cột thành 1 list tham số phẳng (gán lát cắt: chạy ở tầng C)
+            for j, column in enumerate(columns):
+                params[j::width] = column[start:stop]
+            cur.execute(full_sql if stop - start == step else _bulk_insert_sql(stop - start), params)
+        inserted = conn.total_changes - changes_before
+        timings["insert"] = time.perf_counter() - t0
+
+        t1 = time.perf_counter()
+        for _, sql in FACT_INDEXES:
+            cur.execute(sql)
+        timings["index"] = time.perf_counter() - t1
+
+        t2 = time.perf_counter()
+        _update_etl_state(cur, channel_id, max_id_before, inserted)
+        if inserted:
+            rebuild_rollups(conn, channel_ids=[channel_id])
+            rebuild_sessions(cur, channel_ids=[channel_id])
+        timings["derived"] = time.perf_counter() - t2
+
+        t3 = time.perf_counter()
+        conn.commit()
+        timings["commit"] = time.perf_counter() - t3
+        print(f"   [DB] ✅ Bulk: đã nạp {inserted} bản ghi (bỏ qua {n_records - inserted} bản ghi trùng) | "
+              f"INSERT {timings['insert']:.2f}s ({inserted / max(timings['insert'], 1e-9):,.0f} bản ghi/s), "
+              f"index {timings['index']:.2f}s, rollup+phiên {timings['derived']:.2f}s, "
+              f"commit {timings['commit']:.2f}s [journal={journal_mode}]")
+        return True
+
+    except sqlite3.Error as e:
+        print(f"   [DB] ❌ Lỗi SQLite khi nạp hàng loạt: {e}")
+        conn.rollback()
         return False
-    except Exception as e:
-         print(f"   [TL] ❌ Lỗi không xác định trong quá trình Transform/Load: {e}")
-         print(f"      Kiểm tra lại tên cột trong CSV_TO_DB_MAP?")
-         return False
     finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+        # Trả lại độ bền bình thường trước khi nhận tác vụ ghi khác
+        _bulk_pragmas(conn, relaxed=False)
+        _fsync_database(db_path)
+
+def bulk_load_dataframe(df, channel_id):
+    """
+    Chế độ bulk của load_dataframe_to_dwh: nạp DataFrame lớn (nhập lịch sử) của 1 channel.
+    Cùng kết quả với đường nạp thường (idempotent theo (channel_id, entry_id), watermark,
+    rollup, phiên) nhưng nhanh hơn nhiều. Trả về True/False.
+    """
+    channel_id = str(channel_id)
+    df_final = _map_columns(df)
+    if df_final is None:
+        print(f"   [TL] ⚠️ Không tìm thấy cột nào khớp với bản đồ . Bỏ qua.")
+        return False
+
+    t0 = time.perf_counter()
+    columns = _bulk_columns(df_final, channel_id)
+    n_records = len(df_final)
+    print(f"   [TL] Bulk: chuẩn bị {n_records} bản ghi trong {time.perf_counter() - t0:.2f}s...")
+    if n_records == 0:
+        return True
+    return get_writer().run(_write_bulk, columns, n_records, channel_id, config.DB_FILE)
@@ -0,0 +1,34 @@
+import io
+import contextlib
+
+import pytest
+
+import config
+from database.create import create_database_schema
+from database.connection import close_all
+from src import http_client
+from src.query_cache import query_cache
+from tests.stub_server import ThingSpeakStub
+
+
+@pytest.fixture
+def dwh(tmp_path, monkeypatch):
+    """DWH rỗng (đủ schema) trong thư mục tạm; luồng ghi / pool đọc dùng chung trỏ vào đó."""
+    close_all()
+    monkeypatch.setattr(config, "DB_FILE", str(tmp_path / "dw.db"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_database_schema()
+    query_cache.clear()
+    yield config.DB_FILE
+    close_all()
+    query_cache.clear()
+
+@pytest.fixture
+def thingspeak(monkeypatch):
+    """Server giả ThingSpeak; extractor gọi tới nó qua 1 HTTP client mới (không chờ khi thử lại)."""
+    stub = ThingSpeakStub().start()
+    monkeypatch.setattr(config, "THINGSPEAK_URL", stub.url)
+    monkeypatch.setattr(config, "HTTP_BACKOFF_BASE", 0.0)
+    monkeypatch.setattr(http_client, "_client", None)
+    yield stub
+    stub.stop()
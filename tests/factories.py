@@ -0,0 +1,39 @@
+import io
+import contextlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from src.utils import load_dataframe_to_dwh
+
+# ===================================================================
+# DỮ LIỆU GIẢ CHO TEST (cùng dạng json_to_df / feeds của ThingSpeak)
+# ===================================================================
+
+def today_start_utc(hours=1):
+    """Mốc UTC (không kèm múi giờ) ứng với `hours` giờ sau nửa đêm HÔM NAY (giờ địa phương)."""
+    local = datetime.combine(datetime.now().date(), datetime.min.time()) + timedelta(hours=hours)
+    return pd.Timestamp(local.astimezone()).tz_convert("UTC").tz_localize(None)
+
+def feed_frame(state, energy_wh=None, presence=None, power_w=None, start=None, step_s=15, first_entry=1):
+    """DataFrame feed với tên cột theo metadata của channel (như sau json_to_df)."""
+    n = len(state)
+    start = today_start_utc() if start is None else pd.Timestamp(start)
+    nan = np.full(n, np.nan)
+    return pd.DataFrame({
+        "created_at": (start + pd.to_timedelta(step_s * np.arange(n), unit="s")).tz_localize("UTC"),
+        "entry_id": np.arange(first_entry, first_entry + n),
+        "Power (W)": nan if power_w is None else np.asarray(power_w, dtype=float),
+        "Energy(Wh)": nan if energy_wh is None else np.asarray(energy_wh, dtype=float),
+        "Presence (0/1)": nan if presence is None else np.asarray(presence, dtype=float),
+        "State (0/1)": np.asarray(state, dtype=float),
+        "Time_s (s)": step_s * np.arange(n, dtype=float),
+    })
+
+def load_quietly(df, channel_id="101", **kwargs):
+    """load_dataframe_to_dwh nhưng không in log; trả về (kết quả, log)."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        ok = load_dataframe_to_dwh(df, channel_id, **kwargs)
+    return ok, out.getvalue()
@@ -0,0 +1,91 @@
+# ===================================================================
+# CÁC VÒNG LẶP CŨ (trước khi vector hóa) - CHUẨN ĐỂ SO SÁNH
+# ===================================================================
+# Chép lại logic của bản gốc để test (kết quả phải giống hệt) và
+# benchmark (so tốc độ cũ / mới) dùng chung. Không dùng trong mã chạy thật.
+
+import pandas as pd
+
+
+def streak_windows_loop(df, target):
+    """
+    Vòng lặp itertuples() cũ của analyze_waste: các cặp (bắt đầu, kết thúc)
+    của mỗi `target` bản ghi LIÊN TIẾP state=1, presence=0 (đủ thì đặt lại bộ đếm).
+    """
+    windows = []
+    bad_streak_counter = 0
+    streak_start_time = None
+    for row in df.itertuples():
+        is_bad_state = (row.state == 1 and row.presence == 0)
+        if is_bad_state:
+            if bad_streak_counter == 0:
+                streak_start_time = row.created_at
+            bad_streak_counter += 1
+        else:
+            bad_streak_counter = 0
+            streak_start_time = None
+
+        if bad_streak_counter == target:
+            windows.append((streak_start_time, row.created_at))
+            bad_streak_counter = 0
+            streak_start_time = None
+    return windows
+
+def session_max_loop(df):
+    """
+    Vòng lặp itertuples() cũ của analyze_high_consumption: các phiên state=1 dạng
+    (bắt đầu, kết thúc, MAX(energy_wh), còn mở ở cuối dữ liệu?).
+    NaN ở bản ghi đầu phiên tính là 0.0, các NaN khác bị bỏ qua.
+    """
+    sessions = []
+    streak_start_time = None
+    current_streak_max_energy = 0.0
+    current_streak_end_time = None
+    for row in df.itertuples():
+        if row.state == 1:
+            if streak_start_time is None:
+                streak_start_time = row.created_at
+                current_streak_max_energy = row.energy_wh if pd.notna(row.energy_wh) else 0.0
+            if pd.notna(row.energy_wh):
+                current_streak_max_energy = max(current_streak_max_energy, row.energy_wh)
+            current_streak_end_time = row.created_at
+        else:
+            if streak_start_time is not None:
+                sessions.append((streak_start_time, current_streak_end_time, current_streak_max_energy, False))
+            streak_start_time = None
+            current_streak_max_energy = 0.0
+            current_streak_end_time = None
+
+    if streak_start_time is not None:
+        sessions.append((streak_start_time, current_streak_end_time, current_streak_max_energy, True))
+    return sessions
+
+def _to_int_or_none(v):
+    try:
+        return int(v) if pd.notna(v) else None
+    except (ValueError, TypeError):
+        return None
+
+def _to_float_or_none(v):
+    try:
+        return float(v) if pd.notna(v) else None
+    except (ValueError, TypeError):
+        return None
+
+def records_iterrows(df_final):
+    """
+    Transform iterrows() cũ của load_dataframe_to_dwh: 1 tuple / dòng theo 7 cột của DB
+    (created_at, entry_id, power_w, energy_wh, presence, state, time_s).
+    """
+    facts = []
+    for _, row in df_final.iterrows():
+        facts.append((
+            row.get("created_at").strftime("%Y-%m-%d %H:%M:%S") if pd.notna(row.get("created_at")) else None,
+            _to_int_or_none(row.get("entry_id")),
+            _to_float_or_none(row.get("power_w")),
+            _to_float_or_none(row.get("energy_wh")),
+            _to_int_or_none(row.get("presence")),
+            _to_int_or_none(row.get("state")),
+            _to_float_or_none(row.get("time_s")),
+        ))
+    return facts
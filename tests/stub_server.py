@@ -0,0 +1,139 @@
+import json
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+# ===================================================================
+# SERVER GIẢ feeds.json CỦA THINGSPEAK (chạy trên cổng ngẫu nhiên)
+# ===================================================================
+# Lọc start / end (gồm cả 2 đầu, giờ UTC) và results (lấy N bản ghi MỚI NHẤT
+# trong khoảng, tối đa 8000) giống API thật. Chỉ dùng cho test.
+# - fail(): các request kế tiếp nhận mã lỗi (vd: 429 / 503 kèm Retry-After).
+# - ETag theo nội dung; If-None-Match khớp -> 304 không kèm thân.
+
+CHANNEL_FIELDS = {
+    "field1": "Power (W)",
+    "field2": "Energy(Wh)",
+    "field3": "Presence (0/1)",
+    "field4": "State (0/1)",
+    "field5": "Time_s (s)",
+}
+
+def make_feeds(n, start="2025-01-01 00:00:00", step_s=15, seed=0):
+    """n feed liên tiếp (giá trị dạng chuỗi như ThingSpeak trả về)."""
+    rng = np.random.default_rng(seed)
+    t0 = pd.Timestamp(start)
+    return [
+        {
+            "created_at": (t0 + pd.Timedelta(seconds=step_s * i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "entry_id": i + 1,
+            "field1": f"{rng.random() * 100:.2f}",
+            "field2": f"{i * 0.25:.3f}",
+            "field3": str(int(rng.random() < 0.3)),
+            "field4": str((i // 40) % 2),
+            "field5": f"{i * step_s:.1f}",
+        }
+        for i in range(n)
+    ]
+
+
+class ThingSpeakStub:
+    """
+    Server giả /channels/<id>/feeds.json. Ghi lại mọi request vào self.requests
+    và địa chỉ các kết nối TCP vào self.connections.
+    """
+
+    def __init__(self, feeds=(), created_at="2025-01-01T00:00:00Z"):
+        self.channel = {"id": 1, "created_at": created_at, **CHANNEL_FIELDS}
+        self.requests = []
+        self.connections = set()
+        self._failures = []
+        self._lock = threading.Lock()
+        self.set_feeds(feeds)
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def set_feeds(self, feeds):
+        with self._lock:
+            self.feeds = list(feeds)
+            self._times = np.array(
+                [pd.Timestamp(f["created_at"]).tz_convert(None).value for f in self.feeds], dtype=np.int64
+            )
+
+    def fail(self, status, times=1, headers=None):
+        """`times` request kế tiếp nhận mã `status` (header tùy chọn, vd: Retry-After)."""
+        with self._lock:
+            self._failures.extend([(status, dict(headers or {}))] * times)
+
+    def feed_requests(self):
+        """Tham số của các request feeds.json đã nhận."""
+        with self._lock:
+            return [params for path, params, headers in self.requests if path.endswith("/feeds.json")]
+
+    # ------------------------------------------------------------------
+    def _select(self, params):
+        mask = np.ones(len(self.feeds), dtype=bool)
+        if "start" in params:
+            mask &= self._times >= pd.Timestamp(params["start"]).value
+        if "end" in params:
+            mask &= self._times <= pd.Timestamp(params["end"]).value
+        selected = [self.feeds[i] for i in np.flatnonzero(mask)]
+        # Không có results: 8000 nếu có start/end, ngược lại 100 bản ghi mới nhất
+        default = 8000 if ("start" in params or "end" in params) else 100
+        results = min(int(params.get("results", default)), 8000)
+        return selected[max(0, len(selected) - results):] if results else []
+
+    def _response(self, params, request_headers):
+        """(mã, header, thân) cho 1 request hợp lệ."""
+        if self._failures:
+            status, headers = self._failures.pop(0)
+            return status, headers, b"-1"
+
+        body = json.dumps({"channel": self.channel, "feeds": self._select(params)}).encode()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if request_headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"Content-Type": "application/json; charset=utf-8", "ETag": etag}, body
+
+    def _handle(self, handler):
+        url = urlsplit(handler.path)
+        params = dict(parse_qsl(url.query))
+        with self._lock:
+            self.requests.append((url.path, params, dict(handler.headers)))
+            self.connections.add(handler.client_address)
+            if not url.path.endswith("/feeds.json"):
+                status, headers, body = 404, {}, b"-1"
+            else:
+                status, headers, body = self._response(params, handler.headers)
+
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
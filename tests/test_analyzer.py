@@ -0,0 +1,84 @@
+import io
+import contextlib
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import config
+from src.analyzer import STREAK_TARGET, analyze_high_consumption, analyze_waste
+from src.query_cache import query_cache
+from src.segmentation import find_streak_windows
+from tests.factories import feed_frame, load_quietly
+
+
+def test_high_consumption_without_sessions(dwh, capsys):
+    # Cả ngày đèn tắt: không có phiên nào -> tổng 0 Wh, không lỗi
+    load_quietly(feed_frame(state=np.zeros(40), energy_wh=np.zeros(40)))
+    recs = analyze_high_consumption()
+    out = capsys.readouterr().out
+    assert recs == []
+    assert "TỔNG TIÊU THỤ ĐIỆN TRONG NGÀY: 0 Wh" in out
+    assert "❌" not in out
+
+def test_high_consumption_session_open_at_end(dwh, capsys):
+    # Phiên cuối vẫn bật ở bản ghi cuối cùng và đã vượt ngưỡng
+    state = np.r_[np.ones(10), np.zeros(5), np.ones(10)]
+    energy = np.r_[np.linspace(1, 20, 10), np.zeros(5), np.linspace(1, 150, 10)]
+    load_quietly(feed_frame(state=state, energy_wh=energy))
+    recs = analyze_high_consumption()
+    out = capsys.readouterr().out
+    assert len(recs) == 1
+    assert "150 Wh" in recs[0] and "Đèn đã bật từ" in recs[0]
+    assert "❌" not in out
+
+def _waste_feed(days=2, seed=11):
+    """Chuỗi 'xấu' dài ngắn ngẫu nhiên (nhiều chuỗi vắt qua ranh giới khối / ngày)."""
+    rng = np.random.default_rng(seed)
+    n = days * 24 * 240
+    lengths = rng.integers(1, 400, n // 50)
+    bad = np.repeat(np.arange(len(lengths)) % 2 == 0, lengths)[:n]
+    return feed_frame(state=np.where(bad, 1, rng.integers(0, 2, n)), presence=np.where(bad, 0, 1),
+                      start="2025-01-01")
+
+def _analyze_waste_quietly(**kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return analyze_waste(datetime(2024, 12, 31), datetime(2025, 1, 4), ["101"], **kwargs)
+
+@pytest.mark.parametrize("chunk_rows", [7, 119, 120, 121, 5000])
+def test_waste_does_not_depend_on_chunk_size(dwh, monkeypatch, chunk_rows):
+    df = _waste_feed()
+    load_quietly(df)
+    mask = ((df["State (0/1)"] == 1) & (df["Presence (0/1)"] == 0)).to_numpy()
+    start_idx, end_idx = find_streak_windows(mask, STREAK_TARGET)
+    created_at = df["created_at"].dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy()
+    expected = [f"Từ {created_at[s]} đến {created_at[e]}." for s, e in zip(start_idx, end_idx)]
+
+    monkeypatch.setattr(config, "ANALYSIS_WORKERS", 1)
+    monkeypatch.setattr(config, "ANALYSIS_CHUNK_ROWS", chunk_rows)
+    # Khóa cache của _run_rules không gồm kích thước khối -> xóa để thực sự đọc lại
+    query_cache.clear()
+    recs = _analyze_waste_quietly()
+    assert len(expected) > 10
+    assert [rec.split("! ")[1] for rec in recs] == expected
+
+def test_waste_memory_is_bounded_by_chunk_size(dwh, monkeypatch):
+    load_quietly(_waste_feed(days=6), bulk=True)
+    monkeypatch.setattr(config, "ANALYSIS_WORKERS", 1)
+
+    def peak(chunk_rows):
+        monkeypatch.setattr(config, "ANALYSIS_CHUNK_ROWS", chunk_rows)
+        query_cache.clear()
+        tracemalloc.start()
+        try:
+            recs = _analyze_waste_quietly()
+            return tracemalloc.get_traced_memory()[1], recs
+        finally:
+            tracemalloc.stop()
+
+    whole_peak, whole_recs = peak(10**9)
+    chunked_peak, chunked_recs = peak(500)
+    assert chunked_recs == whole_recs
+    # 1 khối 500 dòng thay vì cả ngày (~5760 dòng / phân vùng)
+    assert chunked_peak < whole_peak * 0.5
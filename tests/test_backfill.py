@@ -0,0 +1,81 @@
+import io
+import sqlite3
+import contextlib
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import config
+from src.utils import backfill_channel, fetch_new_data
+from tests.factories import load_quietly
+from tests.stub_server import make_feeds
+
+
+@pytest.fixture
+def small_windows(monkeypatch):
+    # Cửa sổ 1 giờ (240 bản ghi) nhưng mỗi lần chỉ trả 100 -> mọi cửa sổ đều phải chia đôi
+    monkeypatch.setattr(config, "BACKFILL_WINDOW_HOURS", 1)
+    monkeypatch.setattr(config, "RESULTS", 100)
+    monkeypatch.setattr(config, "BACKFILL_WORKERS", 4)
+
+def _quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+def _expected(feeds):
+    return pd.DataFrame({
+        "entry_id": [f["entry_id"] for f in feeds],
+        "Power (W)": [float(f["field1"]) for f in feeds],
+        "State (0/1)": [float(f["field4"]) for f in feeds],
+    })
+
+
+def test_backfill_fetches_whole_history_in_order(thingspeak, small_windows):
+    feeds = make_feeds(3000)  # 12.5 giờ dữ liệu, channel tạo lúc 00:00
+    thingspeak.set_feeds(feeds)
+
+    df = _quiet(backfill_channel, "1", end_time=datetime(2025, 1, 1, 13, 0))
+
+    assert df["entry_id"].tolist() == list(range(1, 3001))
+    pd.testing.assert_frame_equal(df[["entry_id", "Power (W)", "State (0/1)"]], _expected(feeds),
+                                  check_dtype=False)
+    assert df["created_at"].iloc[-1] == pd.Timestamp(feeds[-1]["created_at"])
+
+    params = thingspeak.feed_requests()
+    windows = [p for p in params if "end" in p]
+    # 13 cửa sổ 1 giờ, mỗi cửa sổ đủ 100 bản ghi -> chia nhỏ tới khi < RESULTS
+    assert len({(p["start"], p["end"]) for p in windows}) > 13
+    assert all(p["results"] == "100" for p in windows)
+
+def test_backfill_explicit_range(thingspeak, small_windows):
+    thingspeak.set_feeds(make_feeds(2000))
+    df = _quiet(backfill_channel, "1", start_time=datetime(2025, 1, 1, 2, 0), end_time=datetime(2025, 1, 1, 4, 0))
+    # [02:00, 04:00] gồm cả 2 đầu: entry 481..961
+    assert df["entry_id"].tolist() == list(range(481, 962))
+    # Không cần metadata của channel khi đã biết start_time
+    assert all(p.get("results") != "0" for p in thingspeak.feed_requests())
+
+def test_backfill_empty_channel(thingspeak, small_windows):
+    df = _quiet(backfill_channel, "1", end_time=datetime(2025, 1, 1, 3, 0))
+    assert df.empty
+
+def test_fetch_new_data_switches_to_backfill_when_truncated(thingspeak, small_windows, monkeypatch):
+    # Backfill chạy tới hiện tại -> cửa sổ dài để không phải gọi hàng nghìn cửa sổ rỗng
+    monkeypatch.setattr(config, "BACKFILL_WINDOW_HOURS", 24 * 365)
+    thingspeak.set_feeds(make_feeds(1000))
+    # Lần gọi tăng dần nhận đủ RESULTS bản ghi -> có thể bị cắt -> backfill từ last_ts
+    df = _quiet(fetch_new_data, "1", last_ts=datetime(2025, 1, 1, 0, 0))
+    assert df["entry_id"].tolist() == list(range(1, 1001))
+
+def test_backfill_then_load_is_complete_and_idempotent(dwh, thingspeak, small_windows):
+    thingspeak.set_feeds(make_feeds(1500))
+    df = _quiet(backfill_channel, "1", end_time=datetime(2025, 1, 1, 7, 0))
+    assert load_quietly(df, "1")[0]
+    ok, log = load_quietly(df, "1")
+    assert ok and "bỏ qua 1500 bản ghi trùng" in log
+
+    conn = sqlite3.connect(dwh)
+    count, lo, hi = conn.execute("SELECT COUNT(*), MIN(entry_id), MAX(entry_id) FROM fact_measurement").fetchone()
+    conn.close()
+    assert (count, lo, hi) == (1500, 1, 1500)
@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+
+import pandas as pd
+
+from src.feed_decoder import decode_feeds
+from src.utils import columns_to_df, json_to_df
+from tests.stub_server import CHANNEL_FIELDS, make_feeds
+
+
+def _chunks(body, size):
+    return (body[i:i + size] for i in range(0, len(body), size))
+
+def _decoded(body, size, fields=None):
+    return columns_to_df(*decode_feeds(_chunks(body, size), fields))
+
+def _assert_same(body, size, fields=None):
+    expected = json_to_df(json.loads(body), fields)
+    actual = _decoded(body, size, fields)
+    if expected.empty:
+        assert actual.empty
+        return
+    # json_to_df giữ độ phân giải ns, decode_feeds là giây -> so sánh theo giá trị
+    pd.testing.assert_frame_equal(
+        actual.assign(created_at=actual["created_at"].astype("datetime64[s, UTC]")),
+        expected.assign(created_at=expected["created_at"].astype("datetime64[s, UTC]")),
+        check_dtype=False,
+    )
+
+def _tricky_feeds():
+    feeds = make_feeds(30, seed=4)
+    feeds[0]["field1"] = None                # thiếu giá trị
+    feeds[1]["field2"] = "12}"               # '}' trong chuỗi -> không phải số
+    feeds[2]["field3"] = '{"a": [1, 2]}'     # JSON lồng trong chuỗi
+    feeds[3]["field4"] = "\"}],"             # ngoặc kép thoát + ký tự cấu trúc
+    feeds[4]["field5"] = "Đèn bật 💡"         # nhiều byte UTF-8 bị cắt giữa các khối
+    del feeds[5]["field1"]                   # thiếu cả key
+    feeds[6]["status"] = "ok } ]"
+    return feeds
+
+_CHANNEL = {"id": 1, "name": "Phòng {khách} \"A\"", "created_at": "2025-01-01T00:00:00Z", **CHANNEL_FIELDS}
+
+
+@pytest.mark.parametrize("size", range(1, 8))
+def test_matches_json_to_df_for_small_chunks(size):
+    body = json.dumps({"channel": _CHANNEL, "feeds": _tricky_feeds()}).encode()
+    _assert_same(body, size)
+
+@pytest.mark.parametrize("size", [1, 3, 4096])
+def test_channel_after_feeds(size):
+    body = json.dumps({"feeds": _tricky_feeds(), "channel": _CHANNEL}).encode()
+    _assert_same(body, size)
+    channel_info, _ = decode_feeds(_chunks(body, size))
+    assert channel_info == _CHANNEL
+
+@pytest.mark.parametrize("size", [2, 5, 1 << 16])
+def test_nulls_and_explicit_fields(size):
+    feeds = make_feeds(200, seed=2)
+    for i, f in enumerate(feeds):
+        if i % 3 == 0:
+            f["field2"] = None
+        if i % 7 == 0:
+            f["field4"] = None
+    body = json.dumps({"channel": _CHANNEL, "feeds": feeds}, indent=1).encode()
+    _assert_same(body, size)
+    _assert_same(body, size, fields=["field2", "field4"])
+
+def test_empty_feeds():
+    body = json.dumps({"channel": _CHANNEL, "feeds": []}).encode()
+    _assert_same(body, 3)
+    channel_info, columns = decode_feeds(_chunks(body, 3))
+    assert channel_info == _CHANNEL and len(columns["entry_id"]) == 0
@@ -0,0 +1,135 @@
+import io
+import socket
+import contextlib
+from types import SimpleNamespace
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+from src import http_client
+from src.http_client import ThingSpeakClient
+from tests.stub_server import make_feeds
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Ghi lại các lần chờ giữa 2 lần thử (không chờ thật)."""
+    delays = []
+    monkeypatch.setattr(http_client, "time", SimpleNamespace(sleep=delays.append))
+    return delays
+
+def _client(**kwargs):
+    kwargs.setdefault("backoff_base", 0.5)
+    kwargs.setdefault("backoff_max", 30)
+    return ThingSpeakClient(timeout=5, **kwargs)
+
+def _get(client, stub, **params):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.get_json(f"{stub.url}/channels/1/feeds.json", params)
+
+
+def test_retries_transient_errors_then_succeeds(thingspeak, sleeps):
+    thingspeak.set_feeds(make_feeds(5))
+    thingspeak.fail(503, times=2)
+    client = _client(max_retries=3)
+
+    js = _get(client, thingspeak)
+
+    assert [f["entry_id"] for f in js["feeds"]] == [1, 2, 3, 4, 5]
+    stats = client.get_stats()
+    assert stats["requests"] == 3 and stats["retries"] == 2
+    assert len(thingspeak.feed_requests()) == 3
+    # Không có Retry-After -> full jitter trong [0, base * 2^attempt]
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 0.5 and 0 <= sleeps[1] <= 1.0
+
+def test_honours_retry_after_seconds(thingspeak, sleeps):
+    thingspeak.fail(429, times=1, headers={"Retry-After": "7"})
+    client = _client(max_retries=2)
+    _get(client, thingspeak)
+    assert sleeps == [7.0]
+    assert client.get_stats()["retries"] == 1
+
+def test_honours_retry_after_http_date(thingspeak, sleeps):
+    when = datetime.now(timezone.utc) + timedelta(seconds=20)
+    thingspeak.fail(503, times=1, headers={"Retry-After": format_datetime(when, usegmt=True)})
+    _get(_client(max_retries=2), thingspeak)
+    assert len(sleeps) == 1 and 15 <= sleeps[0] <= 20
+
+def test_retry_after_is_capped_by_backoff_max(thingspeak, sleeps):
+    thingspeak.fail(429, times=1, headers={"Retry-After": "3600"})
+    _get(_client(max_retries=2, backoff_max=5), thingspeak)
+    assert sleeps == [5]
+
+def test_gives_up_after_max_retries(thingspeak, sleeps):
+    thingspeak.fail(503, times=10)
+    client = _client(max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        _get(client, thingspeak)
+    stats = client.get_stats()
+    assert stats["requests"] == 3 and stats["retries"] == 2
+    assert len(thingspeak.feed_requests()) == 3
+
+def test_client_errors_are_not_retried(thingspeak, sleeps):
+    thingspeak.fail(400, times=1)
+    client = _client(max_retries=3)
+    with pytest.raises(requests.HTTPError):
+        _get(client, thingspeak)
+    assert client.get_stats()["retries"] == 0 and sleeps == []
+
+def test_connection_errors_are_retried(sleeps):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]  # cổng đã đóng -> từ chối kết nối
+    client = _client(max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.get_json(f"http://127.0.0.1:{port}/channels/1/feeds.json")
+    stats = client.get_stats()
+    assert stats["errors"] == 3 and stats["retries"] == 2
+
+def test_conditional_request_reuses_cached_json(thingspeak, sleeps):
+    thingspeak.set_feeds(make_feeds(3))
+    client = _client()
+
+    first = _get(client, thingspeak, results=3)
+    second = _get(client, thingspeak, results=3)
+
+    assert second == first
+    stats = client.get_stats()
+    assert stats["not_modified"] == 1 and stats["requests"] == 2
+    headers = [h for path, params, h in thingspeak.requests]
+    assert "If-None-Match" not in headers[0]
+    assert headers[1]["If-None-Match"]
+
+    # Dữ liệu đổi -> ETag đổi -> nhận thân mới (200)
+    thingspeak.set_feeds(make_feeds(4))
+    third = _get(client, thingspeak, results=4)
+    assert len(third["feeds"]) == 4
+    assert client.get_stats()["not_modified"] == 1
+
+def test_bytes_counter_and_keep_alive(thingspeak, sleeps):
+    thingspeak.set_feeds(make_feeds(50))
+    client = _client()
+    for _ in range(5):
+        _get(client, thingspeak, results=50, start="2025-01-01 00:00:00")
+
+    sizes = client.get_stats()["bytes"]
+    # 1 kết nối dùng lại cho cả 5 request (keep-alive)
+    assert len(thingspeak.connections) == 1
+    body = requests.get(f"{thingspeak.url}/channels/1/feeds.json",
+                        params={"results": 50, "start": "2025-01-01 00:00:00"}).content
+    # Lần 1 nhận thân đầy đủ, 4 lần sau là 304 rỗng
+    assert sizes == len(body)
+
+def test_iter_content_streams_and_retries(thingspeak, sleeps):
+    thingspeak.set_feeds(make_feeds(20))
+    thingspeak.fail(503, times=1)
+    client = _client(max_retries=2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = list(client.iter_content(f"{thingspeak.url}/channels/1/feeds.json", {"results": 20}, chunk_size=256))
+    assert len(chunks) > 1
+    assert client.get_stats()["bytes"] == sum(map(len, chunks))
+    assert client.get_stats()["retries"] == 1
@@ -0,0 +1,84 @@
+import io
+import sqlite3
+import threading
+import contextlib
+
+import pytest
+import requests
+
+import config
+from src import ingest_server
+from src.ingest_server import IngestBatcher, IngestServer
+
+WRITE_KEY = "TESTWRITEKEY0001"
+
+
+@pytest.fixture
+def server(dwh, monkeypatch):
+    monkeypatch.setattr(config, "INGEST_WRITE_KEYS", {WRITE_KEY: "101"})
+    batcher = IngestBatcher(batch_size=50, flush_interval=0.05).start()
+    srv = IngestServer(("127.0.0.1", 0), batcher)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    srv.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        yield srv
+        srv.stop()
+
+def _update(srv, i):
+    return requests.get(f"{srv.url}/update", params={
+        "api_key": WRITE_KEY, "field1": 1.5, "field2": i, "field3": 0, "field4": 1, "field5": 15 * i,
+        "created_at": f"2025-01-01T00:{i // 4:02d}:{15 * (i % 4):02d}Z",
+    }, timeout=10)
+
+def _entry_ids(db):
+    conn = sqlite3.connect(db)
+    try:
+        return [r[0] for r in conn.execute("SELECT entry_id FROM fact_measurement ORDER BY entry_id")]
+    finally:
+        conn.close()
+
+
+def test_default_config_has_no_write_keys():
+    # Channel mặc định được kéo từ ThingSpeak (CHANNEL_IDS) -> không nhận đẩy song song
+    assert config.INGEST_WRITE_KEYS == {}
+
+def test_entry_id_is_returned_after_commit(server):
+    for i in range(1, 6):
+        r = _update(server, i)
+        assert r.status_code == 200 and r.text == str(i)
+        # Đã trả entry_id -> bản ghi đã nằm trong DB
+        assert _entry_ids(config.DB_FILE)[-1] == i
+
+def test_failed_batch_is_not_acknowledged(server, monkeypatch):
+    assert _update(server, 1).text == "1"
+
+    load = ingest_server.load_channels_to_dwh
+    calls = []
+
+    def failing_once(df):
+        calls.append(len(df))
+        return False if len(calls) == 1 else load(df)
+
+    monkeypatch.setattr(ingest_server, "load_channels_to_dwh", failing_once)
+    r = _update(server, 2)
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+    # Gửi lại: nhận entry_id kế tiếp, không bị nhảy số vì lô lỗi
+    r = _update(server, 2)
+    assert r.status_code == 200 and r.text == "2"
+    assert _entry_ids(config.DB_FILE) == [1, 2]
+    assert server.batcher.get_stats()["failed"] == 1
+
+def test_concurrent_updates_get_distinct_durable_ids(server):
+    results = []
+
+    def send(i):
+        results.append(_update(server, i).text)
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(1, 41)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(map(int, results)) == list(range(1, 41))
+    assert _entry_ids(config.DB_FILE) == list(range(1, 41))
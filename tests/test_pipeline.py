@@ -0,0 +1,56 @@
+import io
+import contextlib
+
+import pytest
+import requests
+
+import config
+from src.pipeline import run_etl_pipeline
+from tests.stub_server import make_feeds
+
+
+@pytest.fixture
+def one_window(monkeypatch):
+    # Backfill từ created_at của channel tới nay trong 1 cửa sổ
+    monkeypatch.setattr(config, "BACKFILL_WINDOW_HOURS", 24 * 365 * 10)
+
+def _run(channels=(("1", ""),)):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        report, _ = run_etl_pipeline(list(channels))
+    return report, out.getvalue()
+
+def _run_channel(cid="1", key=""):
+    from index import run_channel_etl
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_channel_etl(cid, key)
+
+
+def test_reports_inserted_rows_not_submitted(dwh, thingspeak, one_window):
+    thingspeak.set_feeds(make_feeds(300))
+    report, _ = _run()
+    assert report["1"]["ok"] and report["1"]["rows"] == 300
+
+    # Không có dữ liệu mới: bản ghi biên được tải lại nhưng không được chèn
+    report, log = _run()
+    assert report["1"]["ok"] and report["1"]["rows"] == 0
+    assert "Channel 1 không có dữ liệu mới" in log
+
+    thingspeak.set_feeds(make_feeds(305))
+    report, _ = _run()
+    assert report["1"]["rows"] == 5
+
+def test_scheduler_run_goes_through_pipeline(dwh, thingspeak, one_window):
+    thingspeak.set_feeds(make_feeds(300))
+    assert _run_channel() == 300
+    assert _run_channel() == 0
+    thingspeak.set_feeds(make_feeds(305))
+    assert _run_channel() == 5
+
+def test_scheduler_run_raises_original_http_error(dwh, thingspeak, one_window):
+    thingspeak.set_feeds(make_feeds(10))
+    thingspeak.fail(429, times=config.HTTP_MAX_RETRIES + 1)
+    # Bộ lập lịch cần lỗi gốc (có response) để đọc Retry-After
+    with pytest.raises(requests.HTTPError) as exc:
+        _run_channel()
+    assert exc.value.response.status_code == 429
@@ -0,0 +1,118 @@
+import io
+import sqlite3
+import contextlib
+
+import numpy as np
+import pytest
+
+from database.connection import close_all, get_writer
+from database.create import create_database_schema
+from src import utils
+from src.rollups import rebuild_rollups
+from tests.factories import feed_frame, load_quietly
+
+
+def _daily_energy(db):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(energy_wh), 0) FROM rollup_daily").fetchone()[0]
+    finally:
+        conn.close()
+
+def _session_energy(db):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(max_energy_wh), 0) FROM fact_session").fetchone()[0]
+    finally:
+        conn.close()
+
+def _fact_indexes(db):
+    conn = sqlite3.connect(db)
+    try:
+        return sorted(r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'fact_measurement'"))
+    finally:
+        conn.close()
+
+def _rebuild(db):
+    def run(conn):
+        rebuild_rollups(conn)
+        conn.commit()
+    get_writer().run(run)
+    return _daily_energy(db)
+
+
+def test_null_energy_inside_session(dwh):
+    load_quietly(feed_frame(state=np.ones(5), energy_wh=[10, 20, np.nan, 30, 40]))
+    assert _daily_energy(dwh) == pytest.approx(40)
+    assert _session_energy(dwh) == pytest.approx(40)
+    assert _rebuild(dwh) == pytest.approx(40)
+
+def test_null_energy_at_load_boundary(dwh):
+    # Lô 1 kết thúc bằng mẫu thiếu energy_wh, lô 2 tiếp tục cùng phiên
+    df = feed_frame(state=np.ones(6), energy_wh=[10, 20, np.nan, np.nan, 30, 40])
+    load_quietly(df.iloc[:4])
+    load_quietly(df.iloc[4:])
+    assert _daily_energy(dwh) == pytest.approx(40)
+    assert _rebuild(dwh) == pytest.approx(40)
+
+def test_null_energy_at_session_start_and_after_off(dwh):
+    state = [1, 1, 1, 0, 1, 1, 1]
+    energy = [np.nan, 5, 8, np.nan, np.nan, 2, 6]
+    load_quietly(feed_frame(state=state, energy_wh=energy))
+    # Phiên 1: 8 Wh, phiên 2 (thiết bị reset về 0 khi bật lại): 6 Wh
+    assert _daily_energy(dwh) == pytest.approx(14)
+    assert _session_energy(dwh) == pytest.approx(14)
+
+def test_rollup_total_matches_sessions_on_random_feed(dwh):
+    rng = np.random.default_rng(3)
+    n = 3000
+    state = np.repeat(rng.choice([0, 1], n // 30 + 1), 30)[:n]
+    session = np.cumsum(np.r_[1, np.diff(state) != 0])
+    # energy_wh tăng dần trong phiên, về 0 khi bật lại; 10% mẫu bị thiếu
+    energy = np.round(np.cumsum(rng.random(n)), 3)
+    first = np.maximum.accumulate(np.where(np.r_[True, session[1:] != session[:-1]], np.arange(n), 0))
+    energy = energy - energy[first]
+    energy[rng.random(n) < 0.1] = np.nan
+    df = feed_frame(state=state, energy_wh=energy)
+
+    for lo in range(0, n, 700):
+        load_quietly(df.iloc[lo:lo + 700])
+    assert _daily_energy(dwh) == pytest.approx(_session_energy(dwh))
+    assert _rebuild(dwh) == pytest.approx(_session_energy(dwh))
+
+def test_bulk_append_keeps_session_energy(dwh):
+    df = feed_frame(state=np.ones(6), energy_wh=[10, 20, np.nan, np.nan, 30, 40])
+    load_quietly(df.iloc[:3], bulk=True)
+    load_quietly(df.iloc[3:], bulk=True)
+    assert _daily_energy(dwh) == pytest.approx(40)
+
+def test_bulk_recreates_indexes_and_restores_them_on_error(dwh, monkeypatch):
+    indexes = _fact_indexes(dwh)
+    df = feed_frame(state=np.ones(6), energy_wh=[10, 20, 30, 40, 50, 60])
+    ok, _ = load_quietly(df.iloc[:3], bulk=True)
+    assert ok and _fact_indexes(dwh) == indexes
+
+    def broken(conn, **kwargs):
+        raise sqlite3.OperationalError("lỗi giả")
+    monkeypatch.setattr(utils, "rebuild_rollups", broken)
+    ok, _ = load_quietly(df.iloc[3:], bulk=True)
+    # Lỗi sau khi đã xóa index: rollback trả lại index và bỏ các bản ghi của lần nạp
+    assert not ok and _fact_indexes(dwh) == indexes
+    conn = sqlite3.connect(dwh)
+    assert conn.execute("SELECT COUNT(*) FROM fact_measurement").fetchone()[0] == 3
+    conn.close()
+    assert _daily_energy(dwh) == pytest.approx(30)
+
+def test_migration_v4_rebuilds_existing_rollups(dwh):
+    load_quietly(feed_frame(state=np.ones(5), energy_wh=[10, 20, np.nan, 30, 40]))
+    close_all()
+    conn = sqlite3.connect(dwh)
+    conn.execute("UPDATE rollup_daily SET energy_wh = 60")  # giá trị sai của bản cũ
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_database_schema()
+    assert _daily_energy(dwh) == pytest.approx(40)
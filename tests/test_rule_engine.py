@@ -0,0 +1,111 @@
+import io
+import sqlite3
+import contextlib
+
+import numpy as np
+import pytest
+
+import config
+from database.connection import DatabaseWriter
+from src.analyzer import STREAK_TARGET, HIGH_ENERGY_THRESHOLD_WH
+from src.rule_engine import _LATE_QUERY, _ROW_QUERY, run_incremental_analyses
+from src.segmentation import find_streak_windows, segment_sessions
+from tests.factories import feed_frame, load_quietly
+
+_QUERY = "SELECT rule, start_ts, end_ts, ROUND(value, 3), is_open FROM fact_alert ORDER BY rule, start_ts"
+
+def _alerts(db):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(_QUERY).fetchall()
+    finally:
+        conn.close()
+
+def _run():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_incremental_analyses()
+
+def _feed(n=6000, seed=5):
+    """Đèn bật / tắt theo khối 300 mẫu, có người / không người theo khối 200 mẫu."""
+    rng = np.random.default_rng(seed)
+    return feed_frame(
+        state=np.repeat(rng.choice([0, 1], n // 300 + 1, p=[0.3, 0.7]), 300)[:n],
+        presence=np.repeat(rng.choice([0, 1], n // 200 + 1), 200)[:n],
+        energy_wh=np.round(np.cumsum(rng.random(n)) % 250, 3),
+        start="2025-01-01",
+    )
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 119, 120, 121, 5000])
+def test_alerts_do_not_depend_on_chunk_size(dwh, monkeypatch, chunk_rows):
+    df = _feed()
+    load_quietly(df)
+    monkeypatch.setattr(config, "ANALYSIS_CHUNK_ROWS", chunk_rows)
+    recs = _run()
+
+    state, presence = df["State (0/1)"].to_numpy(), df["Presence (0/1)"].to_numpy()
+    start_idx, _ = find_streak_windows((state == 1) & (presence == 0), STREAK_TARGET)
+    _, _, max_energy, _ = segment_sessions(state == 1, df["Energy(Wh)"].to_numpy())
+    alerts = _alerts(dwh)
+    assert sum(a[0] == "waste" for a in alerts) == len(start_idx)
+    assert sum(a[0] == "high_consumption" for a in alerts) == (max_energy > HIGH_ENERGY_THRESHOLD_WH).sum()
+    # Mỗi cảnh báo chỉ được báo 1 lần dù phiên kéo qua nhiều khối
+    assert len(recs) == len(alerts)
+
+def test_split_runs_match_single_run(dwh, monkeypatch):
+    df = _feed()
+    load_quietly(df)
+    _run()
+    whole = _alerts(dwh)
+
+    conn = sqlite3.connect(dwh)
+    conn.execute("DELETE FROM fact_alert")
+    conn.execute("DELETE FROM rule_state")
+    conn.execute("DELETE FROM fact_measurement")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(config, "ANALYSIS_CHUNK_ROWS", 97)
+    cuts = [0, 1, 250, 1900, 1901, 4000, len(df)]
+    for lo, hi in zip(cuts[:-1], cuts[1:]):
+        load_quietly(df.iloc[lo:hi])
+        _run()
+    assert _alerts(dwh) == whole
+
+def test_only_writes_go_to_writer(dwh, monkeypatch):
+    load_quietly(_feed(2000))
+    submitted = []
+    run = DatabaseWriter.run
+
+    def recording(self, fn, *args, **kwargs):
+        submitted.append(fn.__name__)
+        return run(self, fn, *args, **kwargs)
+
+    monkeypatch.setattr(DatabaseWriter, "run", recording)
+    _run()
+    assert submitted == ["_save_results"]
+    _run()  # không có bản ghi mới -> không ghi gì
+    assert submitted == ["_save_results"]
+
+def test_new_rows_are_read_by_index_range(dwh):
+    # Chi phí mỗi lần chạy phải tỉ lệ với bản ghi mới: tìm theo khoảng created_ts / rowid,
+    # không duyệt mọi bản ghi của channel
+    conn = sqlite3.connect(dwh)
+    try:
+        rows_plan = conn.execute("EXPLAIN QUERY PLAN " + _ROW_QUERY, ("101", 0, 0, 1)).fetchall()
+        late_plan = conn.execute("EXPLAIN QUERY PLAN " + _LATE_QUERY, (0, 1, "101", 0)).fetchall()
+    finally:
+        conn.close()
+    assert "(channel_id=? AND created_ts>?)" in rows_plan[0][3]
+    assert "(rowid>? AND rowid<?)" in late_plan[0][3]
+
+def test_late_rows_are_skipped(dwh):
+    df = _feed(600)
+    load_quietly(df.iloc[300:])
+    _run()
+    before = _alerts(dwh)
+
+    load_quietly(df.iloc[:300])
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        n_rows_recs = run_incremental_analyses()
+    assert "bỏ qua 300 bản ghi đến trễ" in out.getvalue()
+    assert n_rows_recs == [] and _alerts(dwh) == before
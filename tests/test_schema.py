@@ -0,0 +1,44 @@
+import io
+import sqlite3
+import contextlib
+
+import config
+from database.connection import close_all
+from database.create import create_database_schema
+
+
+def test_legacy_upgrade_keeps_rows_without_entry_id(tmp_path, monkeypatch):
+    close_all()
+    db = str(tmp_path / "legacy.db")
+    monkeypatch.setattr(config, "DB_FILE", db)
+    monkeypatch.setattr(config, "CHANNEL_IDS", ["101"])
+    conn = sqlite3.connect(db)
+    conn.execute("""
+        CREATE TABLE fact_measurement (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT, entry_id INT,
+            power_w REAL, energy_wh REAL, presence INT, state INT, time_s REAL
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO fact_measurement (created_at, entry_id, state) VALUES (?, ?, 1)",
+        [
+            ("2025-01-01 00:00:00", 1),
+            ("2025-01-01 00:00:15", 2),
+            ("2025-01-01 00:00:15", 2),      # trùng -> bị bỏ
+            ("2025-01-01 00:00:30", None),   # không có entry_id -> giữ cả 3
+            ("2025-01-01 00:00:45", None),
+            ("2025-01-01 00:01:00", None),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_database_schema()
+    finally:
+        close_all()
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT id, entry_id FROM fact_measurement ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [(1, 1), (2, 2), (4, None), (5, None), (6, None)]
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.segmentation import find_streak_windows, segment_sessions
+from tests.legacy import streak_windows_loop, session_max_loop
+
+
+def _random_day(rng, n):
+    """Dữ liệu ngẫu nhiên 15s/mẫu: state có cả NaN, presence thưa (chuỗi 'xấu' dài)."""
+    return pd.DataFrame({
+        "created_at": pd.date_range("2025-01-01", periods=n, freq="15s"),
+        "state": rng.choice([0, 1, np.nan], n, p=[0.2, 0.75, 0.05]),
+        "presence": rng.choice([0, 1], n, p=[0.9, 0.1]),
+    })
+
+def _vectorized_windows(df, target):
+    mask = ((df["state"] == 1) & (df["presence"] == 0)).to_numpy()
+    start_idx, end_idx = find_streak_windows(mask, target)
+    return list(zip(df["created_at"].iloc[start_idx], df["created_at"].iloc[end_idx]))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_streak_windows_match_legacy_loop(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(10):
+        df = _random_day(rng, int(rng.integers(0, 400)))
+        target = int(rng.integers(1, 9))
+        assert _vectorized_windows(df, target) == streak_windows_loop(df, target)
+
+def test_long_run_resets_after_target():
+    # 1 chuỗi xấu dài 2*target + 3 -> đúng 2 cửa sổ nối tiếp nhau, 3 bản ghi dư không cảnh báo
+    target = 5
+    mask = np.ones(2 * target + 3, dtype=bool)
+    start_idx, end_idx = find_streak_windows(mask, target)
+    assert start_idx.tolist() == [0, 5]
+    assert end_idx.tolist() == [4, 9]
+
+def test_broken_run_does_not_count():
+    mask = np.array([1, 1, 1, 0, 1, 1, 1, 1], dtype=bool)
+    start_idx, end_idx = find_streak_windows(mask, 4)
+    assert start_idx.tolist() == [4]
+    assert end_idx.tolist() == [7]
+
+def test_empty_and_no_match():
+    for mask in (np.zeros(0, dtype=bool), np.zeros(10, dtype=bool)):
+        start_idx, end_idx = find_streak_windows(mask, 3)
+        assert len(start_idx) == len(end_idx) == 0
+
+@pytest.mark.parametrize("chunk", [1, 7, 50, 1000])
+def test_carry_across_chunks_matches_whole(chunk):
+    rng = np.random.default_rng(1)
+    mask = rng.random(3000) < 0.97
+    target = 13
+    whole_start, whole_end = find_streak_windows(mask, target)
+
+    starts, ends, carry = [], [], 0
+    for offset in range(0, len(mask), chunk):
+        s, e, carry = find_streak_windows(mask[offset:offset + chunk], target, carry=carry, return_carry=True)
+        starts.extend(s + offset)
+        ends.extend(e + offset)
+    assert starts == whole_start.tolist()
+    assert ends == whole_end.tolist()
+
+
+# ----- segment_sessions (phiên state=1 + MAX(energy_wh)) -----
+
+def _vectorized_sessions(df):
+    start_idx, end_idx, max_values, last_is_open = segment_sessions(
+        (df["state"] == 1).to_numpy(), df["energy_wh"].to_numpy()
+    )
+    created_at = df["created_at"]
+    is_open = [last_is_open and i == len(start_idx) - 1 for i in range(len(start_idx))]
+    return list(zip(created_at.iloc[start_idx], created_at.iloc[end_idx], max_values.tolist(), is_open))
+
+@pytest.mark.parametrize("seed", range(20))
+def test_sessions_match_legacy_loop(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(10):
+        n = int(rng.integers(0, 300))
+        df = pd.DataFrame({
+            "created_at": pd.date_range("2025-01-01", periods=n, freq="15s"),
+            # Khối bật/tắt dài vài mẫu + NaN rải rác (kể cả ở đầu phiên)
+            "state": np.repeat(rng.choice([0, 1, np.nan], n // 4 + 1, p=[0.4, 0.55, 0.05]), 4)[:n],
+            "energy_wh": np.where(rng.random(n) < 0.1, np.nan, rng.random(n) * 200),
+        })
+        assert _vectorized_sessions(df) == session_max_loop(df)
+
+def test_session_open_at_end():
+    on = np.array([0, 1, 1, 0, 1, 1, 1], dtype=bool)
+    start_idx, end_idx, max_values, last_is_open = segment_sessions(on, [0, 5, 7, 0, 1, np.nan, 3])
+    assert start_idx.tolist() == [1, 4]
+    assert end_idx.tolist() == [2, 6]
+    assert max_values.tolist() == [7.0, 3.0]
+    assert last_is_open
+
+def test_session_nan_at_start_counts_as_zero():
+    _, _, max_values, last_is_open = segment_sessions(np.array([1, 1, 0], dtype=bool), [np.nan, np.nan, 9])
+    assert max_values.tolist() == [0.0]
+    assert not last_is_open
+
+def test_no_sessions():
+    # Ngày không có state=1: tổng MAX của các phiên = 0 (bản cũ lỗi UnboundLocalError)
+    start_idx, _, max_values, last_is_open = segment_sessions(np.zeros(50, dtype=bool), np.ones(50))
+    assert len(start_idx) == 0
+    assert float(max_values.sum()) == 0.0
+    assert not last_is_open
+
+def test_carry_max_continues_open_session():
+    on = np.array([1, 1, 0, 1], dtype=bool)
+    _, _, max_values, _ = segment_sessions(on, [2, 4, 0, 1], carry_max=10.0)
+    assert max_values.tolist() == [10.0, 1.0]
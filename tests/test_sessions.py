@@ -0,0 +1,90 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from database.connection import get_writer
+from src import sessions
+from src.sessions import rebuild_sessions
+from tests.factories import feed_frame, load_quietly
+
+_QUERY = """
+    SELECT start_ts, end_ts, duration_s, max_energy_wh, unoccupied_s, sample_count, device_time_s, is_open
+    FROM fact_session ORDER BY channel_id, start_ts
+"""
+
+def _sessions(db):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(_QUERY).fetchall()
+    finally:
+        conn.close()
+
+def _rebuilt(db):
+    def run(conn):
+        rebuild_sessions(conn.cursor())
+        conn.commit()
+    get_writer().run(run)
+    return _sessions(db)
+
+@pytest.fixture
+def rows_read(monkeypatch):
+    """Số bản ghi fact_measurement mà update_sessions đọc lại từ DB."""
+    counts = []
+    read = pd.read_sql_query
+
+    def counting(*args, **kwargs):
+        df = read(*args, **kwargs)
+        counts.append(len(df))
+        return df
+
+    monkeypatch.setattr(sessions.pd, "read_sql_query", counting)
+    return counts
+
+def _random_feed(n, seed):
+    rng = np.random.default_rng(seed)
+    state = np.repeat(rng.choice([0, 1], n // 25 + 1), 25)[:n]
+    return feed_frame(
+        state=state,
+        energy_wh=np.round(np.cumsum(rng.random(n)), 3),
+        presence=rng.integers(0, 2, n),
+    )
+
+
+@pytest.mark.parametrize("order", [
+    [(0, 500), (500, 501), (501, 1200), (1500, 2000), (1200, 1500), (1190, 1210)],
+    [(0, 40), (40, 41), (41, 42), (42, 2000)],
+    [(1000, 2000), (0, 1000)],
+])
+def test_incremental_loads_match_rebuild(dwh, order):
+    df = _random_feed(2000, seed=len(order))
+    for lo, hi in order:
+        load_quietly(df.iloc[lo:hi])
+    incremental = _sessions(dwh)
+    assert incremental == _rebuilt(dwh)
+    assert incremental[-1][-1] == int(df["State (0/1)"].iloc[-1] == 1)
+
+def test_closed_session_is_not_reread(dwh, rows_read):
+    # 1 phiên ngắn rồi rất nhiều bản ghi state=0: bản ghi mới không được đọc lại cả đoạn tắt
+    n_off = 5000
+    state = np.r_[np.ones(10), np.zeros(n_off)]
+    df = feed_frame(state=state, energy_wh=np.r_[np.arange(1, 11), np.zeros(n_off)])
+    load_quietly(df)
+    before = _sessions(dwh)
+
+    rows_read.clear()
+    load_quietly(feed_frame(state=[1], energy_wh=[3], start=df["created_at"].iloc[-1].tz_localize(None) + pd.Timedelta(seconds=15),
+                            first_entry=len(df) + 1))
+    assert sum(rows_read) < 10
+    after = _sessions(dwh)
+    assert after[:1] == before and len(after) == 2
+    assert after == _rebuilt(dwh)
+
+def test_open_session_is_resumed(dwh):
+    df = feed_frame(state=np.ones(20), energy_wh=np.arange(1, 21))
+    load_quietly(df.iloc[:10])
+    assert _sessions(dwh)[0][-1] == 1
+    load_quietly(df.iloc[10:])
+    (session,) = _sessions(dwh)
+    assert session[5] == 20 and session[3] == 20 and session[-1] == 1
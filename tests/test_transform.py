@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import _dataframe_to_records, prepare_records
+from tests.legacy import records_iterrows
+
+
+def _db_frame(rng, n, tz):
+    """DataFrame đã đổi tên cột theo DB, có NaN ở mọi cột số và NaT ở created_at."""
+    created_at = pd.Series(pd.date_range("2025-03-30 00:00", periods=n, freq="37min", tz=tz))
+    created_at[rng.random(n) < 0.1] = pd.NaT
+
+    def with_nan(values):
+        values = values.astype(float)
+        values[rng.random(n) < 0.15] = np.nan
+        return values
+
+    return pd.DataFrame({
+        "created_at": created_at,
+        "entry_id": with_nan(np.arange(1, n + 1)),
+        "power_w": with_nan(np.round(rng.random(n) * 100, 2)),
+        "energy_wh": with_nan(np.round(rng.random(n) * 1000, 3)),
+        "presence": with_nan(rng.integers(0, 2, n)),
+        "state": with_nan(rng.integers(0, 2, n)),
+        "time_s": with_nan(rng.random(n) * 3600),
+    })
+
+def _typed(rows):
+    # So cả kiểu: int / float / None được SQLite lưu khác nhau
+    return [tuple((type(v), v) for v in row) for row in rows]
+
+@pytest.mark.parametrize("tz", [None, "UTC", "Asia/Ho_Chi_Minh", "Europe/Berlin"])
+def test_columnar_records_match_iterrows(tz):
+    rng = np.random.default_rng(0)
+    df = _db_frame(rng, 500, tz)
+    new = [row[1:8] for row in _dataframe_to_records(df, "101")]
+    assert _typed(new) == _typed(records_iterrows(df))
+
+@pytest.mark.parametrize("tz", [None, "UTC", "Asia/Ho_Chi_Minh"])
+def test_created_ts_is_utc_epoch(tz):
+    df = _db_frame(np.random.default_rng(1), 200, tz)
+    rows = list(_dataframe_to_records(df, "101"))
+    for ts, row in zip(df["created_at"], rows):
+        assert row[0] == "101"
+        assert row[8] == (None if pd.isna(ts) else int(ts.timestamp()))
+
+def test_int_columns_truncate_like_int():
+    df = pd.DataFrame({
+        "created_at": pd.to_datetime(["2025-01-01 00:00:00"] * 3),
+        "entry_id": [1.0, 2.9, -3.7],
+        "state": [1.0, np.inf, np.nan],
+    })
+    rows = list(_dataframe_to_records(df, "101"))
+    assert [r[2] for r in rows] == [1, 2, -3]
+    assert [r[6] for r in rows] == [1, None, None]
+
+def test_prepare_records_renames_csv_columns():
+    df = pd.DataFrame({
+        "created_at": pd.to_datetime(["2025-01-01T00:00:15Z"]),
+        "entry_id": [7],
+        "Power (W)": [12.5],
+        "State (0/1)": [1],
+        "field9": [3.0],
+    })
+    assert prepare_records(df, 101) == [
+        ("101", "2025-01-01 00:00:15", 7, 12.5, None, None, 1, None, 1735689615)
+    ]
+    assert prepare_records(pd.DataFrame({"x": [1]}), "101") is None